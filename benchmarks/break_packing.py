@@ -0,0 +1,44 @@
+"""Regression check for how library songs are packed into what is left of a break.
+
+Runs subset_sum on cases where no mix lands within the tolerance and on
+ordinary ones, and checks the total picked for each. The uneven cases used to
+stack a whole extra song on top of an under-filled break (384 s for a 185 s
+gap) or fill a short gap with a long song (196 s for 44 s).
+
+    python benchmarks/break_packing.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.playlist_packer import subset_sum
+
+# (durations, target, tolerance, expected total)
+CASES = [
+    ([150, 234], 185, 30, 234),
+    ([200, 250, 180], 120, 30, 180),
+    ([196], 44, 30, 0),
+    ([150, 270], 306, 30, 270),
+    ([100, 250, 180], 300, 30, 280),
+    ([100, 90, 50], 200, 20, 190),
+    ([60, 60], 100, 30, 120),
+    ([], 200, 20, 0),
+]
+
+
+def main():
+    failed = 0
+    for durations, target, tolerance, expected in CASES:
+        chosen = subset_sum(durations, target, tolerance)
+        total = sum(durations[i] for i in chosen)
+        ok = total == expected and len(set(chosen)) == len(chosen)
+        failed += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {durations} into {target}s +/- {tolerance}s: "
+              f"{total}s (expected {expected}s)")
+    print(f"{len(CASES) - failed}/{len(CASES)} checks passed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
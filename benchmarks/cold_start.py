@@ -0,0 +1,129 @@
+"""Cold-start regression benchmark: import time, startup steps serial vs parallel, deferred imports.
+
+Each run is a fresh interpreter (python -c), so nothing is warm in sys.modules.
+A run imports main the way startup does and records which heavy modules came
+with it; then it loads the engine's read-only startup steps (automata, library
+index, fingerprints, verdicts, pre-screen model) once one after another and
+once through StartupReport.run_parallel, and finally times the imports startup
+now defers to first use. AIMP is not started - its start is probed separately.
+
+    python benchmarks/cold_start.py --runs 5 --save cold_start_baseline.json
+    python benchmarks/cold_start.py --baseline cold_start_baseline.json
+
+With --baseline the script exits non-zero when import or parallel init time
+grew by more than --tolerance, or when a deferred module is imported eagerly.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Moduły, które start ma ładować dopiero przy pierwszym użyciu
+DEFERRED = {
+    'google.generativeai': "import google.generativeai",
+    'pytubefix': "import pytubefix",
+    'moviepy': "import moviepy.editor",
+    'langdetect': "import langdetect",
+    'ahocorasick': "import ahocorasick",
+    'keyboard': "import keyboard",
+}
+
+RUN = r"""
+import json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter() - started
+eager = [name for name in DEFERRED if name in sys.modules]
+
+from config import *
+from modules.text_analysis import TextAnalyzer
+from modules.library_index import LibraryIndex
+from modules.fingerprint import FingerprintIndex
+from modules.verdict_cache import VerdictCache
+from modules.prescreen import PreScreenClassifier
+from modules.startup import StartupReport
+
+def steps():
+    return {
+        'text_analyzer': lambda: TextAnalyzer().initialize(),
+        'library_index': lambda: LibraryIndex(LIBRARY_INDEX_FILE),
+        'fingerprints': lambda: FingerprintIndex(FINGERPRINT_DIR, min_matches=FINGERPRINT_MIN_MATCHES),
+        'verdict_cache': lambda: VerdictCache(VERDICT_CACHE_FILE),
+        'prescreen': lambda: PreScreenClassifier(model_path=PRESCREEN_MODEL_FILE),
+    }
+
+serial = StartupReport()
+for name, step in steps().items():
+    with serial.step(name):
+        step()
+serial_seconds = serial.finish()
+parallel = StartupReport()
+parallel.run_parallel(steps())
+parallel_seconds = parallel.finish()
+
+deferred = {}
+for name, statement in DEFERRED.items():
+    started = time.perf_counter()
+    try:
+        exec(statement)
+        deferred[name] = time.perf_counter() - started
+    except Exception:
+        deferred[name] = None
+print(json.dumps({'import_seconds': imported, 'eager': eager, 'serial_init_seconds': serial_seconds,
+                  'parallel_init_seconds': parallel_seconds,
+                  'steps': {step['name']: step['seconds'] for step in serial.steps},
+                  'deferred_seconds': deferred}))
+"""
+
+
+def run_once() -> dict:
+    code = f"DEFERRED = {DEFERRED!r}\n{RUN}"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--baseline", help="JSON from an earlier --save to compare against")
+    parser.add_argument("--save", help="write the medians to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    result = {key: statistics.median(run[key] for run in runs)
+              for key in ('import_seconds', 'serial_init_seconds', 'parallel_init_seconds')}
+    result['eager'] = sorted({name for run in runs for name in run['eager']})
+    print(f"import main:          {result['import_seconds']:.3f}s")
+    for name in runs[0]['steps']:
+        print(f"  {name:<20}{statistics.median(run['steps'][name] for run in runs):.3f}s")
+    print(f"init serial:          {result['serial_init_seconds']:.3f}s")
+    print(f"init parallel:        {result['parallel_init_seconds']:.3f}s")
+    print("deferred to first use: " + ", ".join(
+        f"{name} {statistics.median(run['deferred_seconds'][name] for run in runs):.3f}s"
+        if runs[0]['deferred_seconds'][name] is not None else f"{name} n/a" for name in DEFERRED))
+    print(f"imported eagerly:     {', '.join(result['eager']) or 'none'}")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+
+    failed = bool(result['eager'])
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        for key in ('import_seconds', 'parallel_init_seconds'):
+            limit = baseline[key] * (1 + args.tolerance)
+            slower = result[key] > limit
+            failed |= slower
+            print(f"{key}: {result[key]:.3f}s vs baseline {baseline[key]:.3f}s "
+                  f"{'REGRESSION' if slower else 'ok'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""Concurrent admin-panel load against CommandServer, reporting p50/p99 latency per endpoint.
+
+Without --url a local CommandServer is started in-process with a simulated player
+whose IPC takes --ipc-ms per command, so the numbers include command serialization.
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class SimulatedPlayer:
+    def __init__(self, ipc_seconds: float):
+        self.ipc_seconds = ipc_seconds
+        self.playlist = [f"song{i:02d}.mp3" for i in range(15)]
+
+    def handle_command(self, command: str) -> bool:
+        time.sleep(self.ipc_seconds)
+        return command in ("play", "pause", "next", "skip")
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def client(base_url, deadline, command_ratio, latencies, errors, lock):
+    session = requests.Session()
+    while time.perf_counter() < deadline:
+        if random.random() < command_ratio:
+            endpoint = "/command"
+            send = lambda: session.post(base_url + endpoint, json={"ToDO": random.choice(["play", "pause", "next"])})
+        else:
+            endpoint = random.choice(["/status", "/queue"])
+            send = lambda: session.get(base_url + endpoint)
+        started = time.perf_counter()
+        try:
+            ok = send().status_code == 200
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies[endpoint].append(elapsed)
+            if not ok:
+                errors[endpoint] += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", help="existing server, e.g. http://127.0.0.1:5050")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--command-ratio", type=float, default=0.2)
+    parser.add_argument("--ipc-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    base_url = args.url
+    if not base_url:
+        from modules.request_manager import CommandServer
+        server = CommandServer(SimulatedPlayer(args.ipc_ms / 1000), port=args.port)
+        server.start()
+        server.update_status(track={'title': 'warmup', 'duration': '00:03:00'})
+        base_url = f"http://127.0.0.1:{args.port}"
+        time.sleep(0.5)
+
+    latencies, errors, lock = defaultdict(list), defaultdict(int), threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+    threads = [threading.Thread(target=client, args=(base_url, deadline, args.command_ratio,
+                                                     latencies, errors, lock))
+               for _ in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f"{args.clients} clients, {args.seconds:.0f}s, target {base_url}")
+    print(f"{'endpoint':<10} {'requests':>8} {'errors':>6} {'req/s':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for endpoint in sorted(latencies):
+        samples = latencies[endpoint]
+        print(f"{endpoint:<10} {len(samples):>8} {errors[endpoint]:>6} {len(samples) / args.seconds:>7.0f} "
+              f"{percentile(samples, 0.5) * 1000:>8.1f} {percentile(samples, 0.99) * 1000:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
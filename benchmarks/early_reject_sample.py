@@ -0,0 +1,105 @@
+"""Bytes and Gemini audio seconds the partial-audio early reject saves on real rejects.
+
+Takes a sample of songs that were rejected before (blacklist entries or
+'rejected_profanity' verdicts), downloads only their opening segment, transcribes
+it with Gemini and runs the profanity check on it - the same steps the
+progressive mode of PlaylistManager takes. For songs rejected on the opening
+segment the remaining bytes and audio seconds are what the early reject saves.
+
+Needs network access and a configured GEMINI_API_KEY, like the radio itself.
+
+    python benchmarks/early_reject_sample.py --sample 20 --seconds 60
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import BLACKLISTED_SONGS, GEMINI_API_KEY, GEMINI_MODEL, VERDICT_CACHE_FILE
+from modules.gemini import TranscriptAPI
+from modules.text_analysis import TextAnalyzer
+from modules.utils import load_prompts
+from modules.verdict_cache import VerdictCache
+from modules.youtube_downloader import YoutubeDownloader
+
+
+def rejected_video_ids():
+    """Video ids of earlier rejects from the blacklist and the verdict cache."""
+    video_ids = set()
+    if os.path.exists(BLACKLISTED_SONGS):
+        with open(BLACKLISTED_SONGS, 'r', encoding='utf-8') as f:
+            video_ids.update(os.path.splitext(line.strip())[0] for line in f if line.strip())
+    for video_id, entry in VerdictCache(VERDICT_CACHE_FILE).entries().items():
+        if entry['outcome'] == 'rejected_profanity':
+            video_ids.add(video_id)
+    return sorted(video_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sample", type=int, default=20, help="number of rejected songs to try")
+    parser.add_argument("--seconds", type=float, default=60, help="length of the opening segment")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    video_ids = rejected_video_ids()
+    random.Random(args.seed).shuffle(video_ids)
+    sample = video_ids[:args.sample]
+    if not sample:
+        print("No rejected songs found in the blacklist or verdict cache")
+        return
+
+    _, prompt_transcript = load_prompts()
+    transcript_api = TranscriptAPI(api_key=GEMINI_API_KEY, model=GEMINI_MODEL, prompt=prompt_transcript)
+    text_analyzer = TextAnalyzer()
+    text_analyzer.initialize()
+    downloader = YoutubeDownloader()
+
+    tried = early = 0
+    total_bytes = saved_bytes = total_seconds = saved_seconds = 0.0
+    print(f"{'video_id':<12} {'MiB':>6} {'prefix':>7} {'length':>7}  result")
+    for video_id in sample:
+        url = f"https://www.youtube.com/watch?v={video_id}"
+        result = downloader.download_song(url, prefix_seconds=args.seconds)
+        if not result:
+            print(f"{video_id:<12} download failed")
+            continue
+        path, is_cached = result
+        partial = downloader.discard_partial(path)
+        if is_cached or not partial:
+            print(f"{video_id:<12} skipped (cached or too short for a partial download)")
+            if not is_cached and os.path.exists(path):
+                os.remove(path)
+            continue
+
+        clip_path = downloader.clip(path, 0, args.seconds)
+        lyrics = transcript_api.analyze_audio(clip_path) if clip_path else None
+        rejected = bool(lyrics) and not text_analyzer.analyze_text(lyrics)['is_acceptable']
+        for temp in (clip_path, path):
+            if temp and os.path.exists(temp):
+                os.remove(temp)
+
+        tried += 1
+        total_bytes += partial['size']
+        total_seconds += partial['duration']
+        if rejected:
+            early += 1
+            saved_bytes += partial['size'] - partial['prefix_bytes']
+            saved_seconds += max(0.0, partial['duration'] - partial['prefix_seconds'])
+        print(f"{video_id:<12} {partial['size'] / 1024 ** 2:6.1f} {partial['prefix_bytes'] / 1024 ** 2:7.2f} "
+              f"{partial['duration']:6.0f}s  {'early reject' if rejected else 'needs full track'}")
+
+    if not tried:
+        return
+    print("-" * 60)
+    print(f"early rejects: {early}/{tried} ({early / tried:.0%})")
+    print(f"bytes saved: {saved_bytes / 1024 ** 2:.1f} of {total_bytes / 1024 ** 2:.1f} MiB "
+          f"({saved_bytes / total_bytes:.0%})")
+    print(f"Gemini audio seconds saved: {saved_seconds:.0f} of {total_seconds:.0f} s "
+          f"({saved_seconds / total_seconds:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""Peak memory of a 50-song playlist update under the audio budget, measured with tracemalloc.
+
+The update runs the real PlaylistManager, YoutubeDownloader, DownloadManager,
+AudioBudget and TranscriptAPI audio handling. Only the network ends are local:
+songs are random files served with range requests from a local HTTP server,
+YouTube metadata is a stub stream pointing at it, and the Gemini File API and
+model calls are offline fakes that read what they are given (the upload in
+chunks, as the SDK streams it) and sleep for --gemini-ms. Gemini is slower
+than the local downloads, so prefetching runs into the budget and has to wait.
+
+    python benchmarks/memory_budget.py --songs 50 --budget-mb 48
+    python benchmarks/memory_budget.py --inline   # every song inline, as before the File API - fails
+
+Modules the update imports lazily are imported up front, so tracing covers the
+update itself and not import allocations. Audio in flight is meant to live on
+disk, so the traced peak may only be a small share of the budget: by default
+--max-peak-mb is budget / 6 (8 MiB for 48), which the download and upload
+chunk buffers fit in and holding whole songs in memory, as inline mode does,
+does not.
+
+The script exits non-zero when the traced peak exceeds that limit, when audio
+in flight exceeded the budget by more than one song (the song the update is
+waiting for is always admitted), or when a song was not queued.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.audio_budget import AudioBudget
+from modules.download_manager import DownloadManager
+from modules.gemini import TranscriptAPI
+from modules.metrics import AUDIO_BUDGET_WAITS
+from modules.playlist_manager import PlaylistManager
+from modules.update_journal import UpdateJournal
+from modules.youtube_downloader import YoutubeDownloader
+from pytubefix import extract  # noqa: F401 - imported lazily by the update, kept out of the trace
+
+MiB = 1024 ** 2
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves files of the origin folder by video_id, honouring Range like googlevideo does."""
+    origin = None
+
+    def do_GET(self):
+        path = os.path.join(self.origin, self.path.strip('/'))
+        size = os.path.getsize(path)
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get('Range', ''))
+        start = int(match.group(1)) if match else 0
+        end = int(match.group(2)) if match and match.group(2) else size - 1
+        self.send_response(206 if match else 200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        with open(path, 'rb') as f:
+            f.seek(start)
+            left = end - start + 1
+            while left:
+                chunk = f.read(min(left, 64 * 1024))
+                self.wfile.write(chunk)
+                left -= len(chunk)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalDownloader(YoutubeDownloader):
+    """The real downloader, with YouTube metadata pointing at the local server."""
+
+    def __init__(self, base_url, sizes, durations, temp_folder, audio_folder, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+        self.sizes = sizes
+        self.durations = durations
+        self.download_path = temp_folder
+        self.cache_path = audio_folder
+
+    def _video(self, url, video_id):
+        stream = types.SimpleNamespace(url=f"{self.base_url}/{video_id}", filesize=self.sizes[video_id],
+                                       mime_type="audio/webm")
+        streams = types.SimpleNamespace(filter=lambda mime_type: types.SimpleNamespace(
+            first=lambda: stream if mime_type == "audio/webm" else None))
+        return types.SimpleNamespace(length=self.durations[video_id], streams=streams, captions=[])
+
+
+def offline_genai():
+    """File API stand-in: upload_file reads the file in chunks like the SDK's resumable upload."""
+    module = types.ModuleType("google.generativeai")
+
+    def upload_file(path, mime_type=None):
+        with open(path, 'rb') as f:
+            while f.read(MiB):
+                pass
+        return types.SimpleNamespace(name=f"files/{os.path.basename(path)}",
+                                     state=types.SimpleNamespace(name="ACTIVE"))
+
+    module.upload_file = upload_file
+    module.get_file = lambda name: types.SimpleNamespace(name=name, state=types.SimpleNamespace(name="ACTIVE"))
+    module.delete_file = lambda name: None
+    return module
+
+
+class OfflineTranscriptAPI(TranscriptAPI):
+    def __init__(self, latency, **kwargs):
+        super().__init__(api_key="", model="offline", prompt="", **kwargs)
+        self._model_instance = object()
+        self.latency = latency
+        self.calls = 0
+
+    def _generate_response(self, audio_part):
+        self.calls += 1
+        time.sleep(self.latency)
+        return types.SimpleNamespace(text="la la la " * 40)
+
+
+class AcceptAll:
+    def analyze_text(self, text):
+        return {'is_acceptable': True, 'profanity_result': None}
+
+    def analyze_sentiment(self, text):
+        return {'is_safe_for_radio': True, 'confidence': 0.9}
+
+
+class Player:
+    def __init__(self):
+        self.playlist = []
+
+    def prepare_for_update(self):
+        self.playlist = []
+
+    def add_song_to_playlist(self, path):
+        self.playlist.append(path)
+
+
+class Votes:
+    def __init__(self, songs):
+        self.songs = songs
+
+    def fetch_songs_from_backend(self):
+        return list(self.songs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--songs", type=int, default=50)
+    parser.add_argument("--min-mb", type=float, default=3.0)
+    parser.add_argument("--max-mb", type=float, default=12.0)
+    parser.add_argument("--budget-mb", type=float, default=48.0, help="audio in flight cap")
+    parser.add_argument("--max-peak-mb", type=float, help="allowed tracemalloc peak (default: budget / 6)")
+    parser.add_argument("--gemini-ms", type=float, default=40.0)
+    parser.add_argument("--inline", action="store_true", help="send every song inline (no File API)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.max_peak_mb is None:
+        args.max_peak_mb = args.budget_mb / 6
+    rng = random.Random(args.seed)
+    sys.modules['google.generativeai'] = offline_genai()
+
+    with tempfile.TemporaryDirectory(prefix="radio_memory_") as root:
+        folders = {name: os.path.join(root, name) for name in ('origin', 'audio', 'temp')}
+        for folder in folders.values():
+            os.makedirs(folder)
+        sizes, durations, votes = {}, {}, []
+        for i in range(args.songs):
+            video_id = f"memBudget{i:02d}"
+            sizes[video_id] = int(rng.uniform(args.min_mb, args.max_mb) * MiB)
+            durations[video_id] = sizes[video_id] // 16000
+            with open(os.path.join(folders['origin'], video_id), 'wb') as f:
+                for _ in range(0, sizes[video_id], MiB):
+                    f.write(os.urandom(MiB))
+                f.truncate(sizes[video_id])
+            votes.append({'url': f"https://www.youtube.com/watch?v={video_id}",
+                          'duration': time.strftime('%H:%M:%S', time.gmtime(durations[video_id]))})
+
+        RangeHandler.origin = folders['origin']
+        server = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        budget = AudioBudget(int(args.budget_mb * MiB))
+        downloader = LocalDownloader(f"http://127.0.0.1:{server.server_port}", sizes, durations,
+                                     folders['temp'], folders['audio'], audio_budget=budget,
+                                     download_manager=DownloadManager(max_concurrent=3, chunk_size=MiB))
+        transcript_api = OfflineTranscriptAPI(args.gemini_ms / 1000,
+                                              inline_max_bytes=2 ** 62 if args.inline else 4 * MiB)
+        player = Player()
+        manager = PlaylistManager(
+            player, downloader, AcceptAll(), transcript_api, AcceptAll(), Votes(votes),
+            audio_folder=folders['audio'],
+            temp_folder=folders['temp'],
+            played_songs_file=os.path.join(root, 'played.txt'),
+            blacklist_file=os.path.join(root, 'blacklist.txt'),
+            trace_dir=None,
+            journal=UpdateJournal(os.path.join(root, 'journal.jsonl')),
+            time_source=lambda: datetime.combine(datetime.now().date(), datetime.min.time()).replace(second=1),
+            start_times=["00:00"],
+            stop_times=["23:59"],
+            audio_budget=budget
+        )
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        manager.update_playlist()
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        server.shutdown()
+
+    stats = budget.stats()
+    total = sum(sizes.values())
+    print(f"songs queued:        {len(player.playlist)}/{args.songs} in {elapsed:.1f}s "
+          f"({total / MiB:.0f} MiB of audio, {transcript_api.calls} transcriptions)")
+    print(f"audio in flight:     peak {stats['peak_bytes'] / MiB:.1f} MiB of {args.budget_mb:.0f} MiB budget, "
+          f"{AUDIO_BUDGET_WAITS.value} downloads waited, {stats['in_flight_bytes']} bytes left reserved")
+    print(f"traced memory peak:  {peak / MiB:.1f} MiB (limit {args.max_peak_mb:.1f} MiB)"
+          + (" - inline mode" if args.inline else ""))
+
+    failed = False
+    if peak > args.max_peak_mb * MiB:
+        print("FAIL traced peak over the limit")
+        failed = True
+    if stats['peak_bytes'] > budget.max_bytes + args.max_mb * MiB:
+        print("FAIL audio in flight over the budget by more than one song")
+        failed = True
+    if len(player.playlist) != args.songs:
+        print("FAIL not every song was queued")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
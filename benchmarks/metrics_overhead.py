@@ -0,0 +1,42 @@
+"""Per-sample overhead of the metrics hooks; exits non-zero if any exceeds the 1 us budget."""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.metrics import Counter, Histogram
+
+BUDGET_NS = 1000
+NUMBER = 200_000
+
+
+def per_call_ns(statement, setup_globals) -> float:
+    # Best of several repeats, minus the cost of an empty loop body
+    timer = timeit.Timer(statement, globals=setup_globals)
+    baseline = timeit.Timer("pass")
+    best = min(timer.repeat(repeat=5, number=NUMBER))
+    empty = min(baseline.repeat(repeat=5, number=NUMBER))
+    return (best - empty) / NUMBER * 1e9
+
+
+def main() -> int:
+    histogram = Histogram("bench_seconds", "benchmark histogram")
+    counter = Counter("bench_total", "benchmark counter")
+    cases = {
+        "Histogram.observe": ("histogram.observe(0.37)", {"histogram": histogram}),
+        "Counter.inc": ("counter.inc()", {"counter": counter}),
+        "with Histogram.time()": ("with histogram.time(): pass", {"histogram": histogram}),
+    }
+
+    failed = False
+    for name, (statement, scope) in cases.items():
+        ns = per_call_ns(statement, scope)
+        status = "ok" if ns < BUDGET_NS else "OVER BUDGET"
+        failed |= ns >= BUDGET_NS
+        print(f"{name:<24} {ns:8.0f} ns/sample  {status}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
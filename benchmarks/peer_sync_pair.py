@@ -0,0 +1,187 @@
+"""Two peer-sync nodes on local ports, and a check of what one learns from the other.
+
+Each node gets its own temporary library, verdict cache and blacklist and
+serves on its own port. Node A vets a song, blacklists another and adds a
+library file; after a sync round node B must have the verdict and the
+blacklist line, and queue the voted song from A's copy with no YouTube
+download and no Gemini call. The script also checks that a second round only
+transfers new changes (the cursor), that a conflicting verdict resolves to the
+later one on both nodes, and that a corrupted transfer is refused.
+
+    python benchmarks/peer_sync_pair.py --ports 5061 5062
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.library_cache import LibraryCache
+from modules.library_index import LibraryIndex
+from modules.peer_sync import PeerSync
+from modules.playlist_manager import PlaylistManager
+from modules.tracing import SongTrace
+from modules.verdict_cache import VerdictCache
+
+ACCEPTED_ID = "peerSync001"
+REJECTED_ID = "peerSync002"
+
+
+class CountingDownloader:
+    """Node B's downloader; any download here means the song was not taken from the peer."""
+
+    def __init__(self, library_folder):
+        self.library_folder = library_folder
+        self.downloads = 0
+
+    def cached_path(self, video_id):
+        for name in os.listdir(self.library_folder):
+            if name.startswith(video_id):
+                return os.path.join(self.library_folder, name)
+        return None
+
+    def download_song(self, url, prefix_seconds=None):
+        self.downloads += 1
+        return None
+
+    def prefetch(self, urls, prefix_seconds=None):
+        pass
+
+
+class CountingGemini:
+    def __init__(self):
+        self.calls = 0
+
+    def analyze_audio(self, audio_path):
+        self.calls += 1
+
+    def analyze_sentiment(self, text):
+        self.calls += 1
+
+
+class Player:
+    def __init__(self):
+        self.playlist = []
+
+    def add_song_to_playlist(self, path):
+        self.playlist.append(path)
+
+
+def node(name, port, peer_port, root):
+    folder = os.path.join(root, name)
+    for sub in ('audio', 'temp'):
+        os.makedirs(os.path.join(folder, sub))
+    library = LibraryCache(os.path.join(folder, 'audio'), LibraryIndex(os.path.join(folder, 'library.json')),
+                           budget_bytes=1024 ** 3)
+    sync = PeerSync(name, VerdictCache(os.path.join(folder, 'verdicts.json')), library,
+                    blacklist_file=os.path.join(folder, 'blacklist.txt'),
+                    temp_folder=os.path.join(folder, 'temp'),
+                    peers=[f"http://127.0.0.1:{peer_port}"], port=port, interval=3600,
+                    log_path=os.path.join(folder, 'sync_log.jsonl'),
+                    state_path=os.path.join(folder, 'sync_state.json'))
+    return sync
+
+
+def check(label, ok, detail=""):
+    print(f"{'ok  ' if ok else 'FAIL'} {label}" + (f" ({detail})" if detail else ""))
+    return bool(ok)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ports", type=int, nargs=2, default=[5061, 5062])
+    parser.add_argument("--size-mb", type=float, default=4.0)
+    args = parser.parse_args()
+    port_a, port_b = args.ports
+    results = []
+
+    with tempfile.TemporaryDirectory() as root:
+        a = node('node-a', port_a, port_b, root)
+        b = node('node-b', port_b, port_a, root)
+        a.start()
+        b.start()
+        time.sleep(0.2)
+
+        # A weryfikuje piosenkę i dodaje ją do biblioteki, drugą odrzuca: dwa werdykty, plik i blacklista
+        song_path = os.path.join(a.library_cache.folder, f"{ACCEPTED_ID}.webm")
+        with open(song_path, 'wb') as f:
+            f.write(os.urandom(int(args.size_mb * 1024 ** 2)))
+        a.verdict_cache.record(ACCEPTED_ID, 'accepted', confidence=0.97, transcript="la la la")
+        a.library_cache.add(song_path)
+        a.verdict_cache.record(REJECTED_ID, 'rejected_sentiment', confidence=0.9)
+        with open(a.blacklist_file, 'a', encoding='utf-8') as f:
+            f.write(f"{REJECTED_ID}.webm\n")
+
+        a.sync_now()
+        started = time.perf_counter()
+        applied = b.sync_now()
+        results.append(check("B applies A's changes", applied == 4 and b.status()['cursors'],
+                             f"{applied} changes in {(time.perf_counter() - started) * 1000:.0f} ms, "
+                             f"cursor {b.status()['cursors']}"))
+        results.append(check("verdict synced", (b.verdict_cache.get(ACCEPTED_ID) or {}).get('accepted') is True))
+        with open(b.blacklist_file, 'r', encoding='utf-8') as f:
+            results.append(check("blacklist synced", f"{REJECTED_ID}.webm" in f.read().split()))
+        results.append(check("second round is a delta", b.sync_now() == 0, f"A head {a.head}"))
+
+        # B dostaje głos na piosenkę zaakceptowaną przez A
+        downloader, gemini, player = CountingDownloader(b.library_cache.folder), CountingGemini(), Player()
+        manager = PlaylistManager(
+            player, downloader, None, gemini, gemini, None,
+            audio_folder=b.library_cache.folder,
+            temp_folder=b.temp_folder,
+            played_songs_file=os.path.join(root, 'node-b', 'played.txt'),
+            blacklist_file=b.blacklist_file,
+            trace_dir=None,
+            library_cache=b.library_cache,
+            verdict_cache=b.verdict_cache,
+            peer_sync=b
+        )
+        trace = SongTrace(f"https://www.youtube.com/watch?v={ACCEPTED_ID}")
+        started = time.perf_counter()
+        queued = manager._process_song(trace.url, trace)
+        elapsed = time.perf_counter() - started
+        results.append(check("voted song queued from A's copy",
+                             queued and trace.outcome == 'peer' and len(player.playlist) == 1,
+                             f"{args.size_mb:.0f} MiB in {elapsed * 1000:.0f} ms"))
+        results.append(check("no download, no Gemini", downloader.downloads == 0 and gemini.calls == 0,
+                             f"downloads {downloader.downloads}, Gemini calls {gemini.calls}"))
+        rejected = manager._process_song(f"https://www.youtube.com/watch?v={REJECTED_ID}", SongTrace(""))
+        results.append(check("blacklisted song skipped", rejected is False and downloader.downloads == 0))
+
+        # B ogłasza własną kopię, A nie pobiera jej z powrotem
+        b.sync_now()
+        a.sync_now()
+        results.append(check("A ignores its own changes echoed back", a.accepted_file(ACCEPTED_ID) is None))
+
+        # Konflikt: późniejszy werdykt wygrywa na obu węzłach
+        a.verdict_cache.record("peerSync003", 'accepted')
+        time.sleep(0.01)
+        b.verdict_cache.record("peerSync003", 'rejected_profanity')
+        a.sync_now(), b.sync_now(), a.sync_now()
+        outcomes = (a.verdict_cache.get("peerSync003")['outcome'], b.verdict_cache.get("peerSync003")['outcome'])
+        results.append(check("conflict resolved to the later verdict", outcomes == ('rejected_profanity',) * 2,
+                             f"A {outcomes[0]}, B {outcomes[1]}"))
+
+        # Uszkodzony transfer nie trafia do biblioteki
+        corrupt_path = os.path.join(a.library_cache.folder, "peerSync004.webm")
+        with open(corrupt_path, 'wb') as f:
+            f.write(b'original')
+        a.verdict_cache.record("peerSync004", 'accepted')
+        a.library_cache.add(corrupt_path)
+        a.sync_now(), b.sync_now()
+        with open(corrupt_path, 'wb') as f:
+            f.write(b'tampered')
+        results.append(check("hash mismatch refused", b.fetch("peerSync004") is None
+                             and not os.path.exists(os.path.join(b.library_cache.folder, "peerSync004.webm"))))
+
+        a.stop()
+        b.stop()
+
+    print(f"{sum(results)}/{len(results)} checks passed")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
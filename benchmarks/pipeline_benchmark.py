@@ -0,0 +1,91 @@
+"""Wall-clock cost of the vetting pipeline over a simulated school day, per logging mode.
+
+The day runs in virtual time with fake services (modules.simulation), so the
+measured wall time is the pipeline's own CPU and I/O cost, logging included.
+
+Modes:
+  off    - root logger at WARNING, nothing emitted (baseline)
+  sync   - the previous setup: FileHandler + StreamHandler on the root logger
+  queue  - logging_config.setup_logging(): QueueHandler + background listener
+"""
+import argparse
+import atexit
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.simulation import DaySimulator
+from logging_config import LOG_FORMAT, setup_logging
+
+
+class _CountingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+def configure(mode: str, log_dir: str, console):
+    """Configure root logging for a mode; returns a stop callback."""
+    if mode == "off":
+        logging.basicConfig(level=logging.WARNING, handlers=[logging.NullHandler()], force=True)
+        return lambda: None
+    if mode == "sync":
+        formatter = logging.Formatter(LOG_FORMAT)
+        handlers = [logging.FileHandler(os.path.join(log_dir, "sync.log"), encoding='utf-8'),
+                    logging.StreamHandler(console)]
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        logging.basicConfig(level=logging.INFO, handlers=handlers, force=True)
+        return lambda: [handler.close() for handler in handlers]
+    listener = setup_logging(log_dir=log_dir)
+    atexit.unregister(listener.stop)
+    for handler in listener.handlers:
+        if isinstance(handler, logging.StreamHandler) and not isinstance(handler, logging.FileHandler):
+            handler.setStream(console)
+    return listener.stop
+
+
+def run_day(seed: int) -> float:
+    started = time.perf_counter()
+    DaySimulator(seed=seed).run()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--console", action="store_true", help="stream handler writes to the real stderr")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as log_dir:
+        console = sys.stderr if args.console else open(os.path.join(log_dir, "console.log"), 'w', encoding='utf-8')
+        for mode in ("off", "sync", "queue"):
+            stop = configure(mode, log_dir, console)
+            counter = _CountingHandler()
+            logging.getLogger().addHandler(counter)
+            timings = [run_day(seed) for seed in range(args.days)]
+            stop()
+            logging.getLogger().removeHandler(counter)
+            results[mode] = (min(timings), counter.count / args.days)
+        if console is not sys.stderr:
+            console.close()
+        logging.basicConfig(level=logging.WARNING, handlers=[logging.NullHandler()], force=True)
+
+    baseline = results["off"][0]
+    print(f"{'mode':<6} {'day [ms]':>9} {'records/day':>12} {'overhead [ms]':>14} {'per record [us]':>16}")
+    for mode, (seconds, records) in results.items():
+        overhead = seconds - baseline
+        per_record = overhead / records * 1e6 if records else 0.0
+        print(f"{mode:<6} {seconds * 1000:>9.1f} {records:>12.0f} {overhead * 1000:>14.1f} {per_record:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
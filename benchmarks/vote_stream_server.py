@@ -0,0 +1,212 @@
+"""Stand-in voting backend with a vote stream, and a check of the RequestManager subscription against it.
+
+The stand-in serves /voting/songs-to-play and a server-sent events stream at
+/voting/stream (event ids, keepalive comments, replay after Last-Event-ID) and
+takes votes at POST /voting/vote. Admin endpoints drop all open streams
+(/stand-in/drop) or switch the stream endpoint off to a 404 (/stand-in/stream).
+
+Without --serve the script starts it in-process, subscribes a RequestManager
+and reports the vote-to-delivery latency, the reconnect after dropped streams
+(no votes lost) and the polling fallback when the backend has no stream.
+
+    python benchmarks/vote_stream_server.py --votes 50
+    python benchmarks/vote_stream_server.py --serve --port 5000
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+import requests
+from flask import Flask, Response, jsonify, request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.request_manager import RequestManager, _QuietRequestHandler, _ThreadingWSGIServer
+from wsgiref.simple_server import make_server
+
+
+class StandInBackend:
+    def __init__(self, songs_file=None, keepalive=15.0):
+        self.keepalive = keepalive
+        self.votes = []  # (event id, song)
+        self.stream_enabled = True
+        self.generation = 0
+        self.condition = threading.Condition()
+        if songs_file:
+            with open(songs_file, 'r', encoding='utf-8') as f:
+                for song in json.loads('[' + f.read().replace("'", '"') + ']'):
+                    self.vote(song)
+        self.app = self._create_app()
+
+    def vote(self, song):
+        with self.condition:
+            self.votes.append((len(self.votes) + 1, song))
+            self.condition.notify_all()
+
+    def drop_streams(self):
+        with self.condition:
+            self.generation += 1
+            self.condition.notify_all()
+
+    def _events(self, last_id):
+        with self.condition:
+            generation = self.generation
+        while True:
+            with self.condition:
+                if self.generation != generation:
+                    return
+                pending = self.votes[last_id:]
+                if not pending:
+                    self.condition.wait(self.keepalive)
+                    pending = self.votes[last_id:]
+                    if self.generation != generation:
+                        return
+            if not pending:
+                yield ": keepalive\n\n"
+            for event_id, song in pending:
+                last_id = event_id
+                yield f"id: {event_id}\ndata: {json.dumps(song)}\n\n"
+
+    def _create_app(self):
+        app = Flask(__name__)
+
+        @app.route('/voting/songs-to-play', methods=['GET'])
+        def songs_to_play():
+            with self.condition:
+                return jsonify([song for _, song in self.votes])
+
+        @app.route('/voting/stream', methods=['GET'])
+        def stream():
+            if not self.stream_enabled:
+                return jsonify({"error": "Not found"}), 404
+            last_id = int(request.headers.get('Last-Event-ID') or 0)
+            return Response(self._events(last_id), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache'})
+
+        @app.route('/voting/vote', methods=['POST'])
+        def post_vote():
+            song = request.get_json()
+            if not song or 'url' not in song:
+                return jsonify({"error": "url is required"}), 400
+            self.vote(song)
+            return jsonify({"status": "ok"})
+
+        @app.route('/stand-in/drop', methods=['POST'])
+        def drop():
+            self.drop_streams()
+            return jsonify({"status": "ok"})
+
+        @app.route('/stand-in/stream', methods=['POST'])
+        def toggle_stream():
+            self.stream_enabled = bool((request.get_json() or {}).get('enabled'))
+            if not self.stream_enabled:
+                self.drop_streams()
+            return jsonify({"stream_enabled": self.stream_enabled})
+
+        return app
+
+    def serve(self, port):
+        server = make_server("127.0.0.1", port, self.app, server_class=_ThreadingWSGIServer,
+                             handler_class=_QuietRequestHandler)
+        threading.Thread(target=server.serve_forever, daemon=True, name="StandInBackend").start()
+        return server
+
+
+def song(i):
+    return {'url': f"https://www.youtube.com/watch?v=standin{i:04d}", 'duration': '00:03:30'}
+
+
+def wait_for(received, urls, timeout):
+    """Collect deliveries until all urls arrived; returns {url: arrival time}."""
+    arrived = {}
+    deadline = time.perf_counter() + timeout
+    while set(urls) - set(arrived) and time.perf_counter() < deadline:
+        try:
+            url, at = received.get(timeout=max(0.0, deadline - time.perf_counter()))
+        except queue.Empty:
+            break
+        arrived[url] = at
+    return arrived
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--serve", action="store_true", help="only run the stand-in backend")
+    parser.add_argument("--port", type=int, default=5098)
+    parser.add_argument("--songs", help="seed votes from a file like request_sample.txt")
+    parser.add_argument("--votes", type=int, default=50)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    backend = StandInBackend(args.songs, keepalive=15.0 if args.serve else 1.0)
+    server = backend.serve(args.port)
+    base_url = f"http://127.0.0.1:{args.port}"
+    if args.serve:
+        print(f"Stand-in voting backend on {base_url}, Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            server.shutdown()
+        return
+
+    received = queue.Queue()
+    request_manager = RequestManager(base_url, "")
+    subscription = request_manager.subscribe(
+        lambda songs: [received.put((s['url'], time.perf_counter())) for s in songs],
+        poll_interval=args.poll_interval, backoff_min=0.2, backoff_max=2.0, read_timeout=5.0, stream_retry=3.0)
+    deadline = time.perf_counter() + 5
+    while not subscription.connected and time.perf_counter() < deadline:
+        time.sleep(0.05)
+
+    # 1. Opóźnienie od głosu do dostarczenia
+    latencies = []
+    for i in range(args.votes):
+        sent = time.perf_counter()
+        requests.post(f"{base_url}/voting/vote", json=song(i))
+        arrived = wait_for(received, [song(i)['url']], timeout=5)
+        if song(i)['url'] in arrived:
+            latencies.append(arrived[song(i)['url']] - sent)
+    latencies.sort()
+    print(f"stream: {len(latencies)}/{args.votes} votes delivered, "
+          f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms"
+          if latencies else "stream: no votes delivered")
+
+    # 2. Zerwane połączenie: głosy oddane w trakcie przerwy muszą dotrzeć po ponownym połączeniu
+    reconnects = 0
+    missing = 0
+    for round_number in range(3):
+        requests.post(f"{base_url}/stand-in/drop")
+        urls = [song(1000 + round_number * 10 + i)['url'] for i in range(5)]
+        for url in urls:
+            requests.post(f"{base_url}/voting/vote", json={'url': url, 'duration': '00:03:30'})
+        missing += len(set(urls) - set(wait_for(received, urls, timeout=10)))
+        reconnects += 1
+    print(f"reconnect: {reconnects} dropped streams, {missing} votes lost, last event id {subscription.last_event_id}")
+
+    # 3. Backend bez strumienia: głosy przychodzą z odpytywania
+    requests.post(f"{base_url}/stand-in/stream", json={'enabled': False})
+    time.sleep(0.5)
+    sent = time.perf_counter()
+    requests.post(f"{base_url}/voting/vote", json=song(2000))
+    arrived = wait_for(received, [song(2000)['url']], timeout=args.poll_interval * 5)
+    print(f"fallback: mode {subscription.mode}, vote delivered "
+          + (f"after {arrived[song(2000)['url']] - sent:.2f}s" if arrived else "never"))
+
+    # 4. Strumień wraca: subskrypcja przełącza się z powrotem
+    requests.post(f"{base_url}/stand-in/stream", json={'enabled': True})
+    deadline = time.perf_counter() + 10
+    while not subscription.connected and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    print(f"recovery: mode {subscription.mode}, connected {subscription.connected}")
+
+    request_manager.stop_subscription()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
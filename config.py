@@ -1,13 +1,28 @@
 import os
+import socket
 
 # API Keys
 GEMINI_API_KEY = "."
 GEMINI_MODEL = "gemini-1.5-flash"
+GEMINI_INLINE_MAX_BYTES = 4 * 1024 * 1024  # larger audio goes through the File API instead of inline in the request
 
 # URLs
 URL_BACKEND = "http://127.0.0.1:5000"
 URL_ADMINPAGE = "http://your_admin_url"
 
+# Vote stream
+VOTE_STREAM_ENABLED = True  # learn about votes as they are cast instead of only at update time
+VOTE_POLL_INTERVAL_SECONDS = 60  # when the backend has no stream endpoint
+VOTE_STREAM_BACKOFF_MAX_SECONDS = 60
+VOTE_STREAM_READ_TIMEOUT_SECONDS = 75  # longer than the backend's keepalive interval
+
+# Peer sync - verdicts, blacklist and library files shared with the other buildings' nodes
+PEER_SYNC_ENABLED = False
+PEER_SYNC_NODE_ID = socket.gethostname()
+PEER_SYNC_PORT = 5060
+PEER_SYNC_PEERS = []  # e.g. ["http://10.0.2.15:5060"]
+PEER_SYNC_INTERVAL_SECONDS = 60
+
 # File Paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 AUDIO_FOLDER_PATH = os.path.join(BASE_DIR, "audio")
@@ -17,14 +32,98 @@ PLAYED_SONGS_FILE = os.path.join(BASE_DIR, "played_songs.txt")
 BLACKLISTED_SONGS = os.path.join(BASE_DIR, "blacklisted_songs.txt")
 PROMPT_SENTIMENT = os.path.join(BASE_DIR, "prompts", "sentiment_prompt.txt")
 PROMPT_TRANSCRIPTION = os.path.join(BASE_DIR, "prompts", "transcription_prompt.txt")
+TRACE_DIR = os.path.join(BASE_DIR, "logs")
+PROFILE_DIR = os.path.join(BASE_DIR, "logs", "profiles")
 
 # Audio Device Settings
 AUDIO_DEVICE_NAME = "HDTV" # korytarz "Miks Stereo"
 MAIN_AUDIO_DEVICE_NAME = "HDTV" # Świetlica
 AIMP_VOLUME_INCREMENT = 750
 AIMP_MAX_VOLUME = 65535
+AIMP_PROCESS_NAME = "AIMP.exe"
+AIMP_REMOTE_WINDOW_CLASS = "AIMP2_RemoteInfo"  # hidden window every AIMP instance answers IPC on
+AIMP_START_TIMEOUT_SECONDS = 15
+AIMP_QUIT_TIMEOUT_SECONDS = 5
+AIMP_READY_POLL_SECONDS = 0.05  # first readiness probe interval, backing off to the max
+AIMP_READY_POLL_MAX_SECONDS = 0.5
+AIMP_SUPERVISOR_INTERVAL_SECONDS = 2.0
+AIMP_HANG_TIMEOUT_SECONDS = 5.0  # a probe unanswered this long means the player hung
+AIMP_RECONNECT_TIMEOUT_SECONDS = 2.0
+AIMP_RESTART_AFTER_FAILURES = 3  # failed reconnect rounds before the player is restarted
+
+# Profiling sessions started through the command server (/profile)
+PROFILE_SAMPLE_INTERVAL_SECONDS = 0.01
+PROFILE_MAX_SECONDS = 900  # longest window, so a forgotten session ends on its own
+PROFILE_TOP = 25  # entries in the summary and in the tracemalloc report
+PROFILE_TRACEMALLOC_FRAMES = 10
+
+# Zones - each with its own player, schedule and playlist, sharing downloads, verdicts and the library.
+# Missing keys fall back to the global settings; files of zones after the first get a _<name> suffix.
+ZONES = [
+    {'name': 'main', 'device': MAIN_AUDIO_DEVICE_NAME, 'command_port': 5050},
+    # Korytarz - każda strefa potrzebuje własnej instancji AIMP (osobny AIMP.exe); przy kilku
+    # strefach klient łączy się z oknem procesu swojej strefy, a nie z pierwszym znalezionym
+    # {'name': 'corridor', 'device': AUDIO_DEVICE_NAME, 'command_port': 5051,
+    #  'player_command': r"C:\AIMP-corridor\AIMP.exe",
+    #  'playlist_path': r"C:\AIMP-corridor\Profile\PLS"},
+]
 
 # Schedule Times
 PLAYLIST_UPDATE_TIMES = ["07:45","08:40", "09:35", "10:30", "11:25", "12:25", "13:20", "14:15","15:10"]
 DEVICE_START_TIMES = ["07:50","08:45", "09:40", "10:35", "11:30", "12:30", "13:25", "14:20","15:15"]
-DEVICE_STOP_TIMES = ["08:00", "08:55", "09:50", "10:45", "11:45", "12:40", "13:35", "14:30","15:25"]
\ No newline at end of file
+DEVICE_STOP_TIMES = ["08:00", "08:55", "09:50", "10:45", "11:45", "12:40", "13:35", "14:30","15:25"]
+PLAYLIST_FILL_TOLERANCE_SECONDS = 30  # how far the queued music may end from the end of a break
+CARRY_OVER_FILE = os.path.join(BASE_DIR, "carry_over.json")  # voted songs cut off from the last update
+CARRY_OVER_MAX_SONGS = 10
+UPDATE_JOURNAL_FILE = os.path.join(BASE_DIR, "update_journal.jsonl")  # progress of the running update
+
+# Scheduler
+SCHEDULE_HISTORY_FILE = os.path.join(BASE_DIR, "schedule_history.json")
+SCHEDULE_SAFETY_MARGIN_SECONDS = 30
+PLAYED_SONGS_RESET_TIME = "07:44"
+
+# Audio library
+LIBRARY_INDEX_FILE = os.path.join(BASE_DIR, "library_index.json")
+AUDIO_LIBRARY_MAX_BYTES = 8 * 1024 ** 3
+LIBRARY_TRANSCODE_BITRATE = "128k"
+LIBRARY_TRANSCODE_WORKERS = 1
+LIBRARY_MAINTENANCE_INTERVAL_SECONDS = 600
+
+# Fingerprints and verdicts
+FINGERPRINT_DIR = os.path.join(BASE_DIR, "fingerprints")
+FINGERPRINT_MIN_MATCHES = 40
+VERDICT_CACHE_FILE = os.path.join(BASE_DIR, "verdicts.json")
+PEER_SYNC_LOG_FILE = os.path.join(BASE_DIR, "peer_sync_log.jsonl")
+PEER_SYNC_STATE_FILE = os.path.join(BASE_DIR, "peer_sync_state.json")
+
+# Local sentiment pre-screen
+PRESCREEN_MODEL_FILE = os.path.join(BASE_DIR, "prescreen_model.npz")
+PRESCREEN_ACCEPT_THRESHOLD = 0.95
+PRESCREEN_REJECT_THRESHOLD = 0.02
+PRESCREEN_MIN_SAMPLES = 200
+PRESCREEN_AUDIT_RATE = 0.05  # share of local verdicts still checked with Gemini
+PRESCREEN_TRAINING_TIME = "07:30"
+
+# Transcription
+USE_CAPTIONS = True  # use YouTube caption tracks as lyrics before uploading audio to Gemini
+CAPTION_LANGUAGES = ["pl", "en"]
+CAPTION_MIN_WORDS = 30
+EARLY_REJECT_SECONDS = 60  # transcribe and screen this much of a song first; None downloads whole songs
+
+# Downloads
+DOWNLOAD_CONCURRENCY = 3
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+DOWNLOAD_BANDWIDTH_BYTES_PER_SECOND = 2 * 1024 * 1024  # shared by all downloads; None means no cap
+DOWNLOAD_RETRIES = 3
+# Audio downloaded (or downloading) and not yet vetted; downloads wait above it until vetting catches up
+AUDIO_IN_FLIGHT_MAX_BYTES = 256 * 1024 * 1024
+PREFETCH_MAX_PENDING = 12  # prefetched songs not yet taken by the update; later ones download on demand
+
+# Player state
+PLAYER_STATE_TTL_SECONDS = 1.0
+
+# Logging
+LOG_JSON = False
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+DEBUG_PAYLOADS = False  # log full lyrics and prompts
\ No newline at end of file
@@ -1,20 +1,53 @@
+import atexit
+import json
 import logging
 import os
+import queue
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from config import LOG_JSON, LOG_MAX_BYTES, LOG_BACKUP_COUNT
 
-def setup_logging():
-    """Configure logging settings for the application."""
-    log_dir = "logs"
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging(log_dir: str = "logs", json_format: bool = LOG_JSON,
+                  level: int = logging.INFO) -> QueueListener:
+    """Configure logging settings for the application.
+
+    Log calls only enqueue the record; a background QueueListener writes to the
+    size-rotated log file and the console, so pipeline threads never block on I/O.
+    """
     if not os.path.exists(log_dir):
         os.makedirs(log_dir)
 
     log_filename = os.path.join(log_dir, f"app_{datetime.now().strftime('%Y%m%d')}.log")
-    
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_filename, encoding='utf-8'),
-            logging.StreamHandler()
-        ]
-    )
\ No newline at end of file
+    formatter = JsonFormatter() if json_format else logging.Formatter(LOG_FORMAT)
+
+    file_handler = RotatingFileHandler(log_filename, maxBytes=LOG_MAX_BYTES,
+                                       backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(-1)
+    listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    logging.basicConfig(level=level, handlers=[QueueHandler(log_queue)], force=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -1,11 +1,24 @@
-from modules.aimp_controller import AimpController
+from time import perf_counter
+PROCESS_STARTED = perf_counter()
+
 from modules.youtube_downloader import YoutubeDownloader
-from modules.playlist_manager import PlaylistManager
+from modules.audio_budget import AudioBudget
 from modules.hotkey_manager import HotkeyManager
-from modules.request_manager import RequestManager, CommandServer
+from modules.request_manager import RequestManager
 from modules.text_analysis import TextAnalyzer
 from modules.gemini import TranscriptAPI, SentimentAPI
-from modules.schedule_manager import ScheduleManager
+from modules.deadline_scheduler import DeadlineScheduler, DurationHistory
+from modules.job_runner import JobRunner
+from modules.library_index import LibraryIndex
+from modules.library_cache import LibraryCache
+from modules.library_maintenance import LibraryMaintenance
+from modules.fingerprint import FingerprintIndex
+from modules.verdict_cache import VerdictCache
+from modules.song_locks import SongLocks
+from modules.prescreen import PreScreenClassifier
+from modules.aimp_controller import AimpController
+from modules.zones import Zone, zone_settings
+from modules.startup import StartupReport
 from modules.utils import load_prompts, ensure_directories_exist
 
 from config import (
@@ -13,30 +26,65 @@ from config import (
     GEMINI_MODEL,
     URL_BACKEND,
     URL_ADMINPAGE,
-    BASE_DIR
+    BASE_DIR,
+    AUDIO_FOLDER_PATH,
+    AUDIO_FOLDER_TEMP_PATH,
+    BLACKLISTED_SONGS,
+    AUDIO_LIBRARY_MAX_BYTES,
+    AUDIO_IN_FLIGHT_MAX_BYTES,
+    LIBRARY_INDEX_FILE,
+    LIBRARY_TRANSCODE_BITRATE,
+    LIBRARY_TRANSCODE_WORKERS,
+    LIBRARY_MAINTENANCE_INTERVAL_SECONDS,
+    FINGERPRINT_DIR,
+    FINGERPRINT_MIN_MATCHES,
+    VERDICT_CACHE_FILE,
+    PEER_SYNC_ENABLED,
+    PEER_SYNC_NODE_ID,
+    PEER_SYNC_PORT,
+    PEER_SYNC_PEERS,
+    PEER_SYNC_INTERVAL_SECONDS,
+    PEER_SYNC_LOG_FILE,
+    PEER_SYNC_STATE_FILE,
+    PRESCREEN_MODEL_FILE,
+    PRESCREEN_ACCEPT_THRESHOLD,
+    PRESCREEN_REJECT_THRESHOLD,
+    PRESCREEN_MIN_SAMPLES,
+    PRESCREEN_AUDIT_RATE,
+    USE_CAPTIONS,
+    EARLY_REJECT_SECONDS,
+    VOTE_STREAM_ENABLED,
+    VOTE_POLL_INTERVAL_SECONDS,
+    VOTE_STREAM_BACKOFF_MAX_SECONDS,
+    VOTE_STREAM_READ_TIMEOUT_SECONDS,
+    SCHEDULE_HISTORY_FILE,
+    SCHEDULE_SAFETY_MARGIN_SECONDS,
+    ZONES
 )
 
+import os
 import threading
 import time
-import schedule
 import logging
 from logging_config import setup_logging
 
+IMPORTS_FINISHED = perf_counter()
 print(BASE_DIR)
 
 setup_logging()
 logger = logging.getLogger(__name__)
 
-def initialize_components():
-    """Initialize all required components."""
+def initialize_components(report: StartupReport):
+    """Initialize all required components, running the independent steps in parallel."""
     try:
         # Ensure all required directories exist
-        ensure_directories_exist()
+        with report.step('directories'):
+            ensure_directories_exist()
         
-        # Initialize APIs and analyzers
-        prompt_sentiment, prompt_transcript = load_prompts()
+        # Initialize APIs and analyzers; Gemini models are configured on first use
+        with report.step('prompts'):
+            prompt_sentiment, prompt_transcript = load_prompts()
         text_analyzer = TextAnalyzer()
-        text_analyzer.initialize()
         
         transcript_api = TranscriptAPI(
             api_key=GEMINI_API_KEY, 
@@ -50,65 +98,167 @@ def initialize_components():
         )
         
         # Initialize core components
-        aimp_controller = AimpController()
-        youtube_downloader = YoutubeDownloader()
+        # Downloads pause when the audio not yet vetted reaches the budget
+        audio_budget = AudioBudget(AUDIO_IN_FLIGHT_MAX_BYTES)
+        audio_budget.register_metrics()
+        youtube_downloader = YoutubeDownloader(audio_budget=audio_budget)
         request_manager = RequestManager(URL_BACKEND, URL_ADMINPAGE)
-        
-        aimp_controller.clear_played_songs()
+        zones = []
 
-        server = CommandServer(port=5050) 
-        server.set_command_handler(aimp_controller.handle_command)
-        server.start()
-        
-        # Initialize playlist manager with dependencies
-        playlist_manager = PlaylistManager(
-            aimp_controller=aimp_controller,
-            youtube_downloader=youtube_downloader,
-            text_analyzer=text_analyzer,
-            transcript_api=transcript_api,
-            sentiment_api=sentiment_api,
-            request_manager=request_manager
+        # Songs queued in any zone's AIMP must stay on disk until they are played
+        library_cache = LibraryCache(
+            AUDIO_FOLDER_PATH,
+            LibraryIndex(LIBRARY_INDEX_FILE),
+            AUDIO_LIBRARY_MAX_BYTES,
+            pinned_provider=lambda: {os.path.basename(path) for zone in zones
+                                     for path in zone.aimp_controller.playlist}
         )
+        library_cache.subscribe(on_add=youtube_downloader.register_cached, on_remove=youtube_downloader.forget)
+        zone_entries = [zone_settings(entry, primary=i == 0) for i, entry in enumerate(ZONES)]
+        multi_zone = len(zone_entries) > 1
+        if multi_zone and not AimpController.window_binding_available():
+            # Bez rozróżniania okien strefy sterowałyby nawzajem swoimi odtwarzaczami
+            raise RuntimeError("Several ZONES need pywin32 to bind each zone to its own AIMP window")
+        players = [Zone.create_player(settings, bind_window=multi_zone) for settings in zone_entries]
+
+        # Niezależne kroki startu naraz: AIMP wstaje, gdy ładują się automaty, biblioteka i indeksy
+        steps = {
+            'text_analyzer': text_analyzer.initialize,
+            'library_scan': library_cache.start,
+            'fingerprints': lambda: FingerprintIndex(FINGERPRINT_DIR, min_matches=FINGERPRINT_MIN_MATCHES),
+            'verdict_cache': lambda: VerdictCache(VERDICT_CACHE_FILE),
+            'prescreen': lambda: PreScreenClassifier(
+                accept_threshold=PRESCREEN_ACCEPT_THRESHOLD,
+                reject_threshold=PRESCREEN_REJECT_THRESHOLD,
+                min_samples=PRESCREEN_MIN_SAMPLES,
+                model_path=PRESCREEN_MODEL_FILE
+            ),
+        }
+        for settings, player in zip(zone_entries, players):
+            steps[f"aimp:{settings['name']}"] = player.start_aimp
+        loaded = report.run_parallel(steps)
+        fingerprints = loaded['fingerprints']
+        verdict_cache = loaded['verdict_cache']
+        prescreen = loaded['prescreen']
+
+        # Werdykty, blacklista i pliki wymieniane z węzłami w innych budynkach
+        peer_sync = None
+        if PEER_SYNC_ENABLED:
+            from modules.peer_sync import PeerSync
+            peer_sync = PeerSync(
+                PEER_SYNC_NODE_ID,
+                verdict_cache,
+                library_cache,
+                blacklist_file=BLACKLISTED_SONGS,
+                temp_folder=AUDIO_FOLDER_TEMP_PATH,
+                peers=PEER_SYNC_PEERS,
+                port=PEER_SYNC_PORT,
+                interval=PEER_SYNC_INTERVAL_SECONDS,
+                log_path=PEER_SYNC_LOG_FILE,
+                state_path=PEER_SYNC_STATE_FILE
+            )
+            with report.step('peer_sync'):
+                peer_sync.start()
         
+        job_runner = JobRunner()
+        # One scheduler for all zones, so their learned durations share one history file
+        scheduler = DeadlineScheduler(
+            history=DurationHistory(SCHEDULE_HISTORY_FILE),
+            safety_margin=SCHEDULE_SAFETY_MARGIN_SECONDS
+        )
+
+        # Everything that costs downloads or Gemini calls is shared by the zones
+        engine = {
+            'youtube_downloader': youtube_downloader,
+            'text_analyzer': text_analyzer,
+            'transcript_api': transcript_api,
+            'sentiment_api': sentiment_api,
+            'request_manager': request_manager,
+            'library_cache': library_cache,
+            'fingerprints': fingerprints,
+            'verdict_cache': verdict_cache,
+            'prescreen': prescreen,
+            'prescreen_audit_rate': PRESCREEN_AUDIT_RATE,
+            'use_captions': USE_CAPTIONS,
+            'early_reject_seconds': EARLY_REJECT_SECONDS,
+            'song_locks': SongLocks(),
+            'peer_sync': peer_sync,
+            'audio_budget': audio_budget
+        }
+        with report.step('zones'):
+            for i, (settings, player) in enumerate(zip(zone_entries, players)):
+                zone = Zone.create(settings, engine, job_runner, scheduler, primary=i == 0, aimp_controller=player)
+                zone.aimp_controller.clear_played_songs()
+                zone.register_metrics()
+                zones.append(zone)
+        playlist_manager = zones[0].playlist_manager
+
+        if not prescreen.ready:
+            job_runner.submit("prescreen_training", lambda job: playlist_manager.train_prescreen())
+
+        # Votes cast between updates start downloading right away; every zone gets them
+        if VOTE_STREAM_ENABLED:
+            for zone in zones:
+                zone.playlist_manager.vote_queue.start(zone.playlist_manager.prepare_vote)
+            request_manager.subscribe(
+                lambda songs: [zone.playlist_manager.vote_queue.put(songs) for zone in zones],
+                poll_interval=VOTE_POLL_INTERVAL_SECONDS,
+                backoff_max=VOTE_STREAM_BACKOFF_MAX_SECONDS,
+                read_timeout=VOTE_STREAM_READ_TIMEOUT_SECONDS
+            )
+
+        # Transcode the library in the background, paused while a playlist update runs
+        library_maintenance = LibraryMaintenance(
+            library_cache,
+            job_runner=job_runner,
+            bitrate=LIBRARY_TRANSCODE_BITRATE,
+            workers=LIBRARY_TRANSCODE_WORKERS,
+            interval=LIBRARY_MAINTENANCE_INTERVAL_SECONDS,
+            skip_provider=lambda: [song for zone in zones for song in zone.playlist_manager.get_played_songs()],
+            fingerprints=fingerprints
+        )
+        library_maintenance.start()
+
         # Initialize managers
-        schedule_manager = ScheduleManager(playlist_manager, aimp_controller)
-        hotkey_manager = HotkeyManager(playlist_manager, aimp_controller)
+        hotkey_manager = HotkeyManager(zones, job_runner)
         
-        logger.info("All components initialized successfully")
+        logger.info(f"All components initialized successfully ({len(zones)} zones)")
         return (
-            playlist_manager, 
-            aimp_controller, 
+            zones,
             request_manager, 
             hotkey_manager,
-            schedule_manager
+            scheduler
         )
     except Exception as e:
         logger.error(f"Error during initialization: {e}")
         raise
 
-def run_schedule():
-    """Run scheduled tasks."""
-    while True:
-        try:
-            schedule.run_pending()
-            time.sleep(5)
-        except Exception as e:
-            logger.error(f"Error in schedule loop: {e}")
+def warm_up(playlist_manager):
+    """Load what startup deferred (Gemini client) in the background, before the first update needs it."""
+    for api in (playlist_manager.transcript_api, playlist_manager.sentiment_api):
+        api.model_instance
+
 
 def main():
     try:
+        report = StartupReport(started=PROCESS_STARTED)
+        report.record('imports', PROCESS_STARTED, IMPORTS_FINISHED)
+
         # Initialize all components
-        (playlist_manager, 
-         aimp_controller, 
+        (zones,
          request_manager, 
          hotkey_manager,
-         schedule_manager) = initialize_components()
+         scheduler) = initialize_components(report)
         
         # Setup schedules
-        schedule_manager.setup_schedules()
+        with report.step('schedules'):
+            for zone in zones:
+                zone.schedule_manager.setup_schedules()
         
-        # Start AIMP
-        aimp_controller.start_aimp()
+        # Start AIMP (already running unless it failed to start during initialization)
+        with report.step('player_state'):
+            for zone in zones:
+                zone.start()
         
         # Start threads
         hotkey_thread = threading.Thread(
@@ -117,7 +267,7 @@ def main():
             name="HotkeyThread"
         )
         schedule_thread = threading.Thread(
-            target=run_schedule,
+            target=scheduler.run,
             daemon=True,
             name="ScheduleThread"
         )
@@ -125,6 +275,11 @@ def main():
         hotkey_thread.start()
         schedule_thread.start()
         
+        report.finish()
+        report.register_metrics()
+        logger.info(f"Startup times:\n{report.format()}")
+        threading.Thread(target=warm_up, args=(zones[0].playlist_manager,), daemon=True, name="WarmUp").start()
+
         logger.info("Application started successfully")
         print("\nRadio system started successfully!")
         print("Use the following hotkeys to control the system:")
@@ -140,8 +295,8 @@ def main():
         while True:
             time.sleep(3)
             try:
-                # Handle current track info
-                current_track = aimp_controller.get_current_track_info()
+                # Handle current track info (the backend shows one now-playing song: the first zone's)
+                current_track = zones[0].player_state.snapshot()['track']
                 if current_track and current_track['title'] != previous_title:
                     previous_title = current_track['title']
                     request_manager.post_playing_song(current_track)
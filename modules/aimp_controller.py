@@ -1,27 +1,55 @@
 import os
+import shutil
 import subprocess
 import threading
 import time
 from time import sleep
 import logging
 import pyaimp
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Any
 from .decorators import ensure_connected, handle_exceptions
+from .metrics import AIMP_ADD_SECONDS, AIMP_CONNECT_SECONDS
 from config import (
     MAIN_AUDIO_DEVICE_NAME, 
     AIMP_VOLUME_INCREMENT, 
     AIMP_MAX_VOLUME, 
     PLAYED_SONGS_FILE,
-    AIMP_PLAYLIST_PATH
+    AIMP_PLAYLIST_PATH,
+    AIMP_START_TIMEOUT_SECONDS,
+    AIMP_READY_POLL_SECONDS,
+    AIMP_READY_POLL_MAX_SECONDS,
+    AIMP_QUIT_TIMEOUT_SECONDS,
+    AIMP_PROCESS_NAME,
+    AIMP_REMOTE_WINDOW_CLASS
 )
 
 logger = logging.getLogger(__name__)
 
 class AimpController:
-    def __init__(self):
-        self.command = "aimp"
+    """Player of one zone: an AIMP instance, its playlist files and the sound device it plays on.
+
+    pyaimp talks to the first AIMP window it finds. With bind_window (several
+    zones, each with its own AIMP) the client is pointed at the window owned by
+    this zone's AIMP process instead, and connecting, readiness and close checks
+    only ever see that window.
+    """
+
+    def __init__(self, device: str = MAIN_AUDIO_DEVICE_NAME, command: str = "aimp",
+                 playlist_path: str = AIMP_PLAYLIST_PATH, played_songs_file: str = PLAYED_SONGS_FILE,
+                 bind_window: bool = False):
+        self.command = command
+        self.bind_window = bind_window
+        self.device = device
+        self.playlist_path = playlist_path
+        self.played_songs_file = played_songs_file
         self.client = None
         self.current_volume = AIMP_MAX_VOLUME
+        self.ipc_lock = threading.RLock()
+        # Held while the player is deliberately quit and started, so the supervisor keeps out
+        self.lifecycle_lock = threading.RLock()
+        self.process: Optional[subprocess.Popen] = None
+        self.pid: Optional[int] = None  # AIMP started through a launcher, found by its executable
+        self.playlist: List[str] = []  # songs added since the last prepare_for_update
         
     @handle_exceptions
     def get_current_track_info(self) -> Optional[Dict[str, str]]:
@@ -30,7 +58,8 @@ class AimpController:
             return None
             
         try:
-            info = self.client.get_current_track_info()
+            with self.ipc_lock:
+                info = self.client.get_current_track_info()
             return {
                 'title': info.get('title', ''),
                 'duration': info.get('duration', '00:00:00')
@@ -40,34 +69,210 @@ class AimpController:
             return None
     
     @handle_exceptions
-    def start_aimp(self) -> None:
-        """Start AIMP in a separate thread."""
-        thread = threading.Thread(target=self.run_aimp)
-        thread.start()
-        time.sleep(3)  # Wait for AIMP to initialize
-        self.connect_to_aimp()
+    def start_aimp(self, timeout: float = AIMP_START_TIMEOUT_SECONDS) -> bool:
+        """Launch AIMP and connect as soon as it answers."""
+        with self.lifecycle_lock:
+            self.run_aimp()
+            return self.wait_until_ready(timeout)
+
+    def wait_until_ready(self, timeout: float, stop: bool = True, quiet: bool = False) -> bool:
+        """Poll until AIMP accepts a connection instead of sleeping a fixed time; False on timeout.
+
+        Polls start at AIMP_READY_POLL_SECONDS and back off to AIMP_READY_POLL_MAX_SECONDS,
+        so a player that is up in 200 ms is used after about 200 ms.
+        """
+        started = time.monotonic()
+        interval = AIMP_READY_POLL_SECONDS
+        error = None
+        while True:
+            if self.connect_to_aimp(stop=stop, quiet=True):
+                elapsed = time.monotonic() - started
+                AIMP_CONNECT_SECONDS.observe(elapsed)
+                logger.info(f"AIMP ready after {elapsed:.2f}s")
+                return True
+            if self.process is not None and self.process.poll() not in (None, 0):
+                error = f"AIMP exited with code {self.process.returncode}"
+            if time.monotonic() - started >= timeout:
+                if not quiet:
+                    logger.error(f"AIMP did not answer within {timeout:g}s" + (f": {error}" if error else ""))
+                return False
+            sleep(interval)
+            interval = min(interval * 1.5, AIMP_READY_POLL_MAX_SECONDS)
+
+    def wait_until_closed(self, timeout: float = AIMP_QUIT_TIMEOUT_SECONDS) -> bool:
+        """Poll until the AIMP window is gone after a quit; False if it is still there after timeout."""
+        started = time.monotonic()
+        interval = AIMP_READY_POLL_SECONDS
+        while time.monotonic() - started < timeout:
+            try:
+                self._new_client()
+            except Exception:
+                return True
+            sleep(interval)
+            interval = min(interval * 1.5, AIMP_READY_POLL_MAX_SECONDS)
+        return False
     
     def run_aimp(self) -> None:
         """Launch AIMP process."""
-        subprocess.run(self.command)
+        self.pid = None
+        self.process = subprocess.Popen(self.command)
+
+    @staticmethod
+    def window_binding_available() -> bool:
+        """True if windows can be told apart by their process (pywin32, which pyaimp uses, is there)."""
+        try:
+            import win32gui  # noqa: F401
+            import win32process  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def _new_client(self):
+        """A pyaimp client; with bind_window bound to this zone's AIMP window, ConnectionError if there is none."""
+        client = pyaimp.Client()
+        if not self.bind_window:
+            return client
+        hwnd = self._zone_window()
+        if hwnd is None:
+            raise ConnectionError("this zone's AIMP window not found")
+        if not hasattr(client, '_aimp_remote_accessor'):
+            raise RuntimeError("this pyaimp version cannot be pointed at a chosen AIMP window")
+        # pyaimp wysyła komunikaty do okna zapamiętanego w konstruktorze (pierwszego znalezionego)
+        client._aimp_remote_accessor = hwnd
+        return client
+
+    def _zone_window(self) -> Optional[int]:
+        """Handle of the AIMP IPC window owned by this zone's AIMP process, or None."""
+        import win32gui
+        import win32process
+        pids = self._own_pids()
+        windows = []
+
+        def collect(hwnd, _):
+            if (win32gui.GetClassName(hwnd) == AIMP_REMOTE_WINDOW_CLASS
+                    and win32process.GetWindowThreadProcessId(hwnd)[1] in pids):
+                windows.append(hwnd)
+            return True
+
+        if pids:
+            win32gui.EnumWindows(collect, None)
+        return windows[0] if windows else None
+
+    def _own_pids(self) -> List[int]:
+        """PID of this zone's AIMP: the process we started, else the one run from the zone's executable."""
+        if self.process is not None and self.process.poll() is None:
+            return [self.process.pid]
+        if self.pid is None:
+            pids = self._zone_pids()
+            self.pid = pids[0] if len(pids) == 1 else None
+        return [self.pid] if self.pid else []
+
+    def kill(self) -> None:
+        """Kill a player that does not quit or answer - only this zone's AIMP, by PID."""
+        self.client = None
+        self.pid = None
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait(timeout=AIMP_QUIT_TIMEOUT_SECONDS)
+            logger.warning(f"AIMP killed (pid {self.process.pid})")
+            return
+        # AIMP uruchomiony poza nami (albo launcher przekazał go dalej) - szukamy procesu
+        # uruchomionego z pliku tej strefy; nigdy po samej nazwie, bo zabilibyśmy AIMP innych stref
+        pids = self._zone_pids()
+        if not pids:
+            logger.error(f"No running {AIMP_PROCESS_NAME} started from {self.command}, nothing killed")
+            return
+        for pid in pids:
+            try:
+                subprocess.run(["taskkill", "/F", "/PID", str(pid)], capture_output=True)
+            except OSError as e:
+                logger.error(f"Could not kill AIMP (pid {pid}): {e}")
+                return
+        logger.warning(f"AIMP killed (pid {', '.join(map(str, pids))})")
+
+    def _zone_pids(self) -> List[int]:
+        """PID of this zone's AIMP: started by our launcher, else the only one run from the zone's executable."""
+        executable = os.path.normcase(os.path.abspath(shutil.which(self.command) or self.command))
+        query = (f"Get-CimInstance Win32_Process -Filter \"Name='{AIMP_PROCESS_NAME}'\" | "
+                 "ForEach-Object { \"$($_.ProcessId)|$($_.ParentProcessId)|$($_.ExecutablePath)\" }")
+        try:
+            output = subprocess.run(["powershell", "-NoProfile", "-Command", query],
+                                    capture_output=True, text=True, timeout=AIMP_QUIT_TIMEOUT_SECONDS).stdout
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.error(f"Could not list {AIMP_PROCESS_NAME} processes: {e}")
+            return []
+        processes = {}
+        for line in output.splitlines():
+            pid, _, rest = line.strip().partition('|')
+            parent, _, path = rest.partition('|')
+            if pid.isdigit() and path and os.path.normcase(os.path.abspath(path)) == executable:
+                processes[int(pid)] = int(parent) if parent.isdigit() else None
+        launched = [pid for pid, parent in processes.items() if self.process and parent == self.process.pid]
+        if launched:
+            return launched
+        if len(processes) > 1:
+            # Kilka stref z tego samego pliku - nie wiadomo, który proces jest nasz
+            logger.error(f"{len(processes)} AIMP processes run from {executable}, cannot tell which one is this zone's")
+            return []
+        return list(processes)
+
+    def restart(self, graceful: bool = True) -> bool:
+        """Quit (or kill) the player and start it again; True once it answers."""
+        with self.lifecycle_lock:
+            if graceful:
+                self.aimp_quit()
+            if not graceful or not self.wait_until_closed():
+                self.kill()
+                self.wait_until_closed()
+            return bool(self.start_aimp())
     
-    @handle_exceptions
-    def connect_to_aimp(self) -> None:
-        """Connect to AIMP client."""
-        self.client = pyaimp.Client()
-        self.client.stop()  # Ensure player is stopped upon connection
+    def connect_to_aimp(self, stop: bool = True, quiet: bool = False) -> bool:
+        """Connect to AIMP client; False (and no client) if the player does not answer."""
+        try:
+            with self.ipc_lock:
+                self.client = self._new_client()
+                if stop:
+                    self.client.stop()  # Ensure player is stopped upon connection
+            return True
+        except Exception as e:
+            # Okno AIMP jeszcze (albo już) nie istnieje - pyaimp rzuca RemoteError
+            self.client = None
+            if not quiet:
+                logger.warning(f"Could not connect to AIMP: {e}")
+            return False
+
+    def read_player_state(self) -> Dict[str, Any]:
+        """Read track, position, volume and playback state in one IPC round. Raises on failure."""
+        with self.ipc_lock:
+            if not self.client:
+                raise ConnectionError("AIMP client not connected")
+            info = self.client.get_current_track_info()
+            position = self.client.get_player_position()
+            volume = self.client.get_volume()
+            state = self.client.get_playback_state()
+        return {
+            'track': {
+                'title': info.get('title', ''),
+                'duration': info.get('duration', '00:00:00')
+            },
+            'position_ms': position,
+            'volume': volume,
+            'state': getattr(state, 'name', str(state)).lower()
+        }
     
     @handle_exceptions
     def aimp_quit(self) -> None:
         """Quit AIMP client."""
         if self.client:
-            self.client.quit()
-            self.client = None
+            client, self.client = self.client, None
+            client.quit()
     
     @ensure_connected
     def add_song_to_playlist(self, song_path: str) -> None:
         """Add a song to the active playlist."""
-        self.client.add_to_active_playlist(song_path)
+        with AIMP_ADD_SECONDS.time():
+            self.client.add_to_active_playlist(song_path)
+        self.playlist.append(song_path)
     
     @ensure_connected
     def play_song(self) -> None:
@@ -85,8 +290,9 @@ class AimpController:
         self.client.next()
     
     @handle_exceptions
-    def stop_audio_device(self, device: str) -> None:
-        """Gradually reduce volume of the specified audio device."""
+    def stop_audio_device(self, device: Optional[str] = None) -> None:
+        """Gradually reduce volume of the specified audio device (the zone's device by default)."""
+        device = device or self.device
         volume = self.current_volume
         while volume > 0:
             volume = max(0, volume - AIMP_VOLUME_INCREMENT)
@@ -95,69 +301,76 @@ class AimpController:
     
     @handle_exceptions
     def start_audio_device(self) -> None:
-        """Gradually increase volume of the main audio device."""
-        subprocess.run(f'nircmd setsysvolume 0 "{MAIN_AUDIO_DEVICE_NAME}"')
+        """Gradually increase volume of the zone's audio device."""
+        subprocess.run(f'nircmd setsysvolume 0 "{self.device}"')
         volume = 0
         while volume < AIMP_MAX_VOLUME:
             volume = min(AIMP_MAX_VOLUME, volume + AIMP_VOLUME_INCREMENT)
-            subprocess.run(f'nircmd setsysvolume {volume} "{MAIN_AUDIO_DEVICE_NAME}"')
+            subprocess.run(f'nircmd setsysvolume {volume} "{self.device}"')
         self.current_volume = AIMP_MAX_VOLUME
     
     @handle_exceptions
     def clear_played_songs(self) -> None:
         """Clear the played songs file."""
-        with open(PLAYED_SONGS_FILE, 'w', encoding='utf-8') as f:
+        with open(self.played_songs_file, 'w', encoding='utf-8') as f:
             f.write('')
     
     @handle_exceptions
-    def handle_command(self, command: str) -> None:
-        """Handle commands from admin panel."""
+    def handle_command(self, command: str) -> bool:
+        """Handle commands from admin panel. Returns False for unknown commands."""
         command_handlers = {
             "play": self.play_song,
             "pause": self.pause_song,
-            "skip": self.skip_song
+            "skip": self.skip_song,
+            "next": self.skip_song
         }
         
         handler = command_handlers.get(command)
-        if handler:
-            handler()
+        if not handler:
+            logger.warning(f"Unknown command: {command}")
+            return False
+        handler()
+        return True
 
-    @handle_exceptions
     def prepare_for_update(self) -> None:
-        """Prepare AIMP for playlist update."""
+        """Prepare AIMP for playlist update; raises if the player cannot be restarted."""
+        self.lifecycle_lock.acquire()
         try:
             self.connect_to_aimp()
-            self.stop_audio_device(MAIN_AUDIO_DEVICE_NAME)
+            self.stop_audio_device()
             self.aimp_quit()
-            sleep(2)
+            self.playlist = []
+            if not self.wait_until_closed():
+                self.kill()
             
             # Czyścimy TYLKO pliki playlist, nie ruszamy plików audio
-            if os.path.exists(AIMP_PLAYLIST_PATH):
-                for file in os.listdir(AIMP_PLAYLIST_PATH):
+            if os.path.exists(self.playlist_path):
+                for file in os.listdir(self.playlist_path):
                     if file.endswith('.aimppl4'):  # upewnij się że usuwasz tylko pliki playlist
                         try:
-                            os.remove(os.path.join(AIMP_PLAYLIST_PATH, file))
+                            os.remove(os.path.join(self.playlist_path, file))
                             logger.debug(f"Removed playlist file: {file}")
                         except Exception as e:
                             logger.error(f"Error removing playlist file {file}: {e}")
             
-            # Restart AIMP
-            self.start_aimp()
-            sleep(1)
-            self.connect_to_aimp()
+            # Restart AIMP - start_aimp czeka, aż odtwarzacz odpowie
+            if not self.start_aimp():
+                raise ConnectionError("AIMP did not come back after the restart")
             
             logger.info("AIMP prepared for update")
         except Exception as e:
             logger.error(f"Error preparing AIMP for update: {e}")
             raise
+        finally:
+            self.lifecycle_lock.release()
 
     @handle_exceptions
     def clear_playlist_files(self) -> None:
         """Clear all playlist files."""
-        if os.path.exists(AIMP_PLAYLIST_PATH):
-            for file in os.listdir(AIMP_PLAYLIST_PATH):
+        if os.path.exists(self.playlist_path):
+            for file in os.listdir(self.playlist_path):
                 try:
-                    os.remove(os.path.join(AIMP_PLAYLIST_PATH, file))
+                    os.remove(os.path.join(self.playlist_path, file))
                     logger.debug(f"Removed playlist file: {file}")
                 except Exception as e:
                     logger.error(f"Error removing playlist file {file}: {e}")
\ No newline at end of file
@@ -0,0 +1,165 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from threading import Thread
+from typing import Any, Dict
+
+from .metrics import aimp_counters
+from config import (
+    AIMP_SUPERVISOR_INTERVAL_SECONDS,
+    AIMP_HANG_TIMEOUT_SECONDS,
+    AIMP_RECONNECT_TIMEOUT_SECONDS,
+    AIMP_RESTART_AFTER_FAILURES
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AimpSupervisor:
+    """Keeps one zone's AIMP reachable: probes it, reconnects, and restarts a closed or hung player.
+
+    Every interval the supervisor makes one cheap IPC call on a helper thread
+    with a deadline, so a hung player (no answer within hang_timeout) is told
+    apart from a closed one (the call fails at once). A lost connection is
+    re-established with short, growing polls; after restart_after failed rounds,
+    or straight away for a hung player, AIMP is restarted and playback resumed
+    if it was playing. Deliberate restarts (prepare_for_update) hold the
+    controller's lifecycle lock and are left alone.
+    """
+
+    def __init__(self, aimp_controller, name: str = "main",
+                 interval: float = AIMP_SUPERVISOR_INTERVAL_SECONDS,
+                 hang_timeout: float = AIMP_HANG_TIMEOUT_SECONDS,
+                 reconnect_timeout: float = AIMP_RECONNECT_TIMEOUT_SECONDS,
+                 restart_after: int = AIMP_RESTART_AFTER_FAILURES):
+        self.aimp_controller = aimp_controller
+        self.name = name
+        self.interval = interval
+        self.hang_timeout = hang_timeout
+        self.reconnect_timeout = reconnect_timeout
+        self.restart_after = restart_after
+        self.counters = aimp_counters(name)
+        self._failures = 0
+        self._was_playing = False
+        self._stats: Dict[str, Any] = {
+            'status': 'unknown',
+            'probe_ms': None,
+            'restarts': 0,
+            'reconnects': 0,
+            'hangs': 0,
+            'last_restart': None,
+            'last_restart_reason': None,
+            'last_restart_seconds': None,
+        }
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+
+    def start(self) -> None:
+        Thread(target=self._run, daemon=True, name=f"AimpSupervisor:{self.name}").start()
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._wakeup.set()
+
+    def wake(self) -> None:
+        """Check now instead of at the next interval, e.g. after a failed player call."""
+        self._wakeup.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats)
+
+    def check(self) -> str:
+        """One supervision round; returns ok, reconnected, restarted, down or busy."""
+        if not self.aimp_controller.lifecycle_lock.acquire(blocking=False):
+            return 'busy'
+        try:
+            status = self._check()
+        finally:
+            self.aimp_controller.lifecycle_lock.release()
+        with self._lock:
+            self._stats['status'] = status
+        return status
+
+    def _check(self) -> str:
+        if self.aimp_controller.client:
+            outcome = self._probe()
+            if outcome == 'ok':
+                self._failures = 0
+                return 'ok'
+            if outcome == 'hung':
+                self.counters['hangs'].inc()
+                self._count('hangs')
+                return self._restart(f"no answer within {self.hang_timeout:g}s", graceful=False)
+            self.aimp_controller.client = None
+
+        # Połączenie zerwane: najpierw krótkie próby, restart dopiero gdy odtwarzacz nie wraca
+        if self.aimp_controller.wait_until_ready(self.reconnect_timeout, stop=False, quiet=True):
+            self._failures = 0
+            self.counters['reconnects'].inc()
+            self._count('reconnects')
+            logger.info(f"Reconnected to AIMP in zone {self.name}")
+            return 'reconnected'
+        self._failures += 1
+        if self._failures >= self.restart_after:
+            return self._restart(f"not reachable in {self._failures} checks")
+        return 'down'
+
+    def _probe(self) -> str:
+        """Ask the player for its playback state; ok, error or hung."""
+        result: Dict[str, Any] = {}
+
+        def call():
+            try:
+                with self.aimp_controller.ipc_lock:
+                    result['state'] = self.aimp_controller.client.get_playback_state()
+            except Exception as e:
+                result['error'] = e
+
+        started = time.monotonic()
+        # Zawieszony AIMP blokuje wywołanie IPC, więc pytamy z osobnego wątku z limitem czasu
+        probe = Thread(target=call, daemon=True, name=f"AimpProbe:{self.name}")
+        probe.start()
+        probe.join(self.hang_timeout)
+        if probe.is_alive():
+            logger.error(f"AIMP in zone {self.name} did not answer within {self.hang_timeout:g}s")
+            return 'hung'
+        with self._lock:
+            self._stats['probe_ms'] = round((time.monotonic() - started) * 1000, 1)
+        if 'error' in result:
+            logger.warning(f"Lost connection to AIMP in zone {self.name}: {result['error']}")
+            return 'error'
+        state = result['state']
+        self._was_playing = getattr(state, 'name', str(state)).lower() == 'playing'
+        return 'ok'
+
+    def _restart(self, reason: str, graceful: bool = True) -> str:
+        logger.warning(f"Restarting AIMP in zone {self.name}: {reason}")
+        started = time.monotonic()
+        ready = self.aimp_controller.restart(graceful=graceful)
+        self._failures = 0
+        self.counters['restarts'].inc()
+        with self._lock:
+            self._stats['restarts'] += 1
+            self._stats.update(last_restart=datetime.now().isoformat(), last_restart_reason=reason,
+                               last_restart_seconds=round(time.monotonic() - started, 2))
+        if not ready:
+            return 'down'
+        if self._was_playing:
+            self.aimp_controller.play_song()
+        return 'restarted'
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def _run(self) -> None:
+        while not self._stopped:
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Error supervising AIMP in zone {self.name}: {e}")
+            self._wakeup.wait(timeout=self.interval)
+            self._wakeup.clear()
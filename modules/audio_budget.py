@@ -0,0 +1,89 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Set
+
+from .metrics import registry, AUDIO_BUDGET_WAITS, AUDIO_BUDGET_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class AudioBudget:
+    """Cap on the bytes of voted-song audio between the start of its download and the end of its vetting.
+
+    A download reserves the size of what it is about to fetch and blocks while
+    the reservations would go over max_bytes, so prefetching pauses when vetting
+    (Gemini) falls behind and resumes as the update finishes songs and releases
+    them. A song the update is waiting for is urgent and admitted over the cap;
+    otherwise later, prefetched songs could hold the budget the current one needs.
+    A single reservation larger than the budget is admitted when nothing else is
+    held. There is one reservation per video_id; reserving again resizes it
+    (e.g. when the rest of a partial download is fetched).
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.peak = 0
+        self._held: Dict[str, int] = {}
+        self._urgent: Set[str] = set()
+        self._condition = threading.Condition()
+
+    @property
+    def in_flight(self) -> int:
+        with self._condition:
+            return sum(self._held.values())
+
+    def reserve(self, key: str, size: int, timeout: Optional[float] = None) -> bool:
+        """Hold size bytes for key, waiting for room; False if timeout ran out first."""
+        started = time.monotonic()
+        with self._condition:
+            while True:
+                others = sum(self._held.values()) - self._held.get(key, 0)
+                if key in self._urgent or not others or others + size <= self.max_bytes:
+                    break
+                remaining = None if timeout is None else timeout - (time.monotonic() - started)
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            self._held[key] = size
+            self.peak = max(self.peak, others + size)
+        waited = time.monotonic() - started
+        if waited > 0.01:
+            AUDIO_BUDGET_WAITS.inc()
+            AUDIO_BUDGET_WAIT_SECONDS.observe(waited)
+            logger.info(f"Download of {key} waited {waited:.1f}s for the audio budget")
+        return True
+
+    def prioritize(self, key: str) -> None:
+        """The update waits for key: admit its reservation regardless of the cap."""
+        with self._condition:
+            self._urgent.add(key)
+            self._condition.notify_all()
+
+    def release(self, key: str) -> None:
+        with self._condition:
+            self._held.pop(key, None)
+            self._urgent.discard(key)
+            self._condition.notify_all()
+
+    def release_all(self, keep: Iterable[str] = ()) -> None:
+        """Drop every reservation except those in keep (the temp folder was cleared the same way)."""
+        keep = set(keep)
+        with self._condition:
+            self._held = {key: size for key, size in self._held.items() if key in keep}
+            self._urgent &= keep
+            self._condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                'max_bytes': self.max_bytes,
+                'in_flight_bytes': sum(self._held.values()),
+                'peak_bytes': self.peak,
+                'songs': len(self._held),
+            }
+
+    def register_metrics(self) -> None:
+        registry.gauge("radio_audio_in_flight_bytes", "Audio bytes downloaded or downloading and not yet vetted",
+                       lambda: self.in_flight)
+        registry.gauge("radio_audio_budget_bytes", "Cap on audio bytes in flight", lambda: self.max_bytes)
@@ -0,0 +1,229 @@
+import json
+import math
+import os
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DurationHistory:
+    """Recent run durations per job group, optionally persisted to a JSON file."""
+
+    def __init__(self, path: Optional[str] = None, window: int = 20, percentile: float = 0.9):
+        self.path = path
+        self.window = window
+        self.percentile = percentile
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def record(self, group: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(group, deque(maxlen=self.window)).append(seconds)
+            self._save()
+
+    def estimate(self, group: str, default: float) -> float:
+        """Return a high percentile of recent durations, or the default without history."""
+        with self._lock:
+            samples = sorted(self._samples.get(group, ()))
+        if not samples:
+            return default
+        rank = max(0, math.ceil(self.percentile * len(samples)) - 1)
+        return samples[rank]
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for group, samples in data.items():
+                self._samples[group] = deque(samples, maxlen=self.window)
+        except Exception as e:
+            logger.error(f"Error loading duration history {self.path}: {e}")
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump({group: list(samples) for group, samples in self._samples.items()}, f)
+        except Exception as e:
+            logger.error(f"Error saving duration history {self.path}: {e}")
+
+
+class DeadlineScheduler:
+    """Daily job scheduler that sleeps until the next job and plans deadline jobs from learned durations.
+
+    Fixed jobs run at a time of day. Deadline jobs are started early enough to finish
+    before their deadline, based on the recorded durations of their group. Jobs of the
+    same group never overlap: a trigger that fires while the group is still running is
+    skipped rather than queued.
+    """
+
+    MAX_SLEEP_SECONDS = 300
+
+    def __init__(self, history: Optional[DurationHistory] = None,
+                 time_source: Callable[[], datetime] = datetime.now,
+                 executor: Optional[Callable] = None,
+                 safety_margin: float = 30):
+        self.history = history or DurationHistory()
+        self.now = time_source
+        self.executor = executor or self._run_in_thread
+        self.safety_margin = timedelta(seconds=safety_margin)
+        self.jobs: List[Dict[str, Any]] = []
+        self.slack_log: Deque[Dict[str, Any]] = deque(maxlen=100)
+        self._running_groups = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+
+    def every_day_at(self, time_str: str, func: Callable, name: Optional[str] = None,
+                     **kwargs) -> Dict[str, Any]:
+        """Run func every day at HH:MM."""
+        job = self._new_job(func, name, name, kwargs)
+        job['at'] = self._parse_time(time_str)
+        return self._add(job)
+
+    def finish_by(self, deadline_str: str, func: Callable, name: Optional[str] = None,
+                  group: Optional[str] = None, earliest: Optional[str] = None,
+                  default_seconds: float = 300, **kwargs) -> Dict[str, Any]:
+        """Run func every day so that it finishes before HH:MM, never starting before earliest."""
+        job = self._new_job(func, name, group, kwargs)
+        job['deadline'] = self._parse_time(deadline_str)
+        job['earliest'] = self._parse_time(earliest) if earliest else None
+        job['default_seconds'] = default_seconds
+        return self._add(job)
+
+    def next_run_time(self) -> Optional[datetime]:
+        with self._lock:
+            return min((job['next_run'] for job in self.jobs), default=None)
+
+    def run_pending(self) -> None:
+        """Dispatch every job that is due, skipping groups that are still running."""
+        now = self.now()
+        dispatch = []
+        with self._lock:
+            due = sorted((job for job in self.jobs if job['next_run'] <= now),
+                         key=lambda job: (job['next_run'], job['index']))
+            for job in due:
+                occurrence = self._occurrence(job)
+                if job['group'] in self._running_groups:
+                    logger.warning(f"Skipping {job['name']}: previous {job['group']} run still in progress")
+                else:
+                    self._running_groups.add(job['group'])
+                    dispatch.append((job, occurrence))
+                job['day'] += timedelta(days=1)
+                self._plan(job, now)
+
+        for job, occurrence in dispatch:
+            self.executor(self._run_job, job, occurrence)
+
+    def run(self) -> None:
+        """Run until stop() is called, sleeping precisely until the next due job."""
+        while not self._stopped:
+            try:
+                self.run_pending()
+            except Exception as e:
+                logger.error(f"Error in scheduler loop: {e}")
+            next_run = self.next_run_time()
+            delay = (next_run - self.now()).total_seconds() if next_run else self.MAX_SLEEP_SECONDS
+            self._wakeup.wait(timeout=min(max(delay, 0), self.MAX_SLEEP_SECONDS))
+            self._wakeup.clear()
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._wakeup.set()
+
+    def get_slack_report(self) -> List[Dict[str, Any]]:
+        """Return recent deadline-job runs with their planned start and remaining slack."""
+        with self._lock:
+            return list(self.slack_log)
+
+    def _new_job(self, func: Callable, name: Optional[str], group: Optional[str],
+                 kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        name = name or func.__name__
+        return {'name': name, 'group': group or name, 'func': func, 'kwargs': kwargs,
+                'at': None, 'deadline': None, 'earliest': None, 'index': len(self.jobs)}
+
+    def _add(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        now = self.now()
+        job['day'] = now.date()
+        with self._lock:
+            self._plan(job, now)
+            self.jobs.append(job)
+        self._wakeup.set()
+        return job
+
+    def _plan(self, job: Dict[str, Any], now: datetime) -> None:
+        """Compute next_run for the job's current day, rolling over days that already passed."""
+        while True:
+            trigger = job['at'] or job['deadline']
+            if datetime.combine(job['day'], trigger) >= now or job['day'] > now.date():
+                break
+            job['day'] += timedelta(days=1)
+        job['next_run'] = self._planned_start(job)
+
+    def _planned_start(self, job: Dict[str, Any]) -> datetime:
+        if job['at']:
+            return datetime.combine(job['day'], job['at'])
+        deadline = datetime.combine(job['day'], job['deadline'])
+        estimate = self.history.estimate(job['group'], job['default_seconds'])
+        start = deadline - timedelta(seconds=estimate) - self.safety_margin
+        if job['earliest']:
+            start = max(start, datetime.combine(job['day'], job['earliest']))
+        return start
+
+    def _occurrence(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        occurrence = {'name': job['name'], 'planned_start': job['next_run'], 'deadline': None}
+        if job['deadline']:
+            occurrence['deadline'] = datetime.combine(job['day'], job['deadline'])
+            occurrence['estimate_seconds'] = self.history.estimate(job['group'], job['default_seconds'])
+        return occurrence
+
+    def _run_job(self, job: Dict[str, Any], occurrence: Dict[str, Any]) -> None:
+        started = self.now()
+        try:
+            job['func'](**job['kwargs'])
+        except Exception as e:
+            logger.error(f"Error in scheduled job {job['name']}: {e}", exc_info=True)
+        finally:
+            finished = self.now()
+            if occurrence['deadline']:
+                self._record_deadline_run(job, occurrence, started, finished)
+            with self._lock:
+                self._running_groups.discard(job['group'])
+            self._wakeup.set()
+
+    def _record_deadline_run(self, job: Dict[str, Any], occurrence: Dict[str, Any],
+                             started: datetime, finished: datetime) -> None:
+        duration = (finished - started).total_seconds()
+        slack = (occurrence['deadline'] - finished).total_seconds()
+        self.history.record(job['group'], duration)
+        occurrence.update({'started': started, 'finished': finished,
+                           'duration_seconds': duration, 'slack_seconds': slack})
+        with self._lock:
+            self.slack_log.append(occurrence)
+            # The estimate changed, so re-plan every other pending run of the group
+            for other in self.jobs:
+                if other['group'] == job['group'] and other['deadline']:
+                    other['next_run'] = self._planned_start(other)
+
+        if slack < 0:
+            logger.warning(f"{job['name']} missed its {occurrence['deadline']:%H:%M} deadline "
+                           f"by {-slack:.0f}s (took {duration:.0f}s)")
+        else:
+            logger.info(f"{job['name']} finished {slack:.0f}s before its "
+                        f"{occurrence['deadline']:%H:%M} deadline (took {duration:.0f}s)")
+
+    @staticmethod
+    def _run_in_thread(target: Callable, *args) -> None:
+        threading.Thread(target=target, args=args, daemon=True, name="ScheduledJob").start()
+
+    @staticmethod
+    def _parse_time(time_str: str):
+        return datetime.strptime(time_str, "%H:%M").time()
@@ -27,10 +27,15 @@ def handle_exceptions(func: Callable) -> Callable:
     return wrapper
 
 def ensure_connected(func: Callable) -> Callable:
-    """Decorator to ensure AIMP client is connected before operation."""
+    """Decorator to ensure AIMP client is connected before operation.
+
+    The call holds the controller's IPC lock so player commands from different
+    threads are serialized.
+    """
     @functools.wraps(func)
     def wrapper(self, *args, **kwargs):
-        if not self.client:
-            self.connect_to_aimp()
-        return func(self, *args, **kwargs)
+        with self.ipc_lock:
+            if not self.client and not self.connect_to_aimp():
+                raise ConnectionError(f"AIMP not reachable for {func.__name__}")
+            return func(self, *args, **kwargs)
     return wrapper
\ No newline at end of file
@@ -0,0 +1,146 @@
+import os
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+import requests
+
+from .metrics import DOWNLOAD_BYTES, DOWNLOAD_CHUNK_RETRIES, DOWNLOAD_RESUMED_BYTES
+
+logger = logging.getLogger(__name__)
+
+PART_SUFFIX = ".part"
+
+
+class TokenBucket:
+    """Blocking token bucket shared by all downloads; rate None means unlimited."""
+
+    def __init__(self, rate: Optional[float], burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or (rate or 0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: int) -> None:
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                # Kawałek większy niż cały kubełek przechodzi, gdy kubełek jest pełny
+                needed = min(amount, self.capacity)
+                if self.tokens >= needed:
+                    self.tokens -= amount
+                    return
+                wait = (needed - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class DownloadManager:
+    """Chunked, resumable HTTP downloads with a concurrency limit and a global bandwidth cap.
+
+    fetch() makes sure a file holds the first `size` bytes of a URL. Data goes to
+    <path>.part in Range requests of chunk_size bytes, each retried on its own,
+    and an existing .part file (or a shorter finished file, e.g. a prefix) is
+    continued instead of started over. Completion is detected from the bytes
+    written, after which the .part file is atomically renamed to path.
+    """
+
+    def __init__(self, max_concurrent: int = 3, chunk_size: int = 1024 * 1024,
+                 bandwidth: Optional[float] = None, retries: int = 3, timeout: float = 30.0):
+        self.max_concurrent = max_concurrent
+        self.chunk_size = chunk_size
+        self.bucket = TokenBucket(bandwidth, burst=max(chunk_size, bandwidth or 0))
+        self.retries = retries
+        self.timeout = timeout
+        self._slots = threading.Semaphore(max_concurrent)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="Download")
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        """Run a download function on the manager's pool (at most max_concurrent at once)."""
+        return self._executor.submit(func, *args, **kwargs)
+
+    def fetch(self, url: str, path: str, size: Optional[int] = None) -> str:
+        """Download the first size bytes of url (the whole body if None) to path; returns path."""
+        part_path = path + PART_SUFFIX
+        if os.path.exists(path) and not os.path.exists(part_path):
+            if size is not None and os.path.getsize(path) >= size:
+                return path
+            os.replace(path, part_path)
+
+        with self._slots:
+            have = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            if have:
+                DOWNLOAD_RESUMED_BYTES.inc(have)
+                logger.info(f"Resuming {os.path.basename(path)} at {have / 1024 ** 2:.1f} MiB")
+            if size is None:
+                self._fetch_body(url, part_path, have)
+            else:
+                while have < size:
+                    end = min(have + self.chunk_size, size) - 1
+                    have += self._fetch_chunk(url, part_path, have, end)
+
+        if size is not None and os.path.getsize(part_path) != size:
+            raise IOError(f"{part_path}: expected {size} bytes, got {os.path.getsize(part_path)}")
+        os.replace(part_path, path)
+        return path
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _fetch_chunk(self, url: str, part_path: str, start: int, end: int) -> int:
+        for attempt in range(1, self.retries + 1):
+            written = 0
+            try:
+                with requests.get(url, headers={"Range": f"bytes={start}-{end}"}, stream=True,
+                                  timeout=self.timeout) as response:
+                    response.raise_for_status()
+                    if response.status_code != 206 and start > 0:
+                        raise IOError("server ignored the range request")
+                    written = self._write(response, part_path, end - start + 1)
+                if written == end - start + 1:
+                    return written
+                raise IOError(f"short read: {written} of {end - start + 1} bytes")
+            except (requests.RequestException, IOError) as e:
+                # Cofamy częściowo zapisany kawałek, żeby plik zawsze kończył się na granicy zakresu
+                self._truncate(part_path, start)
+                if attempt == self.retries:
+                    raise
+                DOWNLOAD_CHUNK_RETRIES.inc()
+                logger.warning(f"Chunk {start}-{end} of {os.path.basename(part_path)} failed "
+                               f"(attempt {attempt}): {e}")
+                time.sleep(min(2 ** attempt, 10))
+        return 0
+
+    def _fetch_body(self, url: str, part_path: str, start: int) -> None:
+        headers = {"Range": f"bytes={start}-"} if start else {}
+        with requests.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            if start and response.status_code != 206:
+                self._truncate(part_path, 0)
+            self._write(response, part_path, None)
+
+    def _write(self, response, part_path: str, limit: Optional[int]) -> int:
+        written = 0
+        with open(part_path, 'ab') as f:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                if limit is not None:
+                    chunk = chunk[:limit - written]
+                self.bucket.consume(len(chunk))
+                f.write(chunk)
+                written += len(chunk)
+                if limit is not None and written >= limit:
+                    break
+        DOWNLOAD_BYTES.inc(written)
+        return written
+
+    @staticmethod
+    def _truncate(path: str, size: int) -> None:
+        if os.path.exists(path):
+            with open(path, 'r+b') as f:
+                f.truncate(size)
@@ -0,0 +1,188 @@
+import os
+import logging
+import subprocess
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .utils import ffmpeg_binary
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 8000
+N_FFT = 1024
+HOP = 512
+# Frequency bands (FFT bins) in which one peak per frame is picked
+BANDS = ((4, 16), (16, 32), (32, 64), (64, 128), (128, 256), (256, 511))
+FAN_OUT = 4
+MAX_DT = 63
+# Keep one hash in SUBSAMPLE; query and index are thinned the same way, so alignments survive
+SUBSAMPLE = 8
+
+
+def decode_mono(path: str, seconds: float = 90.0, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Decode the start of an audio file to a decimated mono float signal with ffmpeg."""
+    command = [ffmpeg_binary(), "-v", "error", "-i", path, "-t", str(seconds),
+               "-ac", "1", "-ar", str(sample_rate), "-f", "s16le", "-"]
+    result = subprocess.run(command, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with {result.returncode}: {result.stderr.decode(errors='replace')[-300:]}")
+    return np.frombuffer(result.stdout, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def fingerprint(samples: np.ndarray) -> np.ndarray:
+    """Landmark hashes of a mono signal as an (n, 2) int32 array of (hash, frame).
+
+    Per frame the strongest bin of each band is a candidate peak and only peaks
+    above the frame's mean candidate are kept. Each peak is paired with the first
+    FAN_OUT peaks of later frames; a pair hashes to (f1, f2, dt), which survives re-encoding and
+    volume changes, while the anchor frame lets matches be checked for a
+    consistent time offset.
+    """
+    if len(samples) < N_FFT:
+        return np.empty((0, 2), dtype=np.int32)
+
+    frames = 1 + (len(samples) - N_FFT) // HOP
+    index = np.arange(N_FFT)[None, :] + HOP * np.arange(frames)[:, None]
+    spectrum = np.abs(np.fft.rfft(samples[index] * np.hanning(N_FFT), axis=1))
+    log_spectrum = np.log1p(spectrum * 1000)
+
+    peak_bins = np.stack([lo + np.argmax(log_spectrum[:, lo:hi], axis=1) for lo, hi in BANDS], axis=1)
+    peak_values = np.take_along_axis(log_spectrum, peak_bins, axis=1)
+    keep = (peak_values > peak_values.mean(axis=1, keepdims=True)) & (peak_values > 0.1)
+    peak_frames = np.nonzero(keep)[0]
+    peak_freqs = peak_bins[keep]
+
+    hashes, anchors = [], []
+    paired = np.zeros(len(peak_frames), dtype=np.int32)
+    for offset in range(1, FAN_OUT + len(BANDS) + 1):
+        if len(peak_frames) <= offset:
+            break
+        dt = peak_frames[offset:] - peak_frames[:-offset]
+        valid = (dt > 0) & (dt <= MAX_DT) & (paired[:-offset] < FAN_OUT)
+        paired[:-offset][valid] += 1
+        f1 = peak_freqs[:-offset][valid]
+        f2 = peak_freqs[offset:][valid]
+        hashes.append((f1 << 15) | (f2 << 6) | dt[valid])
+        anchors.append(peak_frames[:-offset][valid])
+    if not hashes:
+        return np.empty((0, 2), dtype=np.int32)
+
+    result = np.stack([np.concatenate(hashes), np.concatenate(anchors)], axis=1).astype(np.int32)
+    # Mieszamy bity hasha, bo najnizsze bity to samo dt
+    mixed = (result[:, 0].astype(np.uint64) * np.uint64(2654435761)) & np.uint64(0xFFFFFFFF)
+    return result[(mixed >> np.uint64(16)) % np.uint64(SUBSAMPLE) == 0]
+
+
+def fingerprint_file(path: str, seconds: float = 90.0) -> np.ndarray:
+    return fingerprint(decode_mono(path, seconds))
+
+
+class FingerprintIndex:
+    """Fingerprints keyed by video_id, with an inverted index for matching.
+
+    Each fingerprint is stored as <video_id>.npy in a directory so adding one never
+    rewrites the others. Lookups use sorted NumPy arrays and searchsorted instead
+    of a dict of Python lists, which keeps a library of thousands of songs in tens
+    of megabytes. New fingerprints are merged into the arrays lazily on the next match.
+    """
+
+    def __init__(self, directory: Optional[str] = None, min_matches: int = 40, min_ratio: float = 0.05):
+        self.directory = directory
+        self.min_matches = min_matches
+        self.min_ratio = min_ratio
+        self._ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._pending: List[Tuple[int, np.ndarray]] = []
+        self._hashes = np.empty(0, dtype=np.int32)
+        self._songs = np.empty(0, dtype=np.int32)
+        self._frames = np.empty(0, dtype=np.int32)
+        self._lock = threading.Lock()
+        self._load()
+
+    def __contains__(self, video_id: str) -> bool:
+        return video_id in self._positions
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, video_id: str, hashes: np.ndarray) -> None:
+        with self._lock:
+            if video_id in self._positions:
+                return
+            self._register(video_id, hashes)
+        if self.directory:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                np.save(os.path.join(self.directory, f"{video_id}.npy"), hashes)
+            except Exception as e:
+                logger.error(f"Error saving fingerprint for {video_id}: {e}")
+
+    def match(self, hashes: np.ndarray, exclude: Optional[str] = None) -> Optional[Tuple[str, int]]:
+        """Return (video_id, aligned matches) of the best match above the thresholds, or None."""
+        if len(hashes) == 0:
+            return None
+        with self._lock:
+            self._merge_pending()
+            index_hashes, songs, frames = self._hashes, self._songs, self._frames
+        if len(index_hashes) == 0:
+            return None
+
+        lo = np.searchsorted(index_hashes, hashes[:, 0], side='left')
+        hi = np.searchsorted(index_hashes, hashes[:, 0], side='right')
+        counts = hi - lo
+        total = int(counts.sum())
+        if total == 0:
+            return None
+        positions = np.repeat(lo, counts) + np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        offsets = frames[positions].astype(np.int64) - np.repeat(hashes[:, 1], counts)
+        keys = songs[positions].astype(np.int64) * (1 << 32) + (offsets + (1 << 31))
+        unique, occurrences = np.unique(keys, return_counts=True)
+        best = int(np.argmax(occurrences))
+        song = int(unique[best] >> 32)
+        score = int(occurrences[best])
+
+        # Pomijamy dopasowanie do samego siebie, bierzemy kolejne najlepsze
+        if exclude is not None and self._ids[song] == exclude:
+            mask = (unique >> 32) != song
+            if not mask.any():
+                return None
+            unique, occurrences = unique[mask], occurrences[mask]
+            best = int(np.argmax(occurrences))
+            song = int(unique[best] >> 32)
+            score = int(occurrences[best])
+
+        if score < self.min_matches or score < self.min_ratio * len(hashes):
+            return None
+        return self._ids[song], score
+
+    def _register(self, video_id: str, hashes: np.ndarray) -> None:
+        self._positions[video_id] = len(self._ids)
+        self._ids.append(video_id)
+        self._pending.append((self._positions[video_id], hashes))
+
+    def _merge_pending(self) -> None:
+        if not self._pending:
+            return
+        hashes = [self._hashes] + [h[:, 0] for _, h in self._pending]
+        songs = [self._songs] + [np.full(len(h), song, dtype=np.int32) for song, h in self._pending]
+        frames = [self._frames] + [h[:, 1] for _, h in self._pending]
+        self._pending = []
+        all_hashes = np.concatenate(hashes)
+        order = np.argsort(all_hashes, kind='stable')
+        self._hashes = all_hashes[order]
+        self._songs = np.concatenate(songs)[order]
+        self._frames = np.concatenate(frames)[order]
+
+    def _load(self) -> None:
+        if not self.directory or not os.path.isdir(self.directory):
+            return
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith('.npy'):
+                continue
+            try:
+                self._register(filename[:-4], np.load(os.path.join(self.directory, filename)))
+            except Exception as e:
+                logger.error(f"Error loading fingerprint {filename}: {e}")
+        logger.info(f"Loaded {len(self._ids)} audio fingerprints")
@@ -1,45 +1,82 @@
-import google.generativeai as genai
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
-import base64
 import json
 import logging
-from typing import Optional, Dict, Any
+import os
+import threading
+import time
+from typing import Optional, Dict, Any, Tuple
 from .decorators import handle_exceptions, log_errors
+from .metrics import TRANSCRIPTION_SECONDS, SENTIMENT_SECONDS, GEMINI_ERRORS
+from config import DEBUG_PAYLOADS, GEMINI_INLINE_MAX_BYTES
 
 logger = logging.getLogger(__name__)
 
 class BaseGeminiAPI:
-    def __init__(self, api_key: str, model: str, prompt: str):
+    """Gemini client; google.generativeai is imported and the model configured on first use."""
+
+    def __init__(self, api_key: str, model: str, prompt: str, inline_max_bytes: int = GEMINI_INLINE_MAX_BYTES):
         self.api_key = api_key
         self.model = model
         self.prompt = prompt
-        self.model_instance = None
-        self._init_model()
-        
+        self.inline_max_bytes = inline_max_bytes
+        self._model_instance = None
+        self._model_lock = threading.Lock()
+
+    @property
+    def model_instance(self):
+        if self._model_instance is None:
+            with self._model_lock:
+                if self._model_instance is None:
+                    self._init_model()
+        return self._model_instance
+
     @handle_exceptions
     def _init_model(self):
         """Initialize the Gemini model."""
+        import google.generativeai as genai
         genai.configure(api_key=self.api_key)
-        print(self.prompt)
-        self.model_instance = genai.GenerativeModel(self.model, system_instruction=self.prompt)
+        if DEBUG_PAYLOADS:
+            logger.info(f"System prompt for {self.model}:\n{self.prompt}")
+        self._model_instance = genai.GenerativeModel(self.model, system_instruction=self.prompt)
         
     def _get_safety_settings(self):
         """Get default safety settings."""
+        from google.generativeai.types import HarmCategory, HarmBlockThreshold
         return {
             category: HarmBlockThreshold.BLOCK_NONE
             for category in HarmCategory
         }
         
-    def _convert_audio_to_base64(self, audio_path: str) -> Optional[str]:
-        """Convert audio file to base64 string."""
-        try:
+    def _audio_part(self, audio_path: str) -> Tuple[Any, Any]:
+        """Audio for a request: small clips inline, larger files uploaded through the File API.
+
+        upload_file streams the file from disk, so a long song is never held in
+        memory (inline it used to be read whole and base64-encoded on top).
+        Returns (part, uploaded); uploaded is the file to delete afterwards, or None.
+        """
+        import google.generativeai as genai
+        mime_type = "audio/mp3" if audio_path.endswith(".mp3") else "audio/webm"
+        if os.path.getsize(audio_path) <= self.inline_max_bytes:
             with open(audio_path, 'rb') as audio_file:
-                audio_bytes = audio_file.read()
-                base64_audio = base64.b64encode(audio_bytes).decode('utf-8')
-                return base64_audio
+                return {"mime_type": mime_type, "data": audio_file.read()}, None
+
+        uploaded = genai.upload_file(audio_path, mime_type=mime_type)
+        deadline = time.monotonic() + 60
+        while uploaded.state.name == "PROCESSING" and time.monotonic() < deadline:
+            time.sleep(0.5)
+            uploaded = genai.get_file(uploaded.name)
+        if uploaded.state.name != "ACTIVE":
+            self._delete_upload(uploaded)
+            raise RuntimeError(f"Upload of {os.path.basename(audio_path)} is {uploaded.state.name}")
+        return uploaded, uploaded
+
+    @staticmethod
+    def _delete_upload(uploaded) -> None:
+        import google.generativeai as genai
+        try:
+            genai.delete_file(uploaded.name)
         except Exception as e:
-            logger.error(f"Error converting audio to base64: {e}")
-            return None
+            # Pliki i tak wygasają po 48 godzinach
+            logger.warning(f"Could not delete uploaded file {uploaded.name}: {e}")
 
 
 class TranscriptAPI(BaseGeminiAPI):
@@ -50,28 +87,34 @@ class TranscriptAPI(BaseGeminiAPI):
             logger.error("Model not initialized")
             return None
             
-        base64_audio = self._convert_audio_to_base64(audio_path)
-        if not base64_audio:
+        try:
+            audio_part, uploaded = self._audio_part(audio_path)
+        except Exception as e:
+            logger.error(f"Error preparing audio {audio_path}: {e}")
             return None
         try:
-            response = self._generate_response(base64_audio, audio_path)
+            with TRANSCRIPTION_SECONDS.time():
+                response = self._generate_response(audio_part)
             logger.info(f"Generated response: {response.text[:20]}")
             return response.text if response else None
         except Exception as e:
             logger.error(f"Error generating response: {e}")
             return None
+        finally:
+            if uploaded:
+                self._delete_upload(uploaded)
         
     @handle_exceptions
-    def _generate_response(self, base64_audio: str, audio_path: str):
+    def _generate_response(self, audio_part):
         """Generate response from Gemini model for audio transcript."""
+        from google.generativeai.types import HarmCategory, HarmBlockThreshold
 
-        mime_type = "audio/mp3" if audio_path.endswith(".mp3") else "audio/webm"
         for attempt in range(3):
             try:
                 response = self.model_instance.generate_content(
                 [
                     {"text": "."},
-                    {"mime_type": mime_type, "data": base64_audio}
+                    audio_part
                 ],
                 safety_settings={
                     HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
@@ -84,6 +127,7 @@ class TranscriptAPI(BaseGeminiAPI):
                     return response
                 logger.warning(f"Empty response on attempt {attempt + 1}")
             except Exception as e:
+                GEMINI_ERRORS.inc()
                 logger.error(f"Error on attempt {attempt + 1}: {e}")
                 
         return None
@@ -97,7 +141,8 @@ class SentimentAPI(BaseGeminiAPI):
             logger.error("Model not initialized")
             return None
             
-        response = self._generate_response(text)
+        with SENTIMENT_SECONDS.time():
+            response = self._generate_response(text)
         return self._parse_response(response) if response else None
         
     @handle_exceptions
@@ -111,6 +156,7 @@ class SentimentAPI(BaseGeminiAPI):
                     return response
                 logger.warning(f"Empty response on attempt {attempt + 1}")
             except Exception as e:
+                GEMINI_ERRORS.inc()
                 logger.error(f"Error on attempt {attempt + 1}: {e}")
                 
         return None
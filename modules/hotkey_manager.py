@@ -1,28 +1,45 @@
-import keyboard
 import logging
+from typing import List
 from .decorators import log_errors
 
 logger = logging.getLogger(__name__)
 
 class HotkeyManager:
-    def __init__(self, playlist_manager, aimp_controller):
-        self.playlist_manager = playlist_manager
-        self.aimp_controller = aimp_controller
+    """Keyboard shortcuts; each one acts on every zone."""
+
+    def __init__(self, zones: List, job_runner):
+        self.zones = zones
+        self.job_runner = job_runner
         self._setup_hotkeys()
 
     def _setup_hotkeys(self):
         """Setup all hotkey bindings."""
         self.hotkey_mappings = {
-            'p': self.aimp_controller.stop_audio_device,
-            's': self.aimp_controller.start_audio_device,
-            'u': self.playlist_manager.update_playlist,
-            'l': self.playlist_manager.update_playlist_local,
-            'z': self.aimp_controller.play_song
+            'p': lambda: self._each_zone(lambda zone: zone.aimp_controller.stop_audio_device()),
+            's': lambda: self._each_zone(lambda zone: zone.aimp_controller.start_audio_device()),
+            'u': self._submit_update,
+            'l': self._submit_update_local,
+            'z': lambda: self._each_zone(lambda zone: zone.aimp_controller.play_song())
         }
 
+    def _each_zone(self, action):
+        for zone in self.zones:
+            action(zone)
+
+    def _submit_update(self):
+        """Run the backend update off the keyboard thread."""
+        for zone in self.zones:
+            self.job_runner.submit(zone.update_job, zone.playlist_manager.update_playlist)
+
+    def _submit_update_local(self):
+        """Run the local update off the keyboard thread."""
+        for zone in self.zones:
+            self.job_runner.submit(zone.update_local_job, zone.playlist_manager.update_playlist_local)
+
     @log_errors
     def start_hotkey_listener(self):
         """Start listening for hotkeys."""
+        import keyboard
         for key, callback in self.hotkey_mappings.items():
             keyboard.add_hotkey(key, callback)
         
@@ -0,0 +1,134 @@
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PLAYLIST_UPDATE_JOB = "playlist_update"
+PLAYLIST_UPDATE_LOCAL_JOB = "playlist_update_local"
+
+
+class Job:
+    """One background run with its status, progress counters and cancellation flag."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.status = "pending"
+        self.progress: Dict[str, int] = {}
+        self.triggers = 1
+        self.error: Optional[str] = None
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def report(self, **progress: int) -> None:
+        """Set progress counters to the given values."""
+        with self._lock:
+            self.progress.update(progress)
+
+    def increment(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self.progress[key] = self.progress.get(key, 0) + amount
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'name': self.name,
+                'status': self.status,
+                'triggers': self.triggers,
+                'progress': dict(self.progress),
+                'cancel_requested': self.cancelled,
+                'error': self.error,
+                'started_at': self.started_at.isoformat() if self.started_at else None,
+                'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            }
+
+
+class JobRunner:
+    """Run jobs off the calling thread, at most one per name at a time.
+
+    A trigger for a name that is already running does not start a second run; it
+    is coalesced into the active one and gets the same Job back. Only triggers of
+    the same kind of work may share a name: work of different kinds that must not
+    overlap (a zone's backend and local playlist updates) gets separate names and
+    excludes itself with a lock, so one kind never swallows a trigger of the other.
+    """
+
+    def __init__(self, history_size: int = 20):
+        self._active: Dict[str, Job] = {}
+        self._history: Deque[Job] = deque(maxlen=history_size)
+        self._lock = threading.Lock()
+
+    def submit(self, name: str, func: Callable[[Job], Any]) -> Job:
+        """Start func(job) in a background thread unless a job with this name is active."""
+        with self._lock:
+            active = self._active.get(name)
+            if active:
+                active.triggers += 1
+                logger.info(f"Job {name} already {active.status} - coalescing trigger #{active.triggers}")
+                return active
+            job = Job(name)
+            self._active[name] = job
+
+        threading.Thread(target=self._run, args=(job, func), daemon=True, name=f"Job-{name}").start()
+        return job
+
+    def run(self, name: str, func: Callable[[Job], Any]) -> Job:
+        """Submit and block until the (possibly coalesced) job finishes."""
+        job = self.submit(name, func)
+        job.wait()
+        return job
+
+    def cancel(self, name: str) -> bool:
+        with self._lock:
+            job = self._active.get(name)
+        if not job:
+            return False
+        job.cancel()
+        logger.info(f"Cancellation requested for job {name}")
+        return True
+
+    def is_running(self, *names: str) -> bool:
+        """True while a job with one of these names, or a per-zone variant "<name>:<zone>", is active."""
+        with self._lock:
+            return any(active == name or active.startswith(f"{name}:") for active in self._active for name in names)
+
+    def status(self) -> List[Dict[str, Any]]:
+        """Return active jobs followed by recently finished ones, newest first."""
+        with self._lock:
+            jobs = list(self._active.values()) + list(reversed(self._history))
+        return [job.to_dict() for job in jobs]
+
+    def _run(self, job: Job, func: Callable[[Job], Any]) -> None:
+        job.status = "running"
+        job.started_at = datetime.now()
+        logger.info(f"Job {job.name} started")
+        try:
+            func(job)
+            job.status = "cancelled" if job.cancelled else "done"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            logger.error(f"Job {job.name} failed: {e}", exc_info=True)
+        finally:
+            job.finished_at = datetime.now()
+            with self._lock:
+                self._active.pop(job.name, None)
+                self._history.append(job)
+            job._done.set()
+            logger.info(f"Job {job.name} {job.status} after "
+                        f"{(job.finished_at - job.started_at).total_seconds():.0f}s, progress: {job.progress}")
@@ -0,0 +1,193 @@
+import os
+import logging
+import threading
+import time
+from typing import Callable, List, Optional, Set
+
+from modules.library_index import LibraryIndex
+
+logger = logging.getLogger(__name__)
+
+
+class LibraryCache:
+    """Keep the audio library under a byte budget, evicting least recently played files first.
+
+    Sizes are tracked incrementally from add()/remove() calls, the directory is only
+    scanned once at start. Eviction runs on a background thread and stops at
+    low_watermark * budget so it does not fire again after every download. Pinned
+    files (explicit pins plus whatever pinned_provider returns, e.g. the current AIMP
+    queue) are never evicted. Listeners registered with subscribe() are told about
+    every file that enters or leaves the library.
+    """
+
+    def __init__(self, folder: str, index: LibraryIndex, budget_bytes: int,
+                 pinned_provider: Optional[Callable[[], Set[str]]] = None,
+                 low_watermark: float = 0.9):
+        self.folder = folder
+        self.index = index
+        self.budget_bytes = budget_bytes
+        self.pinned_provider = pinned_provider
+        self.low_watermark = low_watermark
+        self.total_bytes = 0
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+        self._add_listeners: List[Callable[[str], None]] = []
+        self._remove_listeners: List[Callable[[str], None]] = []
+        self._lock = threading.RLock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+
+    def subscribe(self, on_add: Optional[Callable[[str], None]] = None,
+                  on_remove: Optional[Callable[[str], None]] = None) -> None:
+        """on_add gets the full path of a new file, on_remove the basename of a file that is gone."""
+        if on_add:
+            self._add_listeners.append(on_add)
+        if on_remove:
+            self._remove_listeners.append(on_remove)
+
+    def start(self) -> None:
+        self.scan()
+        threading.Thread(target=self._run, daemon=True, name="LibraryEviction").start()
+        self._wakeup.set()
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._wakeup.set()
+
+    def scan(self) -> None:
+        """Reconcile the index with the folder once: index new files, drop vanished ones."""
+        os.makedirs(self.folder, exist_ok=True)
+        present = {name for name in os.listdir(self.folder) if not name.startswith('.')}
+        with self._lock:
+            for basename in list(self.index.entries()):
+                if basename not in present:
+                    self.index.remove(basename)
+            total = 0
+            for basename in present:
+                entry = self.index.get(basename)
+                if entry is None or entry.get('size') is None:
+                    path = os.path.join(self.folder, basename)
+                    size = os.path.getsize(path)
+                    self.index.update(basename, size=size, added=os.path.getmtime(path))
+                else:
+                    size = entry['size']
+                total += size
+            self.total_bytes = total
+        logger.info(f"Audio library: {len(present)} files, {self.total_bytes / 1024 ** 2:.1f} MiB "
+                    f"of {self.budget_bytes / 1024 ** 2:.0f} MiB budget")
+
+    def add(self, path: str) -> None:
+        """Account for a file that was just moved into the library."""
+        basename = os.path.basename(path)
+        size = os.path.getsize(path)
+        with self._lock:
+            previous = self.index.get(basename)
+            if previous and previous.get('size') is not None:
+                self.total_bytes -= previous['size']
+            self.index.update(basename, size=size, added=time.time())
+            self.total_bytes += size
+            over_budget = self.total_bytes > self.budget_bytes
+        self._notify(self._add_listeners, path)
+        if over_budget:
+            self._wakeup.set()
+
+    def remove(self, basename: str) -> None:
+        """Account for a file that left the library outside of eviction."""
+        with self._lock:
+            entry = self.index.remove(basename)
+            if entry and entry.get('size') is not None:
+                self.total_bytes -= entry['size']
+        self._notify(self._remove_listeners, basename)
+
+    def replace(self, basename: str, path: str, **fields) -> None:
+        """Account for a file replaced by a new version (possibly under a new name), keeping its history."""
+        entry = self.index.get(basename) or {}
+        kept = {key: entry[key] for key in ('last_played', 'pinned', 'added', 'duplicate_of') if key in entry}
+        if os.path.basename(path) != basename:
+            self.remove(basename)
+        self.add(path)
+        self.index.update(os.path.basename(path), **kept, **fields)
+
+    def delete(self, basename: str) -> bool:
+        """Delete a library file and account for it; False if the file could not be removed."""
+        path = os.path.join(self.folder, basename)
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            # Plik moze byc wlasnie odtwarzany, sprobujemy przy nastepnym przebiegu
+            logger.warning(f"Could not delete {basename}: {e}")
+            return False
+        self.remove(basename)
+        return True
+
+    def touch(self, basename: str) -> None:
+        """Mark a file as played now."""
+        if basename in self.index:
+            self.index.update(basename, last_played=time.time())
+
+    def pin(self, basename: str) -> None:
+        self.index.update(basename, pinned=True)
+
+    def unpin(self, basename: str) -> None:
+        if basename in self.index:
+            self.index.update(basename, pinned=False)
+
+    def duration(self, path: str):
+        return self.index.duration(path)
+
+    def evict(self) -> int:
+        """Delete least recently played unpinned files until under the low watermark; return bytes freed."""
+        with self._lock:
+            if self.total_bytes <= self.budget_bytes:
+                return 0
+            target = self.budget_bytes * self.low_watermark
+            pinned = self.pinned_songs()
+            candidates = sorted(
+                ((basename, entry) for basename, entry in self.index.entries().items()
+                 if not entry.get('pinned') and basename not in pinned),
+                key=lambda item: item[1].get('last_played') or item[1].get('added') or 0)
+
+        freed = 0
+        for basename, entry in candidates:
+            if self.total_bytes <= target:
+                break
+            if not self.delete(basename):
+                continue
+            freed += entry.get('size') or 0
+            self.evicted_files += 1
+            self.evicted_bytes += entry.get('size') or 0
+            logger.info(f"Evicted {basename} from the audio library ({(entry.get('size') or 0) / 1024 ** 2:.1f} MiB)")
+
+        if self.total_bytes > self.budget_bytes:
+            logger.warning(f"Audio library still over budget after eviction: "
+                           f"{self.total_bytes / 1024 ** 2:.1f} MiB (pinned files cannot be evicted)")
+        return freed
+
+    def pinned_songs(self) -> Set[str]:
+        """Basenames that are pinned right now (e.g. queued in AIMP), without the explicit pins."""
+        if not self.pinned_provider:
+            return set()
+        try:
+            return set(self.pinned_provider())
+        except Exception as e:
+            logger.error(f"Error reading pinned songs: {e}")
+            return set()
+
+    def _notify(self, listeners: List[Callable[[str], None]], value: str) -> None:
+        for listener in listeners:
+            try:
+                listener(value)
+            except Exception as e:
+                logger.error(f"Error in library listener: {e}")
+
+    def _run(self) -> None:
+        while not self._stopped:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            if self._stopped:
+                break
+            try:
+                self.evict()
+            except Exception as e:
+                logger.error(f"Error evicting audio library files: {e}")
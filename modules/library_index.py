@@ -0,0 +1,86 @@
+import json
+import os
+import logging
+import threading
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LibraryIndex:
+    """Per-file metadata of the audio library (size, last played, duration, ...) persisted as JSON.
+
+    Keys are file basenames. Writes go to a temp file that is atomically renamed,
+    so a crash never leaves a truncated index behind.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.RLock()
+        self._load()
+
+    def get(self, basename: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(basename)
+            return dict(entry) if entry else None
+
+    def update(self, basename: str, **fields) -> None:
+        with self._lock:
+            self._entries.setdefault(basename, {}).update(fields)
+            self._save()
+
+    def remove(self, basename: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.pop(basename, None)
+            if entry is not None:
+                self._save()
+            return entry
+
+    def entries(self) -> Dict[str, Dict[str, Any]]:
+        """Return a copy of all entries."""
+        with self._lock:
+            return {basename: dict(entry) for basename, entry in self._entries.items()}
+
+    def __contains__(self, basename: str) -> bool:
+        with self._lock:
+            return basename in self._entries
+
+    def duration(self, path: str) -> Optional[timedelta]:
+        """Return the indexed duration of a file, probing it once with moviepy if unknown."""
+        basename = os.path.basename(path)
+        entry = self.get(basename)
+        if entry and entry.get('duration') is not None:
+            return timedelta(seconds=entry['duration'])
+
+        try:
+            from moviepy.editor import AudioFileClip
+            audio = AudioFileClip(path)
+            seconds = audio.duration
+            audio.close()
+        except Exception as e:
+            logger.error(f"Error calculating duration for {path}: {e}")
+            return None
+        self.update(basename, duration=seconds)
+        return timedelta(seconds=seconds)
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading library index {self.path}: {e}")
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        try:
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            logger.error(f"Error saving library index {self.path}: {e}")
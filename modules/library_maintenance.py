@@ -0,0 +1,250 @@
+import hashlib
+import os
+import logging
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from .fingerprint import fingerprint_file
+from .job_runner import PLAYLIST_UPDATE_JOB, PLAYLIST_UPDATE_LOCAL_JOB
+from .utils import ffmpeg_binary
+
+logger = logging.getLogger(__name__)
+
+# In-progress transcodes are dot-files, which the library scan and local song picks skip
+TEMP_PREFIX = ".transcode-"
+
+
+def _lower_priority() -> None:
+    """Pool initializer: run transcodes at a lower CPU priority than the player and the update."""
+    if hasattr(os, "nice"):
+        try:
+            os.nice(10)
+        except OSError:
+            pass
+
+
+def _probe_duration(path: str) -> float:
+    from moviepy.editor import AudioFileClip
+    audio = AudioFileClip(path)
+    duration = audio.duration
+    audio.close()
+    return duration
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def transcode_file(source: str, temp_path: str, bitrate: str, tolerance: float = 1.0) -> Dict[str, Any]:
+    """Transcode source to an MP3 at temp_path and verify it (runs in a pool process).
+
+    The output must be non-empty and its duration must match the source within
+    tolerance seconds, otherwise the temp file is removed and an error is raised.
+    """
+    command = [ffmpeg_binary(), "-y", "-v", "error", "-i", source,
+               "-vn", "-ac", "2", "-ar", "44100", "-b:a", bitrate, "-f", "mp3", temp_path]
+    # BELOW_NORMAL_PRIORITY_CLASS exists only on Windows
+    creationflags = getattr(subprocess, "BELOW_NORMAL_PRIORITY_CLASS", 0)
+    result = subprocess.run(command, capture_output=True, text=True, creationflags=creationflags)
+    try:
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with {result.returncode}: {result.stderr.strip()[-300:]}")
+        if not os.path.exists(temp_path) or os.path.getsize(temp_path) == 0:
+            raise RuntimeError("ffmpeg produced no output")
+
+        source_duration = _probe_duration(source)
+        duration = _probe_duration(temp_path)
+        if abs(duration - source_duration) > tolerance:
+            raise RuntimeError(f"duration mismatch: source {source_duration:.1f}s, output {duration:.1f}s")
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return {
+        'duration': duration,
+        'sha256': _sha256(temp_path),
+        'source_size': os.path.getsize(source),
+        'size': os.path.getsize(temp_path),
+    }
+
+
+class LibraryMaintenance:
+    """Low-priority worker that transcodes the library to one compact format.
+
+    Files are handed one at a time to a process pool, verified, swapped in
+    with os.replace and recorded in the library index together with their
+    duration and SHA-256. Nothing new is started while a playlist update job is
+    running, and files that are queued in AIMP or were already played today are
+    left alone so their basenames stay valid for the rest of the day.
+
+    The same pass fingerprints library files that have no fingerprint yet, so
+    songs downloaded before fingerprinting existed can still be matched. A
+    library file that turns out to be a copy of another library song is only
+    marked duplicate_of in the index, so breaks are not filled with both;
+    nothing is deleted and no verdict is recorded, since these files were
+    never vetted.
+    """
+
+    def __init__(self, library_cache, job_runner=None, bitrate: str = "128k", workers: int = 1,
+                 interval: float = 600.0, skip_provider=None, fingerprints=None):
+        self.library_cache = library_cache
+        self.job_runner = job_runner
+        self.bitrate = bitrate
+        self.workers = workers
+        self.interval = interval
+        self.skip_provider = skip_provider
+        self.fingerprints = fingerprints
+        self.target_format = f"mp3-{bitrate}"
+        self.stats = {'transcoded': 0, 'failed': 0, 'bytes_saved': 0, 'fingerprinted': 0, 'duplicates': 0}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._wakeup = threading.Event()
+        self._stopped = False
+
+    def start(self) -> None:
+        self._remove_stale_temp_files()
+        self.library_cache.subscribe(on_add=lambda path: self._wakeup.set())
+        threading.Thread(target=self._run, daemon=True, name="LibraryMaintenance").start()
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._wakeup.set()
+        if self._pool:
+            self._pool.shutdown(cancel_futures=True)
+
+    def pending(self) -> List[str]:
+        """Basenames that still need transcoding."""
+        skip = self._skipped()
+        return sorted(
+            basename for basename, entry in self.library_cache.index.entries().items()
+            if entry.get('format') != self.target_format
+            and not entry.get('transcode_failed')
+            and not basename.startswith(TEMP_PREFIX)
+            and basename not in skip
+        )
+
+    def pending_fingerprints(self) -> List[str]:
+        """Basenames of library files without a fingerprint."""
+        if self.fingerprints is None:
+            return []
+        return sorted(
+            basename for basename, entry in self.library_cache.index.entries().items()
+            if os.path.splitext(basename)[0] not in self.fingerprints
+            and not entry.get('fingerprint_failed')
+            and not basename.startswith(TEMP_PREFIX)
+        )
+
+    def run_once(self) -> int:
+        """Transcode and fingerprint pending files until done, stopped or an update starts; return files processed."""
+        done = 0
+        for basename in self.pending():
+            if self._stopped or self._update_running():
+                return done
+            if basename in self._skipped():
+                continue
+            if self._transcode(basename):
+                done += 1
+        for basename in self.pending_fingerprints():
+            if self._stopped or self._update_running():
+                return done
+            if self._fingerprint(basename):
+                done += 1
+        return done
+
+    def _transcode(self, basename: str) -> bool:
+        folder = self.library_cache.folder
+        source = os.path.join(folder, basename)
+        if not os.path.exists(source):
+            return False
+        stem = os.path.splitext(basename)[0]
+        temp_path = os.path.join(folder, f"{TEMP_PREFIX}{stem}.mp3")
+        target = os.path.join(folder, f"{stem}.mp3")
+
+        try:
+            result = self._get_pool().submit(transcode_file, source, temp_path, self.bitrate).result()
+        except Exception as e:
+            self.stats['failed'] += 1
+            logger.error(f"Transcoding {basename} failed: {e}")
+            # Nie probujemy w kolko tego samego pliku
+            self.library_cache.index.update(basename, transcode_failed=True)
+            return False
+
+        os.replace(temp_path, target)
+        if target != source:
+            os.remove(source)
+        self.library_cache.replace(basename, target, format=self.target_format,
+                                   duration=result['duration'], sha256=result['sha256'])
+
+        saved = result['source_size'] - result['size']
+        self.stats['transcoded'] += 1
+        self.stats['bytes_saved'] += saved
+        logger.info(f"Transcoded {basename} -> {os.path.basename(target)} "
+                    f"({result['source_size'] / 1024 ** 2:.1f} -> {result['size'] / 1024 ** 2:.1f} MiB)")
+        return True
+
+    def _fingerprint(self, basename: str) -> bool:
+        path = os.path.join(self.library_cache.folder, basename)
+        if not os.path.exists(path):
+            return False
+        video_id = os.path.splitext(basename)[0]
+        try:
+            hashes = self._get_pool().submit(fingerprint_file, path).result()
+        except Exception as e:
+            logger.error(f"Fingerprinting {basename} failed: {e}")
+            self.library_cache.index.update(basename, fingerprint_failed=True)
+            return False
+
+        match = self.fingerprints.match(hashes, exclude=video_id)
+        self.fingerprints.add(video_id, hashes)
+        self.stats['fingerprinted'] += 1
+        if match and self._in_library(match[0]):
+            # Nie usuwamy i nie zapisujemy werdyktu - plik nigdy nie byl weryfikowany
+            logger.info(f"Library file {basename} is a copy of {match[0]} - it will not be used to fill breaks")
+            self.library_cache.index.update(basename, duplicate_of=match[0])
+            self.stats['duplicates'] += 1
+        return True
+
+    def _in_library(self, video_id: str) -> bool:
+        return any(os.path.splitext(basename)[0] == video_id for basename in self.library_cache.index.entries())
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_lower_priority)
+        return self._pool
+
+    def _update_running(self) -> bool:
+        return bool(self.job_runner and self.job_runner.is_running(PLAYLIST_UPDATE_JOB, PLAYLIST_UPDATE_LOCAL_JOB))
+
+    def _skipped(self) -> set:
+        skip = self.library_cache.pinned_songs()
+        if self.skip_provider:
+            try:
+                skip.update(self.skip_provider() or [])
+            except Exception as e:
+                logger.error(f"Error reading songs to skip: {e}")
+        return skip
+
+    def _remove_stale_temp_files(self) -> None:
+        folder = self.library_cache.folder
+        for basename in os.listdir(folder):
+            if basename.startswith(TEMP_PREFIX):
+                os.remove(os.path.join(folder, basename))
+
+    def _run(self) -> None:
+        while not self._stopped:
+            try:
+                if self._update_running():
+                    self._wakeup.wait(timeout=30)
+                    self._wakeup.clear()
+                    continue
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Error in library maintenance: {e}")
+            self._wakeup.wait(timeout=self.interval)
+            self._wakeup.clear()
@@ -0,0 +1,295 @@
+import os
+import threading
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from a fast AIMP add up to a slow full-track transcription
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _label_suffix(labels: Optional[Dict[str, str]]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in sorted(labels.items())) + "}"
+
+
+class Counter:
+    """Monotonic counter."""
+
+    def __init__(self, name: str, help_text: str, labels: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter",
+                f"{self.name}{_label_suffix(self.labels)} {self.value}"]
+
+
+class Gauge:
+    """Point-in-time value, either set explicitly or read from a callback at scrape time."""
+
+    def __init__(self, name: str, help_text: str, callback: Optional[Callable[[], float]] = None,
+                 labels: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+        self.labels = labels
+        self.value = 0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def render(self) -> List[str]:
+        value = self.value
+        if self.callback:
+            try:
+                value = self.callback()
+            except Exception:
+                value = float('nan')
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge",
+                f"{self.name}{_label_suffix(self.labels)} {value}"]
+
+
+class Histogram:
+    """Cumulative-bucket histogram.
+
+    observe() is a bisect plus two additions with no lock: under the GIL a
+    concurrent sample can very rarely be lost, which is an acceptable trade for
+    keeping the hook well under a microsecond.
+    """
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def time(self) -> "_Timer":
+        """Context manager observing the duration of its block."""
+        return _Timer(self)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        counts = list(self.counts)
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        cumulative += counts[-1]
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        elapsed = perf_counter() - self.started
+        histogram = self.histogram
+        histogram.counts[bisect_left(histogram.buckets, elapsed)] += 1
+        histogram.sum += elapsed
+        return False
+
+
+class MetricsRegistry:
+    """Named metrics rendered together in the Prometheus text exposition format.
+
+    Counters and gauges may carry labels (e.g. the zone); each label set is its
+    own series, and the series of one name are rendered together under a single
+    HELP/TYPE header.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str, labels: Optional[Dict[str, str]] = None) -> Counter:
+        return self._register(name + _label_suffix(labels), lambda: Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, callback: Optional[Callable[[], float]] = None,
+              labels: Optional[Dict[str, str]] = None) -> Gauge:
+        gauge = self._register(name + _label_suffix(labels), lambda: Gauge(name, help_text, callback, labels))
+        if callback:
+            gauge.callback = callback
+        return gauge
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(name, lambda: Histogram(name, help_text, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        families: Dict[str, List[object]] = {}
+        for metric in metrics:
+            families.setdefault(metric.name, []).append(metric)
+        lines = []
+        for family in families.values():
+            for i, metric in enumerate(family):
+                rendered = metric.render()
+                lines.extend(rendered if i == 0 else [line for line in rendered if not line.startswith('# ')])
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, name: str, factory: Callable[[], object]):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = factory()
+            return self._metrics[name]
+
+
+registry = MetricsRegistry()
+
+# Pipeline stage latencies
+DOWNLOAD_SECONDS = registry.histogram("radio_download_seconds", "YouTube audio download latency")
+TRANSCRIPTION_SECONDS = registry.histogram("radio_transcription_seconds", "Gemini audio transcription latency")
+PROFANITY_SECONDS = registry.histogram("radio_profanity_scan_seconds", "Local profanity scan latency")
+SENTIMENT_SECONDS = registry.histogram("radio_sentiment_seconds", "Gemini sentiment analysis latency")
+AIMP_ADD_SECONDS = registry.histogram("radio_aimp_add_seconds", "Latency of adding a song to the AIMP playlist")
+AIMP_CONNECT_SECONDS = registry.histogram("radio_aimp_connect_seconds",
+                                          "Time from launching or reconnecting AIMP until it answers")
+
+# Downloads
+DOWNLOAD_BYTES = registry.counter("radio_download_bytes_total", "Audio bytes downloaded from YouTube")
+DOWNLOAD_RESUMED_BYTES = registry.counter("radio_download_resumed_bytes_total",
+                                          "Bytes already on disk when a download was continued instead of restarted")
+DOWNLOAD_CHUNK_RETRIES = registry.counter("radio_download_chunk_retries_total", "Failed download chunks retried")
+AUDIO_BUDGET_WAITS = registry.counter("radio_audio_budget_waits_total",
+                                      "Downloads that waited for vetting to free the audio budget")
+AUDIO_BUDGET_WAIT_SECONDS = registry.histogram("radio_audio_budget_wait_seconds",
+                                               "Time downloads waited for the audio budget")
+
+# Vote stream
+VOTES_RECEIVED = registry.counter("radio_votes_received_total", "New voted songs received between playlist updates")
+VOTE_STREAM_RECONNECTS = registry.counter("radio_vote_stream_reconnects_total",
+                                          "Dropped vote stream connections that were retried")
+
+# Peer sync
+PEER_CHANGES_APPLIED = registry.counter("radio_peer_changes_applied_total",
+                                        "Verdicts, blacklist additions and file announcements taken from peers")
+PEER_FILES_FETCHED = registry.counter("radio_peer_files_fetched_total", "Accepted songs fetched from a peer")
+PEER_BYTES_FETCHED = registry.counter("radio_peer_bytes_fetched_total", "Audio bytes fetched from peers")
+PEER_SYNC_ERRORS = registry.counter("radio_peer_sync_errors_total", "Failed peer sync requests and fetches")
+
+# Song outcomes
+SONGS_ACCEPTED = registry.counter("radio_songs_accepted_total", "Voted songs accepted and queued")
+SONGS_REJECTED = registry.counter("radio_songs_rejected_total", "Voted songs rejected by vetting")
+SONGS_CACHED = registry.counter("radio_songs_cached_total", "Voted songs served from the local library")
+SONGS_FROM_PEERS = registry.counter("radio_songs_from_peers_total",
+                                    "Voted songs accepted by a peer's verdict and fetched from it, without vetting")
+SONGS_BLACKLISTED = registry.counter("radio_songs_blacklisted_total", "Voted songs skipped because they are blacklisted")
+SONGS_CARRIED = registry.counter("radio_songs_carried_total",
+                                 "Voted songs carried over to the next update (deadline or full break)")
+SONGS_DEDUPLICATED = registry.counter("radio_songs_deduplicated_total",
+                                      "Voted songs recognised by fingerprint as a copy of an already vetted song")
+
+# Caption-first transcription
+CAPTION_SECONDS = registry.histogram("radio_caption_fetch_seconds", "Latency of fetching YouTube captions as lyrics")
+CAPTION_HITS = registry.counter("radio_caption_hits_total", "Songs whose lyrics came from YouTube captions")
+CAPTION_MISSES = registry.counter("radio_caption_misses_total", "Songs without usable captions, transcribed from audio")
+TRANSCRIPTION_SECONDS_SAVED = registry.counter(
+    "radio_transcription_seconds_saved_total",
+    "Estimated Gemini transcription time saved by captions (mean transcription latency minus caption latency)")
+
+# Partial-audio early reject
+EARLY_REJECTS = registry.counter("radio_early_rejects_total",
+                                 "Songs rejected on the profanity check of their opening segment")
+PARTIAL_BYTES_SAVED = registry.counter("radio_partial_download_bytes_saved_total",
+                                       "Audio bytes never downloaded because a song was rejected on a partial download")
+EARLY_REJECT_AUDIO_SECONDS_SAVED = registry.counter(
+    "radio_early_reject_audio_seconds_saved_total",
+    "Seconds of audio not sent to Gemini transcription thanks to early rejects")
+
+# Local pre-screen
+PRESCREEN_DECISIONS = registry.counter("radio_prescreen_decisions_total",
+                                       "Sentiment verdicts made locally, i.e. Gemini calls saved")
+PRESCREEN_AUDITS = registry.counter("radio_prescreen_audits_total",
+                                    "Local verdicts double-checked with Gemini")
+PRESCREEN_DISAGREEMENTS = registry.counter("radio_prescreen_disagreements_total",
+                                           "Audited local verdicts that Gemini disagreed with")
+
+# Errors
+GEMINI_ERRORS = registry.counter("radio_gemini_errors_total", "Failed Gemini generate_content attempts")
+BACKEND_ERRORS = registry.counter("radio_backend_errors_total", "Failed requests to the voting backend")
+
+
+def register_library_gauges(audio_folder: str, played_songs: Callable[[], List[str]],
+                            blacklisted_songs: Callable[[], List[str]]) -> Tuple[Gauge, Gauge, Gauge]:
+    """Register gauges that read library, unplayed-pool and blacklist sizes at scrape time."""
+    def library_files() -> List[str]:
+        return os.listdir(audio_folder) if os.path.exists(audio_folder) else []
+
+    def unplayed() -> int:
+        played = set(played_songs() or [])
+        return sum(1 for name in library_files() if name not in played)
+
+    return (
+        registry.gauge("radio_library_songs", "Songs in the local audio library", lambda: len(library_files())),
+        registry.gauge("radio_unplayed_pool_songs", "Library songs not played today", unplayed),
+        registry.gauge("radio_blacklist_songs", "Songs on the blacklist", lambda: len(blacklisted_songs() or [])),
+    )
+
+
+def zone_counters(zone: str) -> Dict[str, Counter]:
+    """Per-zone update and queue counters, labelled with the zone name."""
+    labels = {'zone': zone}
+    return {
+        'updates': registry.counter("radio_zone_updates_total", "Playlist updates run in the zone", labels),
+        'update_seconds': registry.counter("radio_zone_update_seconds_total",
+                                           "Time spent in playlist updates of the zone", labels),
+        'songs_queued': registry.counter("radio_zone_songs_queued_total",
+                                         "Songs added to the zone's player", labels),
+    }
+
+
+def aimp_counters(zone: str) -> Dict[str, Counter]:
+    """Per-zone counters of the AIMP supervisor, labelled with the zone name."""
+    labels = {'zone': zone}
+    return {
+        'restarts': registry.counter("radio_aimp_restarts_total",
+                                     "AIMP restarts by the supervisor (closed or hung player)", labels),
+        'reconnects': registry.counter("radio_aimp_reconnects_total",
+                                       "Lost AIMP connections re-established without a restart", labels),
+        'hangs': registry.counter("radio_aimp_hangs_total", "AIMP probes that got no answer in time", labels),
+    }
+
+
+def register_zone_gauges(zone: str, playlist: Callable[[], List[str]],
+                         connected: Callable[[], bool]) -> Tuple[Gauge, Gauge]:
+    """Register gauges for the songs queued in a zone's player and whether the player is reachable."""
+    labels = {'zone': zone}
+    return (
+        registry.gauge("radio_zone_queued_songs", "Songs queued in the zone's player",
+                       lambda: len(playlist()), labels),
+        registry.gauge("radio_zone_player_connected", "1 while the zone's player is reachable",
+                       lambda: int(bool(connected())), labels),
+    )
+
+
+def register_library_cache_gauges(library_cache) -> Tuple[Gauge, Gauge, Gauge]:
+    """Register gauges for the library cache size, budget and evictions."""
+    return (
+        registry.gauge("radio_library_bytes", "Bytes used by the audio library", lambda: library_cache.total_bytes),
+        registry.gauge("radio_library_budget_bytes", "Byte budget of the audio library",
+                       lambda: library_cache.budget_bytes),
+        registry.gauge("radio_library_evicted_files", "Files evicted from the audio library since start",
+                       lambda: library_cache.evicted_files),
+    )
@@ -0,0 +1,379 @@
+import hashlib
+import json
+import os
+import logging
+import shutil
+import threading
+from datetime import datetime
+from threading import Thread
+from typing import Any, Dict, List, Optional
+
+import requests
+from flask import Flask, jsonify, request, send_file
+from wsgiref.simple_server import make_server
+
+from .metrics import (
+    PEER_CHANGES_APPLIED,
+    PEER_FILES_FETCHED,
+    PEER_BYTES_FETCHED,
+    PEER_SYNC_ERRORS
+)
+from .request_manager import _ThreadingWSGIServer, _QuietRequestHandler
+
+logger = logging.getLogger(__name__)
+
+CHANGES_PAGE_SIZE = 500
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PeerSync:
+    """Exchanges verdicts, blacklist additions and library files with other playout nodes.
+
+    Every local change - a recorded verdict, a blacklisted song, a file that
+    entered the library - is appended to a change log under an increasing
+    sequence number. Peers pull GET /sync/changes?since=<cursor> and keep the
+    last number they applied, so each round transfers only what is new.
+    Verdicts are merged by updated_at (the later one wins), blacklist additions
+    are a union. Files are content-addressed: a change only announces the
+    sha256, and the audio is pulled from GET /sync/audio/<sha256> when a voted
+    song needs it (fetch()), then checked against the hash before it enters the
+    library - so the song needs neither a YouTube download nor Gemini.
+    """
+
+    def __init__(self, node_id: str, verdict_cache, library_cache, blacklist_file: str, temp_folder: str,
+                 peers: List[str], port: int = 5060, interval: float = 60,
+                 log_path: Optional[str] = None, state_path: Optional[str] = None, timeout: float = 10):
+        self.node_id = node_id
+        self.verdict_cache = verdict_cache
+        self.library_cache = library_cache
+        self.blacklist_file = blacklist_file
+        self.temp_folder = temp_folder
+        self.peers = [peer.rstrip('/') for peer in peers]
+        self.port = port
+        self.interval = interval
+        self.log_path = log_path
+        self.state_path = state_path
+        self.timeout = timeout
+        self._lock = threading.RLock()
+        self._log: List[Dict[str, Any]] = []
+        self._blacklisted: set = set()
+        self._files: Dict[str, str] = {}  # sha256 -> library basename
+        self._pending_files: List[str] = []
+        self._cursors: Dict[str, int] = {}
+        self._remote_files: Dict[str, Dict[str, Any]] = {}  # video_id -> announced file
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self.server = None
+        self.app = self._create_app()
+        self._load()
+
+    def start(self) -> None:
+        """Start serving changes and audio, and pulling from the peers in the background."""
+        self.verdict_cache.subscribe(self._on_verdict)
+        self.library_cache.subscribe(on_add=self._on_library_add, on_remove=self._on_library_remove)
+        self.server = make_server('0.0.0.0', self.port, self.app,
+                                  server_class=_ThreadingWSGIServer,
+                                  handler_class=_QuietRequestHandler)
+        Thread(target=self.server.serve_forever, daemon=True, name="PeerSyncServer").start()
+        Thread(target=self._run, daemon=True, name="PeerSync").start()
+        logger.info(f"Peer sync {self.node_id} on port {self.port}, peers: {', '.join(self.peers) or 'none'}")
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._wakeup.set()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def sync_now(self) -> int:
+        """Run one round: record new local changes, then pull from every peer; returns changes applied."""
+        self._collect_local_changes()
+        return sum(self._pull(peer) for peer in self.peers)
+
+    def changes(self, since: int, limit: int = CHANGES_PAGE_SIZE) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(change) for change in self._log[since:since + limit]]
+
+    @property
+    def head(self) -> int:
+        with self._lock:
+            return len(self._log)
+
+    def accepted_file(self, video_id: str) -> Optional[Dict[str, Any]]:
+        """The file a peer announced for a song accepted by its verdict, unless the library has it."""
+        with self._lock:
+            announced = self._remote_files.get(video_id)
+        if not announced:
+            return None
+        verdict = self.verdict_cache.get(video_id)
+        if not verdict or not verdict.get('accepted'):
+            return None
+        if os.path.exists(os.path.join(self.library_cache.folder, announced['name'])):
+            return None
+        return dict(announced)
+
+    def fetch(self, video_id: str) -> Optional[str]:
+        """Pull an accepted song from the peer that has it into the library; its path, or None."""
+        announced = self.accepted_file(video_id)
+        if not announced:
+            return None
+        os.makedirs(self.temp_folder, exist_ok=True)
+        temp_path = os.path.join(self.temp_folder, f"{announced['name']}.peer")
+        url = f"{announced['peer']}/sync/audio/{announced['sha256']}"
+        try:
+            digest = hashlib.sha256()
+            size = 0
+            with requests.get(url, stream=True, timeout=self.timeout) as response:
+                if response.status_code == 404:
+                    # Peer już nie ma pliku (eviction) - piosenka przejdzie zwykłą ścieżkę
+                    logger.info(f"Peer {announced['peer']} no longer has {announced['name']}")
+                    with self._lock:
+                        self._remote_files.pop(video_id, None)
+                    return None
+                response.raise_for_status()
+                with open(temp_path, 'wb') as f:
+                    for chunk in response.iter_content(HASH_CHUNK_BYTES):
+                        digest.update(chunk)
+                        size += len(chunk)
+                        f.write(chunk)
+            if digest.hexdigest() != announced['sha256']:
+                raise ValueError(f"sha256 mismatch for {announced['name']}")
+            final_path = os.path.join(self.library_cache.folder, announced['name'])
+            shutil.move(temp_path, final_path)
+            self.library_cache.add(final_path)
+            PEER_FILES_FETCHED.inc()
+            PEER_BYTES_FETCHED.inc(size)
+            logger.info(f"Fetched {announced['name']} ({size / 1024 ** 2:.1f} MiB) from {announced['peer']}")
+            return final_path
+        except Exception as e:
+            PEER_SYNC_ERRORS.inc()
+            logger.warning(f"Could not fetch {announced['name']} from {announced['peer']}: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return None
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'node': self.node_id,
+                'head': len(self._log),
+                'cursors': dict(self._cursors),
+                'files': len(self._files),
+                'remote_files': len(self._remote_files),
+            }
+
+    # Zmiany lokalne
+
+    def _append(self, change: Dict[str, Any]) -> None:
+        with self._lock:
+            change = {'seq': len(self._log) + 1, **change}
+            self._log.append(change)
+            if self.log_path:
+                try:
+                    with open(self.log_path, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(change, ensure_ascii=False) + '\n')
+                except Exception as e:
+                    logger.error(f"Error writing peer sync log {self.log_path}: {e}")
+
+    def _on_verdict(self, video_id: str, entry: Dict[str, Any]) -> None:
+        self._append({'kind': 'verdict', 'key': video_id, 'origin': self.node_id,
+                      'updated_at': entry.get('updated_at'), 'entry': entry})
+
+    def _on_library_add(self, path: str) -> None:
+        # Liczenie sha256 odbywa się w wątku synchronizacji, nie w aktualizacji playlisty
+        with self._lock:
+            self._pending_files.append(path)
+        self._wakeup.set()
+
+    def _on_library_remove(self, basename: str) -> None:
+        with self._lock:
+            self._files = {sha: name for sha, name in self._files.items() if name != basename}
+
+    def _collect_local_changes(self) -> None:
+        """Hash files that entered the library and log blacklist lines added since the last round."""
+        with self._lock:
+            pending, self._pending_files = self._pending_files, []
+        for path in pending:
+            if not os.path.exists(path):
+                continue
+            try:
+                sha256 = file_sha256(path)
+            except OSError as e:
+                logger.warning(f"Could not hash {path}: {e}")
+                continue
+            basename = os.path.basename(path)
+            self.library_cache.index.update(basename, sha256=sha256)
+            with self._lock:
+                self._files[sha256] = basename
+            self._append({'kind': 'file', 'key': basename, 'origin': self.node_id,
+                          'updated_at': datetime.now().isoformat(),
+                          'sha256': sha256, 'size': os.path.getsize(path)})
+
+        for basename in self._read_blacklist():
+            with self._lock:
+                if basename in self._blacklisted:
+                    continue
+                self._blacklisted.add(basename)
+            self._append({'kind': 'blacklist', 'key': basename, 'origin': self.node_id,
+                          'updated_at': datetime.now().isoformat()})
+
+    def _read_blacklist(self) -> List[str]:
+        if not os.path.exists(self.blacklist_file):
+            return []
+        with open(self.blacklist_file, 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+
+    # Zmiany od innych węzłów
+
+    def _pull(self, peer: str) -> int:
+        applied = 0
+        try:
+            while True:
+                cursor = self._cursors.get(peer, 0)
+                response = requests.get(f"{peer}/sync/changes", params={'since': cursor},
+                                        timeout=self.timeout)
+                response.raise_for_status()
+                data = response.json()
+                if data['head'] < cursor:
+                    # Dziennik węzła zaczął się od nowa - pełna synchronizacja, scalanie jest idempotentne
+                    logger.warning(f"Peer {peer} log restarted at {data['head']}, resyncing from the start")
+                    self._cursors[peer] = 0
+                    continue
+                for change in data['changes']:
+                    applied += self._apply(change, peer)
+                self._cursors[peer] = data['cursor']
+                if data['cursor'] >= data['head'] or not data['changes']:
+                    break
+        except Exception as e:
+            PEER_SYNC_ERRORS.inc()
+            logger.warning(f"Peer sync with {peer} failed: {e}")
+        self._save_state()
+        if applied:
+            logger.info(f"Applied {applied} changes from {peer}")
+        return applied
+
+    def _apply(self, change: Dict[str, Any], peer: str) -> int:
+        """Merge one change from a peer; returns 1 if it changed local state."""
+        if change.get('origin') == self.node_id:
+            return 0
+        kind, key = change['kind'], change['key']
+        forwarded = {name: value for name, value in change.items() if name != 'seq'}
+        if kind == 'verdict':
+            if not self.verdict_cache.merge(key, change['entry']):
+                return 0
+            self._append(forwarded)
+        elif kind == 'blacklist':
+            with self._lock:
+                if key in self._blacklisted or key in self._read_blacklist():
+                    self._blacklisted.add(key)
+                    return 0
+                self._blacklisted.add(key)
+                with open(self.blacklist_file, 'a', encoding='utf-8') as f:
+                    f.write(f"{key}\n")
+            logger.info(f"Added {key} to blacklist (from {change.get('origin')})")
+            self._append(forwarded)
+        elif kind == 'file':
+            # Ogłoszeń plików nie przekazujemy dalej - po pobraniu węzeł ogłosi własną kopię
+            video_id = os.path.splitext(key)[0]
+            with self._lock:
+                current = self._remote_files.get(video_id)
+                if current and current['updated_at'] >= change['updated_at']:
+                    return 0
+                self._remote_files[video_id] = {'name': key, 'sha256': change['sha256'], 'size': change['size'],
+                                                'peer': peer, 'updated_at': change['updated_at']}
+        else:
+            return 0
+        PEER_CHANGES_APPLIED.inc()
+        return 1
+
+    def _run(self) -> None:
+        while not self._stopped:
+            try:
+                self.sync_now()
+            except Exception as e:
+                logger.error(f"Error in peer sync: {e}")
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def _create_app(self) -> Flask:
+        app = Flask(__name__)
+
+        @app.route('/sync/changes', methods=['GET'])
+        def get_changes():
+            since = request.args.get('since', default=0, type=int)
+            limit = min(request.args.get('limit', default=CHANGES_PAGE_SIZE, type=int), CHANGES_PAGE_SIZE)
+            changes = self.changes(since, limit)
+            return jsonify({'node': self.node_id, 'changes': changes, 'head': self.head,
+                            'cursor': changes[-1]['seq'] if changes else since})
+
+        @app.route('/sync/audio/<sha256>', methods=['GET'])
+        def get_audio(sha256):
+            with self._lock:
+                basename = self._files.get(sha256)
+            path = os.path.join(self.library_cache.folder, basename) if basename else None
+            if not path or not os.path.exists(path):
+                return jsonify({'status': 'error', 'message': 'Not found'}), 404
+            return send_file(path, mimetype='application/octet-stream')
+
+        @app.route('/sync/status', methods=['GET'])
+        def get_status():
+            return jsonify({'status': 'success', 'sync': self.status()})
+
+        return app
+
+    # Stan na dysku
+
+    def _load(self) -> None:
+        if self.log_path and os.path.exists(self.log_path):
+            try:
+                with open(self.log_path, 'r', encoding='utf-8') as f:
+                    self._log = [json.loads(line) for line in f if line.strip()]
+            except Exception as e:
+                logger.error(f"Error loading peer sync log {self.log_path}: {e}")
+        else:
+            self._seed()
+        for change in self._log:
+            if change['kind'] == 'blacklist':
+                self._blacklisted.add(change['key'])
+        for basename, entry in self.library_cache.index.entries().items():
+            if entry.get('sha256'):
+                self._files[entry['sha256']] = basename
+
+        if self.state_path and os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                self._cursors = state.get('cursors', {})
+                self._remote_files = state.get('remote_files', {})
+            except Exception as e:
+                logger.error(f"Error loading peer sync state {self.state_path}: {e}")
+
+    def _seed(self) -> None:
+        """Start a new log with what this node already knows, so peers get its history too."""
+        for video_id, entry in self.verdict_cache.entries().items():
+            self._on_verdict(video_id, entry)
+        for basename in self.library_cache.index.entries():
+            self._pending_files.append(os.path.join(self.library_cache.folder, basename))
+        logger.info(f"Peer sync log seeded with {len(self._log)} verdicts, "
+                    f"{len(self._pending_files)} library files to hash")
+
+    def _save_state(self) -> None:
+        if not self.state_path:
+            return
+        try:
+            with self._lock:
+                state = {'cursors': dict(self._cursors), 'remote_files': dict(self._remote_files)}
+            temp_path = f"{self.state_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(temp_path, self.state_path)
+        except Exception as e:
+            logger.error(f"Error saving peer sync state {self.state_path}: {e}")
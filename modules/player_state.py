@@ -0,0 +1,110 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PlayerStateCache:
+    """Player state refreshed by a single owner thread.
+
+    Only the owner thread talks to the player; the main loop and HTTP endpoints
+    read snapshot(), so player IPC stays constant no matter how many readers
+    there are. While the player is unreachable the owner reconnects with an
+    exponential backoff instead of on every read - or, with a supervisor, leaves
+    reconnecting and restarting to it and only wakes it up.
+    """
+
+    def __init__(self, aimp_controller, ttl: float = 1.0, max_backoff: float = 30.0, supervisor=None):
+        self.aimp_controller = aimp_controller
+        self.supervisor = supervisor
+        self.ttl = ttl
+        self.max_backoff = max_backoff
+        self._state: Dict[str, Any] = {
+            'track': None,
+            'position_ms': None,
+            'volume': None,
+            'state': 'unknown',
+            'connected': False,
+            'consecutive_failures': 0,
+            'last_error': None,
+            'updated_at': None,
+        }
+        self._updated_monotonic: Optional[float] = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._backoff = ttl
+        self._next_connect_attempt = 0.0
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, daemon=True, name="PlayerState").start()
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._wakeup.set()
+
+    def invalidate(self) -> None:
+        """Ask the owner thread to refresh now, e.g. after a player command."""
+        self._wakeup.set()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a consistent copy of the last known state with its age in seconds."""
+        with self._lock:
+            state = dict(self._state)
+            updated = self._updated_monotonic
+        state['age_seconds'] = round(time.monotonic() - updated, 3) if updated else None
+        state['stale'] = updated is None or state['age_seconds'] > 3 * self.ttl
+        if self.supervisor:
+            state['supervisor'] = self.supervisor.stats()
+        return state
+
+    def refresh(self) -> None:
+        """Poll the player once (owner thread only)."""
+        if not self.aimp_controller.client:
+            if self.supervisor:
+                self._record_failure("AIMP not connected")
+                return
+            if time.monotonic() < self._next_connect_attempt:
+                return
+            self.aimp_controller.connect_to_aimp(stop=False)
+            if not self.aimp_controller.client:
+                self._record_failure("AIMP not reachable")
+                return
+
+        try:
+            player_state = self.aimp_controller.read_player_state()
+        except Exception as e:
+            self.aimp_controller.client = None
+            self._record_failure(str(e))
+            if self.supervisor:
+                self.supervisor.wake()
+            return
+
+        self._backoff = self.ttl
+        with self._lock:
+            self._state.update(player_state)
+            self._state.update(connected=True, consecutive_failures=0, last_error=None,
+                               updated_at=datetime.now().isoformat())
+            self._updated_monotonic = time.monotonic()
+
+    def _record_failure(self, error: str) -> None:
+        self._next_connect_attempt = time.monotonic() + self._backoff
+        self._backoff = min(self._backoff * 2, self.max_backoff)
+        with self._lock:
+            failures = self._state['consecutive_failures'] + 1
+            self._state.update(connected=False, state='unknown', consecutive_failures=failures,
+                               last_error=error)
+        if failures == 1:
+            logger.warning(f"Lost connection to player: {error}")
+
+    def _run(self) -> None:
+        while not self._stopped:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing player state: {e}")
+            self._wakeup.wait(timeout=self.ttl)
+            self._wakeup.clear()
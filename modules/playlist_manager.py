@@ -1,42 +1,142 @@
 from datetime import timedelta, datetime
-from time import sleep
+from time import sleep, perf_counter
 import os
 import shutil
 import logging
-from random import choice
-from typing import List, Optional
-from moviepy.editor import AudioFileClip
+import threading
+from random import random, shuffle
+from contextlib import nullcontext
+from typing import Callable, Iterable, List, Optional
 from .decorators import log_errors, handle_exceptions
 from .exceptions import PlaylistUpdateError
+from .job_runner import Job
+from .tracing import SongTrace, UpdateTrace
+from .fingerprint import fingerprint_file
+from .playlist_packer import break_seconds, estimate_durations, pack_library
+from .vetting_budget import CarryOver, CostModel, UpdateBudget, next_deadline
+from .update_journal import UpdateJournal
+from .profiling import profiler
+from .song_locks import SongLocks
+from .vote_queue import VoteQueue
+from .metrics import (
+    SONGS_ACCEPTED,
+    SONGS_REJECTED,
+    SONGS_CACHED,
+    SONGS_BLACKLISTED,
+    SONGS_DEDUPLICATED,
+    SONGS_CARRIED,
+    SONGS_FROM_PEERS,
+    PRESCREEN_DECISIONS,
+    PRESCREEN_AUDITS,
+    PRESCREEN_DISAGREEMENTS,
+    CAPTION_HITS,
+    CAPTION_MISSES,
+    CAPTION_SECONDS,
+    TRANSCRIPTION_SECONDS,
+    TRANSCRIPTION_SECONDS_SAVED,
+    EARLY_REJECTS,
+    PARTIAL_BYTES_SAVED,
+    EARLY_REJECT_AUDIO_SECONDS_SAVED,
+    zone_counters,
+    register_library_gauges,
+    register_library_cache_gauges
+)
 import os
 from typing import List
 from .decorators import handle_exceptions
 from config import PLAYED_SONGS_FILE
 import logging
 from config import (
+    DEBUG_PAYLOADS,
+    TRACE_DIR,
     AUDIO_FOLDER_PATH,
     AUDIO_FOLDER_TEMP_PATH,
     BLACKLISTED_SONGS,
-    PLAYED_SONGS_FILE
+    PLAYED_SONGS_FILE,
+    DEVICE_START_TIMES,
+    DEVICE_STOP_TIMES,
+    PLAYLIST_FILL_TOLERANCE_SECONDS,
+    SCHEDULE_SAFETY_MARGIN_SECONDS
 )
 
 logger = logging.getLogger(__name__)
 
 class PlaylistManager:
     def __init__(self, aimp_controller, youtube_downloader, text_analyzer, 
-                 transcript_api, sentiment_api, request_manager):
+                 transcript_api, sentiment_api, request_manager,
+                 audio_folder: str = AUDIO_FOLDER_PATH,
+                 temp_folder: str = AUDIO_FOLDER_TEMP_PATH,
+                 played_songs_file: str = PLAYED_SONGS_FILE,
+                 blacklist_file: str = BLACKLISTED_SONGS,
+                 trace_dir: Optional[str] = TRACE_DIR,
+                 library_cache=None,
+                 fingerprints=None,
+                 verdict_cache=None,
+                 prescreen=None,
+                 prescreen_audit_rate: float = 0.0,
+                 use_captions: bool = False,
+                 early_reject_seconds: Optional[float] = None,
+                 fill_tolerance: int = PLAYLIST_FILL_TOLERANCE_SECONDS,
+                 time_source: Callable[[], datetime] = datetime.now,
+                 carry_over: Optional[CarryOver] = None,
+                 cost_model: Optional[CostModel] = None,
+                 journal: Optional[UpdateJournal] = None,
+                 vote_queue: Optional[VoteQueue] = None,
+                 zone: str = "main",
+                 start_times: List[str] = DEVICE_START_TIMES,
+                 stop_times: List[str] = DEVICE_STOP_TIMES,
+                 song_locks: Optional[SongLocks] = None,
+                 peer_sync=None,
+                 audio_budget=None):
         self.aimp_controller = aimp_controller
         self.youtube_downloader = youtube_downloader
         self.text_analyzer = text_analyzer
         self.transcript_api = transcript_api
         self.sentiment_api = sentiment_api
         self.request_manager = request_manager
+        self.audio_folder = audio_folder
+        self.temp_folder = temp_folder
+        self.played_songs_file = played_songs_file
+        self.blacklist_file = blacklist_file
+        self.trace_dir = trace_dir
+        self.library_cache = library_cache
+        self.fingerprints = fingerprints
+        self.verdict_cache = verdict_cache
+        self.prescreen = prescreen
+        self.prescreen_audit_rate = prescreen_audit_rate
+        self.use_captions = use_captions
+        self.early_reject_seconds = early_reject_seconds
+        self.fill_tolerance = fill_tolerance
+        self.time_source = time_source
+        self.carry_over = carry_over or CarryOver(today=lambda: self.time_source().date())
+        self.cost_model = cost_model or CostModel()
+        self.journal = journal or UpdateJournal()
+        self.vote_queue = vote_queue or VoteQueue()
+        self.zone = zone
+        self.start_times = start_times
+        self.stop_times = stop_times
+        # Aktualizacja z backendu i lokalna tej strefy wykluczają się nawzajem
+        self.update_lock = threading.Lock()
+        # Wspólne dla stref korzystających z tego samego silnika weryfikacji
+        self.song_locks = song_locks or SongLocks()
+        self.zone_metrics = zone_counters(zone)
+        self.peer_sync = peer_sync
+        self.audio_budget = audio_budget
+
+    def register_metrics(self):
+        """Expose library, unplayed-pool and blacklist sizes as metrics gauges."""
+        register_library_gauges(self.audio_folder, self.get_played_songs, self._get_blacklisted_songs)
+        if self.library_cache:
+            register_library_cache_gauges(self.library_cache)
 
-    def _clear_temp_folder(self):
-        """Clear all files from temp audio folder."""
-        if os.path.exists(AUDIO_FOLDER_TEMP_PATH):
-            for file in os.listdir(AUDIO_FOLDER_TEMP_PATH):
-                file_path = os.path.join(AUDIO_FOLDER_TEMP_PATH, file)
+    def _clear_temp_folder(self, keep: Iterable[str] = ()):
+        """Clear files from temp audio folder, except those of songs whose video_id is in keep."""
+        keep = tuple(keep)
+        if os.path.exists(self.temp_folder):
+            for file in os.listdir(self.temp_folder):
+                if keep and file.startswith(keep):
+                    continue
+                file_path = os.path.join(self.temp_folder, file)
                 try:
                     if os.path.isfile(file_path):
                         os.remove(file_path)
@@ -67,46 +167,296 @@ class PlaylistManager:
             self._update_playlist_duration(valid_songs)
             
     @log_errors
-    def update_playlist(self):
-        """Update playlist with songs from backend."""
+    def update_playlist(self, job: Optional[Job] = None):
+        """Update playlist with songs from backend.
+
+        When run through the JobRunner, progress (songs vetted/queued) is reported
+        on the job and a cancellation request stops the update between songs.
+
+        Songs are vetted in vote order against a time budget that ends at the
+        next device start. A song whose estimated vetting cost no longer fits the
+        budget, that is longer than what is left of the break (plus
+        fill_tolerance), or that comes after the break is already full, is
+        carried over to the next update instead of being dropped. So are the
+        songs a cancelled or failed update had not got to yet.
+
+        Progress is journaled per song; after a crash the next update of the day
+        re-queues what was already queued (if that break has not started yet),
+        keeps the journaled temp downloads and skips the stages that were completed.
+
+        Songs streamed in by the vote subscription since the last update are
+        merged with the fetched ones; their downloads were started on arrival.
+
+        Zones that share the vetting engine update side by side; only a song
+        voted in several zones is taken in turns (song_locks), so it is
+        downloaded and vetted once and the later zones find it in the library
+        and the verdict cache. The zone's backend and local updates exclude each
+        other through update_lock.
+
+        A profiling session armed through /profile/start profiles this run.
+        """
+        with self.update_lock, self.song_locks.update(self.zone):
+            started = perf_counter()
+            with profiler.update_session(f"update_{self.zone}"):
+                self._update_from_backend(job)
+            self._record_zone_update(started)
+
+    def _update_from_backend(self, job: Optional[Job]):
+        # Piosenki wzięte z kolejek głosów i przeniesień - nieprzetworzone wracają do przeniesień
+        taken: List[dict] = []
+        carried: List[dict] = []
+        next_song = 0
         try:
-            # Przygotuj AIMP i wyczyść temp folder
+            # Przygotuj AIMP i wyczyść temp folder (poza plikami przerwanej aktualizacji i nowych głosów)
             self.aimp_controller.prepare_for_update()
-            self._clear_temp_folder()
+            now = self.time_source()
+            resumed = self.journal.begin(now.date().isoformat(),
+                                         break_start=next_deadline(now, self.start_times, self.stop_times),
+                                         now=now)
+            streamed = self.vote_queue.take()
+            taken = streamed
+            keep = [self._video_id(song['url']) for song in streamed] + (self.journal.keys() if resumed else [])
+            self.song_locks.claim(self.zone, keep)
+            # Pliki, rezerwacje i pobrania innych trwających aktualizacji zostają
+            keep += self.song_locks.claimed_by_others(self.zone)
+            self._clear_temp_folder(keep=keep)
+            if self.audio_budget:
+                # Pliki poprzedniej aktualizacji usunięte, więc i ich rezerwacje
+                self.audio_budget.release_all(keep=keep)
+            update_trace = UpdateTrace(self.trace_dir)
             
             # Pobierz dane z backendu
-            playlist_data = self.request_manager.fetch_songs_from_backend()
-            total_duration = timedelta()
+            with update_trace.span('fetch') as span:
+                playlist_data = self.request_manager.fetch_songs_from_backend()
+                span['outcome'] = 'ok' if playlist_data else 'empty'
+            total_duration = self._requeue_journaled() if resumed and self.journal.requeue else timedelta()
+            playlist_data = self._vote_order(self.carry_over.take() + streamed + (playlist_data or []))
+            taken = playlist_data
             
             if playlist_data:
+                if job:
+                    job.report(voted=len(playlist_data))
+                now = self.time_source()
+                target = break_seconds(now, self.start_times, self.stop_times)
+                budget = UpdateBudget(
+                    next_deadline(now, self.start_times, self.stop_times, SCHEDULE_SAFETY_MARGIN_SECONDS),
+                    self.time_source
+                )
+                self.song_locks.claim(self.zone, [self._video_id(song['url']) for song in playlist_data])
+                self._prefetch(playlist_data, target)
                 # Przetwórz piosenki z backendu
-                valid_songs = []
-                for song in playlist_data:
-                    if self._process_song(song['url']):
-                        valid_songs.append(song)
-                        duration = timedelta(seconds=self._parse_duration(song['duration']))
-                        total_duration += duration
+                for next_song, song in enumerate(playlist_data):
+                    if self._is_cancelled(job):
+                        self.youtube_downloader.cancel_prefetch(keep=self._prefetch_to_keep())
+                        self._carry_over(carried + playlist_data[next_song:], job)
+                        self.journal.finish()
+                        update_trace.log_summary()
+                        return
+                    video_id = self._video_id(song['url'])
+                    if resumed and self._vetted_before_interruption(video_id):
+                        # Zweryfikowana przed awarią; jeśli przyjęta, już jest w kolejce
+                        continue
+                    if total_duration.total_seconds() >= target - self.fill_tolerance:
+                        carried.append(song)
+                        budget.carry('break_full')
+                        continue
+                    duration_seconds = self._parse_duration(song['duration'])
+                    if total_duration.total_seconds() + duration_seconds > target + self.fill_tolerance:
+                        # Nie zmieści się w tym, co zostało z przerwy - czeka na następną
+                        carried.append(song)
+                        budget.carry('too_long')
+                        continue
+                    cheap = self._is_known_song(song['url'])
+                    estimate = self.cost_model.estimate(duration_seconds, cheap)
+                    if not budget.fits(estimate):
+                        # Nie zdążymy przed przerwą - piosenka przechodzi do następnej aktualizacji
+                        logger.debug(f"Carrying {song['url']} over: about {estimate:.0f}s of vetting, "
+                                    f"{budget.remaining():.0f}s left")
+                        carried.append(song)
+                        budget.carry('deadline')
+                        continue
+
+                    started = self.time_source()
+                    trace = update_trace.song(song['url'])
+                    with self.song_locks.song(video_id):
+                        accepted = self._process_song(song['url'], trace)
+                    if self.audio_budget:
+                        # Piosenka w bibliotece albo usunięta - miejsce dla kolejnych pobrań
+                        self.audio_budget.release(video_id)
+                    update_trace.finish_song(trace, accepted)
+                    self.journal.record(video_id, 'done', accepted=accepted)
+                    actual = (self.time_source() - started).total_seconds()
+                    self.cost_model.observe(duration_seconds, cheap, actual)
+                    budget.record(estimate, actual)
+                    if job:
+                        job.increment('vetted')
+                    if accepted:
+                        total_duration += timedelta(seconds=duration_seconds)
+                        if job:
+                            job.increment('queued')
+
+                next_song = len(playlist_data)
+                if carried:
+                    self.youtube_downloader.cancel_prefetch(keep=self._prefetch_to_keep())
+                    self._carry_over(carried, job)
+                    carried = []
+                budget.log_summary()
+                update_trace.log_summary()
             
-            # Jeśli całkowity czas jest za krótki lub nie ma piosenek z backendu,
-            # uzupełnij lokalnymi piosenkami
-            while total_duration < timedelta(minutes=55):
-                song_path = self._get_random_local_song()
-                if not song_path:
-                    break
-                
-                duration = self._get_song_duration(song_path)
-                if duration:
-                    total_duration += duration
-                logger.info(f"Added local song {song_path} to playlist, total duration: {total_duration}")
+            # Jeśli głosowane piosenki nie wypełniają przerwy, uzupełnij lokalnymi piosenkami
+            total_duration = self._fill_break(total_duration, job)
+            self.journal.finish()
             
             logger.info(f"Final playlist duration: {total_duration}")
             
         except Exception as e:
+            # Dziennik zostaje na dysku, następna aktualizacja go wznowi
+            self.journal.close()
+            self._carry_over(carried + taken[next_song:], job)
             logger.error(f"Error updating playlist: {e}")
+            raise PlaylistUpdateError(f"Playlist update failed: {e}") from e
+
+    def _carry_over(self, songs: List[dict], job: Optional[Job] = None) -> None:
+        """Queue voted songs for the next update: cut off by the break, or left by a cancelled or failed run."""
+        if not songs:
+            return
+        kept = self.carry_over.put(songs)
+        if kept < len(songs):
+            logger.warning(f"Carry-over queue is full, dropped {len(songs) - kept} voted songs")
+        SONGS_CARRIED.inc(len(songs))
+        if job:
+            job.report(carried=len(songs))
+
+    def _requeue_journaled(self) -> timedelta:
+        """Put the songs queued before the interruption back on the fresh AIMP playlist."""
+        total_duration = timedelta()
+        for record in self.journal.queued():
+            if not os.path.exists(record['path']):
+                continue
+            self.aimp_controller.add_song_to_playlist(record['path'])
+            self.add_to_played_songs(os.path.basename(record['path']))
+            self.zone_metrics['songs_queued'].inc()
+            total_duration += self._get_song_duration(record['path']) or timedelta()
+        logger.info(f"Re-queued songs of the interrupted update, total duration: {total_duration}")
+        return total_duration
+
+    def _vetted_before_interruption(self, video_id: str) -> bool:
+        if self.journal.state(video_id).get('stage') == 'done':
+            return True
+        return any(os.path.splitext(os.path.basename(record['path']))[0] == video_id
+                   for record in self.journal.queued())
+
+    def _queue_song(self, path: str, trace: Optional[SongTrace] = None) -> None:
+        """Add a library song to AIMP and mark it played; journaled first so a restart re-queues it."""
+        basename = os.path.basename(path)
+        self.journal.record(basename, 'queued', path=path)
+        with trace.span('aimp_add') if trace else nullcontext():
+            self.aimp_controller.add_song_to_playlist(path)
+        self.add_to_played_songs(basename)
+        self.zone_metrics['songs_queued'].inc()
+
+    def _record_zone_update(self, started: float) -> None:
+        self.zone_metrics['updates'].inc()
+        self.zone_metrics['update_seconds'].inc(perf_counter() - started)
+
+    @staticmethod
+    def _video_id(url: str) -> str:
+        from pytubefix import extract
+        try:
+            return extract.video_id(url)
+        except Exception:
+            return url
+
+    def _journaled_download(self, video_id: str) -> Optional[str]:
+        """Temp download left by an interrupted update, if it is still intact."""
+        state = self.journal.state(video_id)
+        temp_path = state.get('temp_path')
+        if not temp_path or not os.path.exists(temp_path):
+            return None
+        size = os.path.getsize(temp_path)
+        partial = state.get('partial')
+        if partial and size == partial['size']:
+            # Pobieranie zostało dokończone przed awarią
+            return temp_path
+        if size != state.get('size'):
+            return None
+        if partial:
+            self.youtube_downloader.restore_partial(temp_path, partial)
+        return temp_path
+
+    def _prefetch(self, playlist_data: List[dict], target_seconds: float) -> None:
+        """Start downloads of the voted songs that vetting will not skip anyway.
+
+        Only the top-voted songs that can fill the break (with half a break extra
+        for rejects) are fetched; the rest would most likely be carried over.
+        """
+        from pytubefix import extract
+        skipped = self._get_blacklisted_songs() + self.get_played_songs()
+        urls = []
+        seconds = 0
+        for song in playlist_data:
+            if seconds >= target_seconds * 1.5:
+                break
+            try:
+                video_id = extract.video_id(song['url'])
+            except Exception:
+                continue
+            if self.journal.state(video_id).get('temp_path'):
+                continue
+            if not any(video_id in name for name in skipped):
+                urls.append(song['url'])
+                seconds += self._parse_duration(song['duration'])
+        self.youtube_downloader.prefetch(urls, prefix_seconds=self.early_reject_seconds)
+
+    def prepare_vote(self, song: dict) -> None:
+        """Start downloading a song voted between updates (called by the VoteQueue worker)."""
+        video_id = self._video_id(song['url'])
+        if self._is_known_song(song['url']) or any(video_id in name for name in self.get_played_songs()):
+            return
+        logger.debug(f"Prefetching newly voted {song['url']}")
+        self.youtube_downloader.prefetch([song['url']], prefix_seconds=self.early_reject_seconds)
+
+    def _streamed_video_ids(self) -> List[str]:
+        """Video ids of songs voted during the running update, already downloading for the next one."""
+        return [self._video_id(url) for url in self.vote_queue.urls()]
+
+    def _prefetch_to_keep(self) -> List[str]:
+        """Prefetches a cancelled or finished update must not drop: the next update's and other zones'."""
+        return self._streamed_video_ids() + self.song_locks.claimed_by_others(self.zone)
+
+    @staticmethod
+    def _vote_order(songs: List[dict]) -> List[dict]:
+        """Unique songs by url, most votes first; songs without vote counts keep their order."""
+        unique = {}
+        for song in songs:
+            unique[song['url']] = song
+        return sorted(unique.values(), key=lambda song: -int(song.get('votes') or 0))
+
+    def _is_known_song(self, url: str) -> bool:
+        """True for songs vetting settles without a download (in the library, accepted by a peer or blacklisted)."""
+        from pytubefix import extract
+        try:
+            video_id = extract.video_id(url)
+        except Exception:
+            return True
+        if self.youtube_downloader.cached_path(video_id):
+            return True
+        if self.peer_sync and self.peer_sync.accepted_file(video_id):
+            return True
+        return any(video_id in name for name in self._get_blacklisted_songs())
+
+    @staticmethod
+    def _is_cancelled(job: Optional[Job]) -> bool:
+        """Check for a cancellation request between songs."""
+        if job and job.cancelled:
+            logger.info(f"Playlist update cancelled, progress: {job.progress}")
+            return True
+        return False
 
     @log_errors
-    def _process_song(self, url: str) -> bool:
-        """Process a single song."""
+    def _process_song(self, url: str, trace: Optional[SongTrace] = None) -> bool:
+        """Process a single song, recording each pipeline stage as a span on the trace."""
+        trace = trace or SongTrace(url)
         try:
             from pytubefix import extract
             video_id = extract.video_id(url)
@@ -116,88 +466,368 @@ class PlaylistManager:
             for blacklisted_song in blacklisted_songs:
                 if video_id in blacklisted_song:
                     logger.info(f"Song with video_id {video_id} is blacklisted - skipping download")
+                    SONGS_BLACKLISTED.inc()
+                    trace.outcome = 'blacklisted'
                     return False
                 
             # Jeśli nie jest na blackliście, kontynuuj pobieranie
-            download_result = self.youtube_downloader.download_song(url)
+            self.journal.record(video_id, 'started')
+            if self.peer_sync and not self.youtube_downloader.cached_path(video_id):
+                peer_file = self.peer_sync.accepted_file(video_id)
+                queued = self._queue_peer_song(video_id, peer_file, trace) if peer_file else None
+                if queued is not None:
+                    return queued
+            journaled = self.journal.state(video_id)
+            resumed_path = self._journaled_download(video_id)
+            with trace.span('download') as span:
+                if resumed_path:
+                    download_result = (resumed_path, False)
+                elif self.early_reject_seconds:
+                    # Tryb progresywny: najpierw tylko początek utworu, reszta dla piosenek, które przejdą
+                    download_result = self.youtube_downloader.download_song(
+                        url, prefix_seconds=self.early_reject_seconds)
+                else:
+                    download_result = self.youtube_downloader.download_song(url)
+                span['outcome'] = ('failed' if not download_result else 'resumed' if resumed_path
+                                   else 'cached' if download_result[1] else 'ok')
             if not download_result:
+                trace.outcome = 'download_failed'
                 return False
             
             temp_path, is_cached = download_result
             basename = os.path.basename(temp_path)
+            if not is_cached and not resumed_path:
+                self.journal.record(video_id, 'downloaded', temp_path=temp_path, size=os.path.getsize(temp_path),
+                                    partial=self.youtube_downloader.partial_info(temp_path)
+                                    if self.early_reject_seconds else None)
 
             # Sprawdź czy piosenka była już odtworzona
             if basename in self.get_played_songs():
                 logger.info(f"Song {basename} already played")
-                if os.path.exists(temp_path) and not is_cached:
-                    os.remove(temp_path)
+                if not is_cached:
+                    self._discard_temp(temp_path)
+                trace.outcome = 'already_played'
                 return False
 
             # Sprawdź czy piosenka już istnieje w folderze audio
-            existing_path = os.path.join(AUDIO_FOLDER_PATH, basename)
+            existing_path = os.path.join(self.audio_folder, basename)
             if os.path.exists(existing_path):
                 logger.info(f"Song {basename} already exists in audio folder")
                 # Jeśli plik jest w temp, usuń go (bo mamy już w audio)
-                if os.path.exists(temp_path) and not is_cached:
-                    os.remove(temp_path)
-                self.aimp_controller.add_song_to_playlist(existing_path)
-                self.add_to_played_songs(basename)
+                if not is_cached:
+                    self._discard_temp(temp_path)
+                self._queue_song(existing_path, trace)
+                SONGS_CACHED.inc()
+                trace.outcome = 'cached'
                 return True
 
-            # Get and analyze lyrics
-            lyrics = self.transcript_api.analyze_audio(temp_path)
-            print(lyrics)
+            # Ten sam utwór pod innym video_id (lyric video, reupload) dziedziczy werdykt
+            hashes = None
+            if self.fingerprints is not None:
+                with trace.span('fingerprint') as span:
+                    hashes, match_id = self._match_fingerprint(temp_path, video_id)
+                    span['outcome'] = 'match' if match_id else 'new'
+                if match_id:
+                    inherited = self._inherit_verdict(match_id, video_id, temp_path, basename, trace, hashes)
+                    if inherited is not None:
+                        return inherited
+
+            # Get and analyze lyrics - najpierw napisy z YouTube, audio do Gemini tylko gdy ich brak
+            lyrics = journaled.get('lyrics') or self._caption_lyrics(url, trace)
+            early_result = None
+            if not lyrics and self._is_partial(temp_path):
+                lyrics, early_result = self._transcribe_progressively(temp_path, trace)
+            elif not lyrics:
+                with trace.span('transcription') as span:
+                    lyrics = self.transcript_api.analyze_audio(temp_path)
+                    span['outcome'] = 'ok' if lyrics else 'no_lyrics'
+            if early_result:
+                partial = self.youtube_downloader.partial_info(temp_path)
+                SONGS_REJECTED.inc()
+                EARLY_REJECTS.inc()
+                EARLY_REJECT_AUDIO_SECONDS_SAVED.inc(max(0.0, partial['duration'] - partial['prefix_seconds']))
+                self._add_to_blacklist(basename)
+                self._discard_temp(temp_path)
+                logger.info(f"Early reject of {basename} after the first {partial['prefix_seconds']:.0f}s: "
+                            f"{early_result['profanity_result']}")
+                trace.outcome = 'rejected_profanity_early'
+                self._record_verdict(video_id, 'rejected_profanity', hashes, transcript=lyrics, partial=True)
+                return False
+            if DEBUG_PAYLOADS:
+                logger.info(f"Lyrics for {basename}:\n{lyrics}")
+            if lyrics and not journaled.get('lyrics'):
+                self.journal.record(video_id, 'transcribed', lyrics=lyrics)
             if not lyrics:
+                SONGS_REJECTED.inc()
                 self._add_to_blacklist(basename)
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
+                self._discard_temp(temp_path)
                 logger.info(f"No lyrics found for {basename}")
+                trace.outcome = 'rejected_no_lyrics'
+                self._record_verdict(video_id, trace.outcome, hashes)
                 return False
             
             # Analyze text content
-            analysis_result = self.text_analyzer.analyze_text(lyrics)
+            with trace.span('profanity') as span:
+                analysis_result = self.text_analyzer.analyze_text(lyrics)
+                span['outcome'] = 'ok' if analysis_result['is_acceptable'] else 'rejected'
             if not analysis_result['is_acceptable']:
+                SONGS_REJECTED.inc()
                 self._add_to_blacklist(basename)
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
+                self._discard_temp(temp_path)
                 logger.info(f"Text analysis failed for {basename}, {analysis_result['profanity_result']}")
+                trace.outcome = 'rejected_profanity'
+                self._record_verdict(video_id, trace.outcome, hashes, transcript=lyrics)
                 return False
             
-            # Analyze sentiment and check if safe for radio
-            sentiment_result = self.sentiment_api.analyze_sentiment(lyrics)
+            # Analyze sentiment and check if safe for radio; pewne przypadki rozstrzyga lokalny pre-screen
+            local_result = None if journaled.get('sentiment') else self._prescreen(lyrics, trace)
+            if journaled.get('sentiment'):
+                sentiment_result = journaled['sentiment']
+            elif local_result and random() >= self.prescreen_audit_rate:
+                PRESCREEN_DECISIONS.inc()
+                sentiment_result = local_result
+            else:
+                with trace.span('sentiment') as span:
+                    sentiment_result = self.sentiment_api.analyze_sentiment(lyrics)
+                    span['outcome'] = ('no_result' if not sentiment_result
+                                       else 'ok' if sentiment_result.get('is_safe_for_radio', False) else 'rejected')
+                if local_result and sentiment_result:
+                    self._audit_prescreen(basename, local_result, sentiment_result)
+            if sentiment_result and not journaled.get('sentiment'):
+                self.journal.record(video_id, 'vetted', sentiment=sentiment_result)
             if not sentiment_result:
+                SONGS_REJECTED.inc()
                 self._add_to_blacklist(basename)
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
+                self._discard_temp(temp_path)
                 logger.info(f"No sentiment result for {basename}")
+                trace.outcome = 'rejected_no_sentiment'
+                self._record_verdict(video_id, trace.outcome, hashes, transcript=lyrics)
                 return False
             
             # Check if song is safe for radio
             if sentiment_result.get('is_safe_for_radio', False):
                 # If safe for radio, move to final location and add to playlist
-                final_path = os.path.join(AUDIO_FOLDER_PATH, basename)
-                try:
-                    shutil.move(temp_path, final_path)
-                    self.aimp_controller.add_song_to_playlist(final_path)
-                    self.add_to_played_songs(basename)
-                    logger.info(f"Successfully processed and added song: {basename}")
-                    return True
-                except Exception as e:
-                    logger.error(f"Error moving files for {basename}: {e}")
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
-                    return False
+                self._record_verdict(video_id, 'accepted', hashes, transcript=lyrics,
+                                     confidence=sentiment_result.get('confidence'),
+                                     source=sentiment_result.get('source'))
+                return self._accept_song(temp_path, basename, trace)
             else:
                 # If not safe for radio, add to blacklist and remove temp file
                 logger.info(f"Song {basename} rejected. Reason: {sentiment_result.get('explanation', 'Unknown')}")
+                SONGS_REJECTED.inc()
                 self._add_to_blacklist(basename)
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
+                self._discard_temp(temp_path)
+                trace.outcome = 'rejected_sentiment'
+                self._record_verdict(video_id, trace.outcome, hashes, transcript=lyrics,
+                                     confidence=sentiment_result.get('confidence'),
+                                     source=sentiment_result.get('source'))
                 return False
         except Exception as e:
             logger.error(f"Error processing song: {e}")
+            trace.outcome = 'error'
             return False
 
+    def _is_partial(self, temp_path: str) -> bool:
+        return bool(self.early_reject_seconds) and self.youtube_downloader.is_partial(temp_path)
+
+    def _complete_download(self, temp_path: str, trace: SongTrace) -> bool:
+        if not self._is_partial(temp_path):
+            return True
+        with trace.span('download') as span:
+            completed = self.youtube_downloader.complete_download(temp_path)
+            span['outcome'] = 'completed' if completed else 'failed'
+        return completed
+
+    def _discard_temp(self, temp_path: str) -> None:
+        """Remove a rejected download; for a partial one count the bytes that were never fetched."""
+        if self.early_reject_seconds:
+            partial = self.youtube_downloader.discard_partial(temp_path)
+            if partial:
+                PARTIAL_BYTES_SAVED.inc(max(0, partial['size'] - partial['prefix_bytes']))
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    def _transcribe_progressively(self, temp_path: str, trace: SongTrace):
+        """Transcribe the opening segment first and stop there if it already fails the profanity check.
+
+        Returns (lyrics, profanity result of an early reject or None). Songs that
+        survive get the rest downloaded and only the remainder transcribed.
+        """
+        seconds = self.youtube_downloader.partial_info(temp_path)['prefix_seconds']
+        prefix_lyrics = None
+        clip_path = self.youtube_downloader.clip(temp_path, 0, seconds)
+        if clip_path:
+            with trace.span('transcription') as span:
+                prefix_lyrics = self.transcript_api.analyze_audio(clip_path)
+                span['outcome'] = 'prefix' if prefix_lyrics else 'prefix_no_lyrics'
+            os.remove(clip_path)
+
+        if prefix_lyrics:
+            with trace.span('profanity') as span:
+                analysis_result = self.text_analyzer.analyze_text(prefix_lyrics)
+                span['outcome'] = 'ok' if analysis_result['is_acceptable'] else 'early_reject'
+            if not analysis_result['is_acceptable']:
+                return prefix_lyrics, analysis_result
+
+        if not self._complete_download(temp_path, trace):
+            raise RuntimeError(f"Could not complete download of {temp_path}")
+
+        # Początek jest już przepisany - do Gemini idzie tylko reszta utworu
+        rest_path = self.youtube_downloader.clip(temp_path, seconds) if prefix_lyrics else None
+        with trace.span('transcription') as span:
+            rest_lyrics = self.transcript_api.analyze_audio(rest_path or temp_path)
+            span['outcome'] = 'ok' if rest_lyrics else 'no_lyrics'
+        if rest_path:
+            os.remove(rest_path)
+            lyrics = "\n".join(part for part in (prefix_lyrics, rest_lyrics) if part)
+        else:
+            lyrics = rest_lyrics
+        return lyrics or None, None
+
+    def _caption_lyrics(self, url: str, trace: SongTrace) -> Optional[str]:
+        """Lyrics from the video's captions, or None when audio transcription is needed."""
+        if not self.use_captions:
+            return None
+        started = perf_counter()
+        with trace.span('captions') as span:
+            lyrics = self.youtube_downloader.fetch_captions(url)
+            span['outcome'] = 'hit' if lyrics else 'miss'
+        elapsed = perf_counter() - started
+        CAPTION_SECONDS.observe(elapsed)
+        if not lyrics:
+            CAPTION_MISSES.inc()
+            return None
+
+        CAPTION_HITS.inc()
+        # Oszczędność liczona względem średniego czasu transkrypcji audio w Gemini
+        transcriptions = sum(TRANSCRIPTION_SECONDS.counts)
+        if transcriptions:
+            average = TRANSCRIPTION_SECONDS.sum / transcriptions
+            TRANSCRIPTION_SECONDS_SAVED.inc(max(0.0, average - elapsed))
+        return lyrics
+
+    def _prescreen(self, lyrics: str, trace: SongTrace) -> Optional[dict]:
+        """Local sentiment verdict for clear-cut transcripts, None when Gemini has to decide."""
+        if not self.prescreen or not self.prescreen.ready:
+            return None
+        with trace.span('prescreen') as span:
+            is_safe, probability = self.prescreen.decide(lyrics)
+            span['outcome'] = 'uncertain' if is_safe is None else 'safe' if is_safe else 'unsafe'
+        if is_safe is None:
+            return None
+        return {
+            'is_safe_for_radio': is_safe,
+            'confidence': probability if is_safe else 1 - probability,
+            'explanation': f"pre-screen probability {probability:.3f}",
+            'source': 'prescreen',
+        }
+
+    def _audit_prescreen(self, basename: str, local_result: dict, sentiment_result: dict) -> None:
+        """Compare a sampled local verdict with Gemini to keep measuring the disagreement rate."""
+        PRESCREEN_AUDITS.inc()
+        if local_result['is_safe_for_radio'] != sentiment_result.get('is_safe_for_radio', False):
+            PRESCREEN_DISAGREEMENTS.inc()
+            logger.warning(f"Pre-screen disagrees with Gemini on {basename}: {local_result['explanation']}")
+
+    def train_prescreen(self):
+        """Retrain the pre-screen on the stored verdicts."""
+        if self.prescreen and self.verdict_cache is not None:
+            return self.prescreen.train_from(self.verdict_cache)
+        return None
+
+    def _accept_song(self, temp_path: str, basename: str, trace: SongTrace) -> bool:
+        """Move a vetted song into the library and queue it."""
+        final_path = os.path.join(self.audio_folder, basename)
+        try:
+            if not self._complete_download(temp_path, trace):
+                raise RuntimeError("download could not be completed")
+            shutil.move(temp_path, final_path)
+            if self.library_cache:
+                self.library_cache.add(final_path)
+            self._queue_song(final_path, trace)
+            SONGS_ACCEPTED.inc()
+            logger.info(f"Successfully processed and added song: {basename}")
+            trace.outcome = 'accepted'
+            return True
+        except Exception as e:
+            logger.error(f"Error moving files for {basename}: {e}")
+            self._discard_temp(temp_path)
+            trace.outcome = 'error'
+            return False
+
+    def _queue_peer_song(self, video_id: str, peer_file, trace: SongTrace) -> Optional[bool]:
+        """Queue a song another node already accepted, fetching its file from that node instead of vetting it.
+
+        None when the fetch failed and the song has to be downloaded and vetted as usual.
+        """
+        if peer_file['name'] in self.get_played_songs():
+            logger.info(f"Song {peer_file['name']} already played")
+            trace.outcome = 'already_played'
+            return False
+        with trace.span('peer_fetch') as span:
+            path = self.peer_sync.fetch(video_id)
+            span['outcome'] = 'ok' if path else 'failed'
+        if not path:
+            return None
+        self._queue_song(path, trace)
+        SONGS_FROM_PEERS.inc()
+        logger.info(f"Song {peer_file['name']} accepted by {peer_file['peer']}, queued without vetting")
+        trace.outcome = 'peer'
+        return True
+
+    def _match_fingerprint(self, temp_path: str, video_id: str):
+        """Fingerprint a download and look it up; return (hashes, matching video_id or None)."""
+        try:
+            hashes = fingerprint_file(temp_path)
+        except Exception as e:
+            logger.error(f"Error fingerprinting {temp_path}: {e}")
+            return None, None
+        match = self.fingerprints.match(hashes, exclude=video_id)
+        return hashes, match[0] if match else None
+
+    def _inherit_verdict(self, match_id: str, video_id: str, temp_path: str, basename: str,
+                         trace: SongTrace, hashes) -> Optional[bool]:
+        """Apply the verdict of an already vetted copy; None if there is none and the song must be vetted."""
+        verdict = self.verdict_cache.get(match_id) if self.verdict_cache else None
+        if not verdict:
+            return None
+
+        logger.info(f"Song {basename} is a copy of {match_id}, inheriting verdict {verdict['outcome']}")
+        SONGS_DEDUPLICATED.inc()
+        self._record_verdict(video_id, verdict['outcome'], hashes, confidence=verdict.get('confidence'),
+                             inherited_from=match_id)
+        if not verdict['accepted']:
+            SONGS_REJECTED.inc()
+            self._add_to_blacklist(basename)
+            self._discard_temp(temp_path)
+            trace.outcome = 'duplicate_rejected'
+            return False
+
+        library_path = self.youtube_downloader.cached_path(match_id)
+        if not library_path and verdict.get('inherited_from'):
+            library_path = self.youtube_downloader.cached_path(verdict['inherited_from'])
+        if not library_path:
+            # Oryginał wypadł z biblioteki - przyjmujemy kopię bez ponownej weryfikacji
+            return self._accept_song(temp_path, basename, trace)
+
+        self._discard_temp(temp_path)
+        library_basename = os.path.basename(library_path)
+        if library_basename in self.get_played_songs():
+            logger.info(f"Song {library_basename} already played")
+            trace.outcome = 'duplicate_played'
+            return False
+        self._queue_song(library_path, trace)
+        SONGS_CACHED.inc()
+        trace.outcome = 'duplicate_cached'
+        return True
+
+    def _record_verdict(self, video_id: str, outcome: str, hashes=None, **fields) -> None:
+        """Remember a vetting verdict and the song's fingerprint for later copies."""
+        if self.verdict_cache is not None:
+            self.verdict_cache.record(video_id, outcome, **fields)
+        if self.fingerprints is not None and hashes is not None:
+            self.fingerprints.add(video_id, hashes)
+
     def _add_to_blacklist(self, basename: str):
         """Add song to blacklist if not already present."""
         try:
@@ -206,7 +836,7 @@ class PlaylistManager:
             
             # Sprawdź czy piosenka już jest na liście
             if basename not in blacklisted_songs:
-                with open(BLACKLISTED_SONGS, 'a', encoding='utf-8') as f:
+                with open(self.blacklist_file, 'a', encoding='utf-8') as f:
                     f.write(f"{basename}\n")
                 logger.info(f"Added {basename} to blacklist")
             else:
@@ -217,12 +847,12 @@ class PlaylistManager:
     def _get_blacklisted_songs(self) -> List[str]:
         """Get list of blacklisted songs."""
         try:
-            if not os.path.exists(BLACKLISTED_SONGS):
-                with open(BLACKLISTED_SONGS, 'w', encoding='utf-8') as f:
+            if not os.path.exists(self.blacklist_file):
+                with open(self.blacklist_file, 'w', encoding='utf-8') as f:
                     f.write('')
                 return []
                 
-            with open(BLACKLISTED_SONGS, 'r', encoding='utf-8') as f:
+            with open(self.blacklist_file, 'r', encoding='utf-8') as f:
                 return [line.strip() for line in f if line.strip()]
         except Exception as e:
             logger.error(f"Error reading blacklisted songs: {e}")
@@ -232,67 +862,82 @@ class PlaylistManager:
 
     @log_errors
     def _update_playlist_duration(self, data):
-        """Update playlist duration to meet minimum threshold."""
+        """Top up the playlist so that it fills the next break."""
         total_duration = timedelta(seconds=sum(
             self._parse_duration(song['duration']) for song in data
         ))
-
-        while total_duration < timedelta(minutes=5):
-            total_duration = self._time_calc(total_duration)
-
+        total_duration = self._fill_break(total_duration)
         logger.info(f"Updated playlist duration: {total_duration}")
 
     @log_errors
-    def update_playlist_local(self):
+    def update_playlist_local(self, job: Optional[Job] = None):
         """Update playlist from local files."""
-        self.aimp_controller.prepare_for_update()
-        total_duration = timedelta()
-        
-        while total_duration < timedelta(minutes=5):
-            song_path = self._get_random_local_song()
-            if not song_path:
-                break
-                
-            duration = self._get_song_duration(song_path)
-            if duration:
-                total_duration += duration
-                self.aimp_controller.add_song_to_playlist(song_path)
-                
+        with self.update_lock:
+            started = perf_counter()
+            self.aimp_controller.prepare_for_update()
+            total_duration = self._fill_break(timedelta(), job)
+            self._record_zone_update(started)
         logger.info(f"Local playlist updated, total duration: {total_duration}")
 
-    def _time_calc(self, time1_obj: timedelta) -> timedelta:
-        """Calculate the sum of a given time with a random song duration."""
-        time2_obj = self._get_song_duration(self._get_random_local_song())
-        return time1_obj + time2_obj if time2_obj else time1_obj
-        
-    @log_errors
-    def _get_random_local_song(self) -> Optional[str]:
-        """Fetch a random song that hasn't been played."""
-        files_list = os.listdir(AUDIO_FOLDER_PATH)
-        logger.debug(f"Available files: {files_list}")
-        
-        while files_list:
-            random_song = choice(files_list)
-            logger.debug(f"Randomly selected song: {random_song}")
-            played_songs = self.get_played_songs()
-            logger.debug(f"Played songs: {played_songs}")
-            
-            if random_song not in played_songs:
-                self.add_to_played_songs(random_song)
-                full_path = os.path.join(AUDIO_FOLDER_PATH, random_song)
-                self.aimp_controller.add_song_to_playlist(full_path)
-                return full_path
-                
-        logger.warning("No unplayed songs available.")
-        return None
-        
+    def _fill_break(self, total_duration: timedelta, job: Optional[Job] = None) -> timedelta:
+        """Queue library songs whose durations add up to what the next break still needs.
+
+        The songs are picked by subset-sum over durations known from the library
+        index (or estimated from file sizes), so the queue ends within
+        fill_tolerance of the break instead of a whole song past it, and only the
+        picked songs have their durations probed. If no mix gets that close, the
+        smallest one running past the break is queued when it overshoots by less
+        than the alternative falls short; otherwise the break is left short.
+        """
+        target = break_seconds(self.time_source(), self.start_times, self.stop_times)
+        remaining = int(target - total_duration.total_seconds())
+        if remaining <= self.fill_tolerance:
+            return total_duration
+
+        candidates = self._get_unplayed_local_songs()
+        if not candidates:
+            logger.warning("No unplayed songs available.")
+            return total_duration
+        shuffle(candidates)
+        entries = self.library_cache.index.entries() if self.library_cache else {}
+        songs = pack_library(candidates, remaining, self.fill_tolerance,
+                             estimate_durations(candidates, entries), self._probe_local_duration)
+
+        for basename, seconds in songs:
+            if self._is_cancelled(job):
+                break
+            self._queue_song(os.path.join(self.audio_folder, basename))
+            total_duration += timedelta(seconds=seconds)
+            if job:
+                job.increment('queued')
+            logger.info(f"Added local song {basename} to playlist, total duration: {total_duration}")
+        return total_duration
+
+    def _get_unplayed_local_songs(self) -> List[str]:
+        """Basenames of library songs that haven't been played, without copies of other library songs."""
+        played_songs = set(self.get_played_songs())
+        entries = self.library_cache.index.entries() if self.library_cache else {}
+        in_library = {os.path.splitext(name)[0] for name in entries}
+        # Pliki zaczynajace sie od kropki to niedokonczone transkodowania
+        return [name for name in os.listdir(self.audio_folder)
+                if not name.startswith('.') and name not in played_songs
+                and (entries.get(name) or {}).get('duplicate_of') not in in_library]
+
+    def _probe_local_duration(self, basename: str) -> Optional[float]:
+        duration = self._get_song_duration(os.path.join(self.audio_folder, basename))
+        return duration.total_seconds() if duration else None
+
     @log_errors
     def _get_song_duration(self, song_path: str) -> Optional[timedelta]:
         """Get duration of a song."""
         if not song_path:
             return None
-            
+
+        if self.library_cache and os.path.dirname(os.path.abspath(song_path)) == os.path.abspath(self.audio_folder):
+            return self.library_cache.duration(song_path)
+
         try:
+            from moviepy.editor import AudioFileClip
             audio = AudioFileClip(song_path)
             duration = timedelta(seconds=audio.duration)
             audio.close()
@@ -314,11 +959,15 @@ class PlaylistManager:
 
     @handle_exceptions
     def add_to_played_songs(self, basename: str) -> None:
-        """Add song to played songs file."""
+        """Add song to played songs file (once; a resumed update may queue a song again)."""
         try:
-            with open(PLAYED_SONGS_FILE, 'a', encoding='utf-8') as f:
+            if basename in self.get_played_songs():
+                return
+            with open(self.played_songs_file, 'a', encoding='utf-8') as f:
                 f.write(f"{basename}\n")
             logger.debug(f"Added {basename} to played songs")
+            if self.library_cache:
+                self.library_cache.touch(basename)
         except Exception as e:
             logger.error(f"Error adding to played songs: {e}")
 
@@ -326,12 +975,12 @@ class PlaylistManager:
     def get_played_songs(self) -> List[str]:
         """Get list of played songs."""
         try:
-            if not os.path.exists(PLAYED_SONGS_FILE):
-                with open(PLAYED_SONGS_FILE, 'w', encoding='utf-8') as f:
+            if not os.path.exists(self.played_songs_file):
+                with open(self.played_songs_file, 'w', encoding='utf-8') as f:
                     f.write('')
                 return []
                 
-            with open(PLAYED_SONGS_FILE, 'r', encoding='utf-8') as f:
+            with open(self.played_songs_file, 'r', encoding='utf-8') as f:
                 return [line.strip() for line in f if line.strip()]
         except Exception as e:
             logger.error(f"Error reading played songs: {e}")
@@ -0,0 +1,146 @@
+import logging
+from datetime import datetime
+from statistics import median
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Used when nothing is known about a song, not even its size
+DEFAULT_SONG_SECONDS = 210
+
+
+def break_seconds(now: datetime, start_times: Sequence[str], stop_times: Sequence[str]) -> int:
+    """Seconds of music needed for the next break (or what is left of the current one)."""
+    for start, stop in zip(start_times, stop_times):
+        start_at = datetime.combine(now.date(), datetime.strptime(start, "%H:%M").time())
+        stop_at = datetime.combine(now.date(), datetime.strptime(stop, "%H:%M").time())
+        if stop_at > now:
+            return int((stop_at - max(start_at, now)).total_seconds())
+    # Po ostatniej przerwie - pierwsza przerwa nastepnego dnia
+    first_start = datetime.strptime(start_times[0], "%H:%M")
+    first_stop = datetime.strptime(stop_times[0], "%H:%M")
+    return int((first_stop - first_start).total_seconds())
+
+
+def estimate_durations(names: Sequence[str], entries: Dict[str, Dict[str, Any]],
+                       default_seconds: float = DEFAULT_SONG_SECONDS) -> Dict[str, Tuple[float, bool]]:
+    """Map library songs to (seconds, exact) from the library index without probing any file.
+
+    Songs with a cached duration are exact. The rest are estimated from their
+    size and the median bytes per second of songs of the same format whose
+    duration is known, or get the mean known duration when there is no size.
+    """
+    rates: Dict[str, List[float]] = {}
+    known_durations = []
+    for name, entry in entries.items():
+        if entry.get('duration') and entry.get('size'):
+            rates.setdefault(_extension(name), []).append(entry['size'] / entry['duration'])
+        if entry.get('duration'):
+            known_durations.append(entry['duration'])
+    all_rates = [rate for values in rates.values() for rate in values]
+    fallback_seconds = sum(known_durations) / len(known_durations) if known_durations else default_seconds
+
+    result = {}
+    for name in names:
+        entry = entries.get(name) or {}
+        if entry.get('duration'):
+            result[name] = (entry['duration'], True)
+        elif entry.get('size') and (rates.get(_extension(name)) or all_rates):
+            rate = median(rates.get(_extension(name)) or all_rates)
+            result[name] = (entry['size'] / rate, False)
+        else:
+            result[name] = (fallback_seconds, False)
+    return result
+
+
+def subset_sum(durations: Sequence[int], target: int, tolerance: int) -> List[int]:
+    """Indices of a subset whose total is closest to target, preferably within tolerance of it.
+
+    Reachable totals are kept as bitsets (bit s set = total s reachable), one per
+    prefix of the items, so the whole table is n Python ints of target plus the
+    longest item bits and the chosen subset is read back from them. On a tie a
+    total just over the target wins over one just under it: a song cut at the
+    end of the break is better than silence.
+
+    When no total gets within tolerance of the target, the smallest total above
+    the window competes with the largest one below it. The one above wins unless
+    it runs further past target + tolerance than the one below falls short of
+    the target, so a 185 s gap takes a 234 s song, but a 44 s gap is left
+    unfilled rather than filled with a 196 s one.
+    """
+    limit = target + max([tolerance] + [duration for duration in durations if duration > 0])
+    mask = (1 << (limit + 1)) - 1
+    reachable = [1]
+    for duration in durations:
+        previous = reachable[-1]
+        reachable.append((previous | (previous << duration)) & mask if duration > 0 else previous)
+
+    final = reachable[-1]
+    best = None
+    for delta in range(tolerance + 1):
+        for total in (target + delta, target - delta):
+            if 0 <= total and (final >> total) & 1:
+                best = total
+                break
+        if best is not None:
+            break
+
+    if best is None:
+        # Nic nie mieści się w tolerancji - najbliższa suma powyżej albo poniżej okna
+        above = next((total for total in range(target + tolerance + 1, limit + 1) if (final >> total) & 1), None)
+        below = next((total for total in range(min(target - tolerance - 1, limit), -1, -1)
+                      if (final >> total) & 1), 0)
+        best = above if above is not None and above - target - tolerance <= target - below else below
+
+    chosen = []
+    total = best
+    for i in range(len(durations), 0, -1):
+        if total and not (reachable[i - 1] >> total) & 1:
+            chosen.append(i - 1)
+            total -= durations[i - 1]
+    chosen.reverse()
+    return chosen
+
+
+def pack_library(candidates: Sequence[str], target: int, tolerance: int,
+                 estimates: Dict[str, Tuple[float, bool]],
+                 probe: Callable[[str], Optional[float]], max_rounds: int = 6,
+                 explore: int = 2) -> List[Tuple[str, int]]:
+    """Pick library songs that fill target seconds; returns (song, seconds) pairs.
+
+    Packing runs on the estimated durations; only songs that end up selected and
+    are not exact yet are probed. If probing changes the picture the packing is
+    redone with the real durations, and the last round uses exact durations only,
+    so the returned total is never an estimate. When the exact songs alone miss
+    the tolerance window (estimates too coarse to find a better mix), `explore`
+    more candidates are probed per round to widen the choice.
+    """
+    durations = {name: estimates[name] for name in candidates if name in estimates}
+    probed = 0
+    for round_number in range(max_rounds):
+        last_round = round_number == max_rounds - 1
+        names = [name for name, (_, exact) in durations.items() if exact or not last_round]
+        seconds = [int(round(durations[name][0])) for name in names]
+        chosen = [names[i] for i in subset_sum(seconds, target, tolerance)]
+
+        unverified = [name for name in chosen if not durations[name][1]]
+        if not unverified:
+            packed = [(name, int(round(durations[name][0]))) for name in chosen]
+            total = sum(seconds for _, seconds in packed)
+            unverified = [name for name, (_, exact) in durations.items() if not exact][:explore]
+            if abs(total - target) <= tolerance or last_round or not unverified:
+                logger.info(f"Packed {len(packed)} library songs into {total}s of {target}s "
+                            f"after probing {probed} durations")
+                return packed
+        for name in unverified:
+            probed += 1
+            real = probe(name)
+            if real:
+                durations[name] = (real, True)
+            else:
+                del durations[name]
+    return []
+
+
+def _extension(name: str) -> str:
+    return name.rsplit('.', 1)[-1].lower() if '.' in name else ''
@@ -0,0 +1,223 @@
+import argparse
+import os
+import re
+import logging
+import threading
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+# Only first-hand Gemini verdicts are training data, not copies or earlier local decisions
+TRAINING_OUTCOMES = {'accepted', 'rejected_sentiment'}
+
+
+def hash_features(text: str, dim: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Hashed word unigrams and bigrams of a transcript as L2-normalised (indices, values).
+
+    crc32 is used instead of hash() so that features are stable across processes.
+    """
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    if not grams:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    indices, counts = np.unique(
+        np.fromiter((zlib.crc32(gram.encode('utf-8')) % dim for gram in grams), dtype=np.int64, count=len(grams)),
+        return_counts=True)
+    values = np.log1p(counts)
+    return indices, values / np.linalg.norm(values)
+
+
+def training_data(entries: Dict[str, Dict[str, Any]]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Transcripts, labels (1 = safe for radio) and confidence weights from verdict cache entries."""
+    texts, labels, weights = [], [], []
+    for entry in entries.values():
+        if (entry.get('outcome') not in TRAINING_OUTCOMES or not entry.get('transcript')
+                or entry.get('inherited_from') or entry.get('source')):
+            continue
+        texts.append(entry['transcript'])
+        labels.append(1.0 if entry['accepted'] else 0.0)
+        weights.append(entry.get('confidence') or 1.0)
+    return texts, np.array(labels), np.array(weights)
+
+
+class PreScreenClassifier:
+    """Logistic regression over hashed n-grams, trained on past Gemini sentiment verdicts.
+
+    decide() returns a local verdict only outside the uncertain middle band
+    (reject_threshold < p < accept_threshold); everything in the band still goes
+    to Gemini. Training is full-batch Adam on a sparse design matrix kept as flat
+    NumPy arrays, which takes a few seconds for a few thousand transcripts.
+    """
+
+    def __init__(self, dim: int = 2 ** 16, l2: float = 1e-4, iterations: int = 300,
+                 learning_rate: float = 0.1, accept_threshold: float = 0.95,
+                 reject_threshold: float = 0.02, min_samples: int = 200, model_path: Optional[str] = None):
+        self.dim = dim
+        self.l2 = l2
+        self.iterations = iterations
+        self.learning_rate = learning_rate
+        self.accept_threshold = accept_threshold
+        self.reject_threshold = reject_threshold
+        self.min_samples = min_samples
+        self.model_path = model_path
+        self.weights: Optional[np.ndarray] = None
+        self.bias = 0.0
+        self.trained_on = 0
+        self.trained_at: Optional[str] = None
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def ready(self) -> bool:
+        return self.weights is not None
+
+    def fit(self, texts: List[str], labels: np.ndarray, sample_weights: Optional[np.ndarray] = None) -> None:
+        rows, cols, values = self._design_matrix(texts)
+        n = len(texts)
+        sample_weights = np.ones(n) if sample_weights is None else np.asarray(sample_weights, dtype=np.float64)
+        sample_weights = sample_weights / sample_weights.mean()
+
+        weights = np.zeros(self.dim)
+        bias = 0.0
+        m, v = np.zeros(self.dim + 1), np.zeros(self.dim + 1)
+        beta1, beta2, eps = 0.9, 0.999, 1e-8
+        for step in range(1, self.iterations + 1):
+            scores = np.bincount(rows, weights=values * weights[cols], minlength=n) + bias
+            residual = (1.0 / (1.0 + np.exp(-scores)) - labels) * sample_weights / n
+            gradient = np.empty(self.dim + 1)
+            gradient[:-1] = np.bincount(cols, weights=values * residual[rows], minlength=self.dim) + self.l2 * weights
+            gradient[-1] = residual.sum()
+            m = beta1 * m + (1 - beta1) * gradient
+            v = beta2 * v + (1 - beta2) * gradient ** 2
+            update = self.learning_rate * (m / (1 - beta1 ** step)) / (np.sqrt(v / (1 - beta2 ** step)) + eps)
+            weights -= update[:-1]
+            bias -= update[-1]
+
+        with self._lock:
+            self.weights, self.bias = weights, bias
+            self.trained_on = n
+            self.trained_at = datetime.now().isoformat()
+
+    def predict_proba(self, text: str) -> Optional[float]:
+        """Probability that a transcript is safe for radio, or None before training."""
+        with self._lock:
+            weights, bias = self.weights, self.bias
+        if weights is None:
+            return None
+        indices, values = hash_features(text, self.dim)
+        return float(1.0 / (1.0 + np.exp(-(values @ weights[indices] + bias))))
+
+    def decide(self, text: str) -> Tuple[Optional[bool], Optional[float]]:
+        """Return (is_safe_for_radio, probability); the verdict is None inside the uncertain band."""
+        probability = self.predict_proba(text)
+        if probability is None:
+            return None, None
+        if probability >= self.accept_threshold:
+            return True, probability
+        if probability <= self.reject_threshold:
+            return False, probability
+        return None, probability
+
+    def evaluate(self, texts: List[str], labels: np.ndarray) -> Dict[str, Any]:
+        """Share of songs decided locally (Gemini calls saved) and disagreement with Gemini on them."""
+        decided = disagreements = 0
+        for text, label in zip(texts, labels):
+            verdict, _ = self.decide(text)
+            if verdict is None:
+                continue
+            decided += 1
+            disagreements += int(verdict != bool(label))
+        return {
+            'samples': len(texts),
+            'gemini_calls_saved': decided,
+            'saved_ratio': decided / len(texts) if texts else 0.0,
+            'disagreements': disagreements,
+            'disagreement_rate': disagreements / decided if decided else 0.0,
+        }
+
+    def train_from(self, verdict_cache, holdout: float = 0.2, seed: int = 0) -> Optional[Dict[str, Any]]:
+        """Evaluate on a held-out split, then train on all verdicts and save; None if there are too few."""
+        texts, labels, sample_weights = training_data(verdict_cache.entries())
+        if len(texts) < self.min_samples or len(set(labels)) < 2:
+            logger.info(f"Pre-screen not trained: {len(texts)} usable verdicts (need {self.min_samples} of both kinds)")
+            return None
+
+        order = np.random.default_rng(seed).permutation(len(texts))
+        cut = int(len(texts) * (1 - holdout))
+        train, test = order[:cut], order[cut:]
+        # Ocena na osobnej kopii, zeby nie podmieniac modelu uzywanego w trakcie aktualizacji
+        probe = PreScreenClassifier(dim=self.dim, l2=self.l2, iterations=self.iterations,
+                                    learning_rate=self.learning_rate, accept_threshold=self.accept_threshold,
+                                    reject_threshold=self.reject_threshold)
+        probe.fit([texts[i] for i in train], labels[train], sample_weights[train])
+        report = probe.evaluate([texts[i] for i in test], labels[test])
+
+        self.fit(texts, labels, sample_weights)
+        report['trained_on'] = len(texts)
+        self.last_report = report
+        self._save()
+        logger.info(f"Pre-screen trained on {len(texts)} verdicts; held-out: "
+                    f"{report['saved_ratio']:.0%} of Gemini sentiment calls saved, "
+                    f"disagreement {report['disagreement_rate']:.1%} ({report['disagreements']}/"
+                    f"{report['gemini_calls_saved']})")
+        return report
+
+    def _design_matrix(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        rows, cols, values = [], [], []
+        for row, text in enumerate(texts):
+            indices, weights = hash_features(text, self.dim)
+            rows.append(np.full(len(indices), row, dtype=np.int64))
+            cols.append(indices)
+            values.append(weights)
+        return np.concatenate(rows), np.concatenate(cols), np.concatenate(values)
+
+    def _load(self) -> None:
+        if not self.model_path or not os.path.exists(self.model_path):
+            return
+        try:
+            with np.load(self.model_path) as model:
+                if int(model['dim']) != self.dim:
+                    logger.warning("Pre-screen model was trained with a different feature size - ignoring it")
+                    return
+                self.weights = model['weights']
+                self.bias = float(model['bias'])
+                self.trained_on = int(model['trained_on'])
+        except Exception as e:
+            logger.error(f"Error loading pre-screen model {self.model_path}: {e}")
+
+    def _save(self) -> None:
+        if not self.model_path:
+            return
+        try:
+            temp_path = f"{self.model_path}.tmp.npz"
+            np.savez_compressed(temp_path, weights=self.weights, bias=self.bias, dim=self.dim,
+                                trained_on=self.trained_on)
+            os.replace(temp_path, self.model_path)
+        except Exception as e:
+            logger.error(f"Error saving pre-screen model {self.model_path}: {e}")
+
+
+if __name__ == "__main__":
+    from .verdict_cache import VerdictCache
+
+    parser = argparse.ArgumentParser(description="Train the pre-screen on stored verdicts and report held-out results")
+    parser.add_argument("verdicts", help="verdict cache JSON file")
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument("--accept-threshold", type=float, default=0.95)
+    parser.add_argument("--reject-threshold", type=float, default=0.02)
+    parser.add_argument("--min-samples", type=int, default=50)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    classifier = PreScreenClassifier(accept_threshold=args.accept_threshold,
+                                     reject_threshold=args.reject_threshold, min_samples=args.min_samples)
+    result = classifier.train_from(VerdictCache(args.verdicts), holdout=args.holdout)
+    if result:
+        for key, value in result.items():
+            print(f"{key:>20}: {value:.3f}" if isinstance(value, float) else f"{key:>20}: {value}")
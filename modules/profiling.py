@@ -0,0 +1,289 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+import traceback
+from collections import Counter as Tally
+from contextlib import contextmanager
+from datetime import datetime
+from threading import Thread
+from time import perf_counter
+from typing import Any, Dict, List, Optional
+
+from config import (
+    PROFILE_DIR,
+    PROFILE_SAMPLE_INTERVAL_SECONDS,
+    PROFILE_MAX_SECONDS,
+    PROFILE_TOP,
+    PROFILE_TRACEMALLOC_FRAMES
+)
+
+logger = logging.getLogger(__name__)
+
+MODES = ('sampling', 'cprofile')
+SCOPES = ('next_update', 'window')
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def thread_stacks() -> str:
+    """Current stack of every thread, innermost call last."""
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    lines = []
+    for ident, frame in sys._current_frames().items():
+        lines.append(f"--- {names.get(ident, 'unknown')} ({ident})")
+        lines.extend(line.rstrip('\n') for line in traceback.format_stack(frame))
+    return '\n'.join(lines) + '\n'
+
+
+class _Sampler:
+    """Wall-clock sampler: every interval the stacks of all threads are counted as collapsed stacks."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: "Tally[str]" = Tally()
+        self.rounds = 0
+        self._stopped = threading.Event()
+        self._thread = Thread(target=self._run, daemon=True, name="ProfileSampler")
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, 'unknown').replace(';', ':'))
+                self.samples[';'.join(reversed(stack))] += 1
+            self.rounds += 1
+
+
+class Profiler:
+    """Profiling sessions started and stopped at runtime through the admin endpoints.
+
+    A session either profiles the next update_playlist run (scope next_update)
+    or a time window (scope window). mode sampling records the stacks of all
+    threads every PROFILE_SAMPLE_INTERVAL_SECONDS into a collapsed-stack file
+    (flamegraph.pl, speedscope); mode cprofile runs cProfile in the update's
+    thread and writes a pstats file - cProfile only sees the thread that
+    enabled it, so it is offered for next_update only. Every session also
+    writes the thread stacks at its start and end and, unless memory is off,
+    the top tracemalloc allocations and their growth over the session.
+
+    While no session is active nothing is installed: no profile hook, no
+    sampler thread, no tracemalloc; update_playlist reads one flag.
+    """
+
+    def __init__(self, directory: str = PROFILE_DIR):
+        self.directory = directory
+        self.update_armed = False
+        self.last_result: Optional[Dict[str, Any]] = None
+        self._session: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def start(self, mode: str = 'sampling', scope: str = 'next_update', seconds: Optional[float] = None,
+              interval: float = PROFILE_SAMPLE_INTERVAL_SECONDS, memory: bool = True) -> Dict[str, Any]:
+        """Arm a session for the next update or start a window; raises ValueError on bad options."""
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}")
+        if scope not in SCOPES:
+            raise ValueError(f"scope must be one of {', '.join(SCOPES)}")
+        if mode == 'cprofile' and scope != 'next_update':
+            raise ValueError("cprofile only sees one thread; use it with scope next_update or use sampling")
+        if scope == 'window' and not seconds:
+            raise ValueError("a window needs seconds")
+        if seconds is not None and not 0 < seconds <= PROFILE_MAX_SECONDS:
+            raise ValueError(f"seconds must be between 0 and {PROFILE_MAX_SECONDS}")
+        if not 0.001 <= interval <= 1:
+            raise ValueError("interval must be between 1 ms and 1 s")
+
+        with self._lock:
+            if self._session:
+                raise RuntimeError(f"a {self._session['scope']} session is already {self._session['state']}")
+            session = {
+                'id': datetime.now().strftime('%Y%m%d_%H%M%S'),
+                'mode': mode,
+                'scope': scope,
+                'seconds': seconds,
+                'interval': interval,
+                'memory': memory,
+                'state': 'armed',
+                'requested_at': datetime.now().isoformat(),
+            }
+            self._session = session
+            if scope == 'next_update':
+                self.update_armed = True
+        if scope == 'window':
+            self._begin(session, 'window')
+            self._timer = threading.Timer(seconds, self.stop)
+            self._timer.daemon = True
+            self._timer.start()
+        logger.info(f"Profiling session {session['id']} ({mode}, {scope}) {session['state']}")
+        return self.status()
+
+    def stop(self) -> Optional[Dict[str, Any]]:
+        """End a window or disarm a session still waiting for its update; the result, or None.
+
+        A session already profiling an update ends with that update (cProfile can
+        only be switched off in its own thread); RuntimeError then.
+        """
+        with self._lock:
+            session = self._session
+            if not session:
+                return None
+            if session['scope'] == 'next_update':
+                if session['state'] == 'running':
+                    raise RuntimeError("the session ends with the running update")
+                self.update_armed = False
+                self._session = None
+                logger.info(f"Profiling session {session['id']} disarmed")
+                return {'id': session['id'], 'state': 'disarmed'}
+            if session['state'] == 'stopping':
+                return None
+            # Timer i ręczne zatrzymanie mogą się spotkać - kończy tylko pierwszy
+            session['state'] = 'stopping'
+        if self._timer:
+            self._timer.cancel()
+        return self._finish(session)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            session = {key: value for key, value in (self._session or {}).items() if not key.startswith('_')}
+        return {'session': session or None, 'last_result': self.last_result}
+
+    @contextmanager
+    def update_session(self, label: str):
+        """Profile the block if a session is armed for the next update; otherwise do nothing."""
+        if not self.update_armed:
+            yield
+            return
+        with self._lock:
+            session = self._session
+            claimed = self.update_armed and session is not None
+            self.update_armed = False
+        if not claimed:
+            yield
+            return
+        self._begin(session, label)
+        try:
+            yield
+        finally:
+            self._finish(session)
+
+    def _begin(self, session: Dict[str, Any], label: str) -> None:
+        session.update(state='running', label=label, started_at=datetime.now().isoformat(),
+                       _started=perf_counter(), _stacks_before=thread_stacks())
+        if session['memory']:
+            session['_own_tracing'] = not tracemalloc.is_tracing()
+            if session['_own_tracing']:
+                tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+            session['_memory_before'] = tracemalloc.take_snapshot()
+        if session['mode'] == 'cprofile':
+            session['_profile'] = cProfile.Profile()
+            session['_profile'].enable()
+        else:
+            session['_sampler'] = _Sampler(session['interval'])
+            session['_sampler'].start()
+
+    def _finish(self, session: Dict[str, Any]) -> Dict[str, Any]:
+        elapsed = perf_counter() - session['_started']
+        if session['mode'] == 'cprofile':
+            session['_profile'].disable()
+        else:
+            session['_sampler'].stop()
+        stacks_after = thread_stacks()
+        memory_after = tracemalloc.take_snapshot() if session['memory'] else None
+        if session['memory'] and session['_own_tracing']:
+            tracemalloc.stop()
+
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"{session['id']}_{session['label']}")
+        files = []
+        try:
+            if session['mode'] == 'cprofile':
+                files.append(f"{base}.pstats")
+                session['_profile'].dump_stats(files[-1])
+                top = self._cprofile_top(session['_profile'])
+            else:
+                files.append(f"{base}.collapsed")
+                with open(files[-1], 'w', encoding='utf-8') as f:
+                    for stack, count in session['_sampler'].samples.most_common():
+                        f.write(f"{stack} {count}\n")
+                top = self._sampling_top(session['_sampler'])
+
+            files.append(f"{base}_threads.txt")
+            with open(files[-1], 'w', encoding='utf-8') as f:
+                f.write(f"# at start ({session['started_at']})\n{session['_stacks_before']}\n"
+                        f"# at end ({datetime.now().isoformat()})\n{stacks_after}")
+
+            if memory_after is not None:
+                files.append(f"{base}_tracemalloc.txt")
+                with open(files[-1], 'w', encoding='utf-8') as f:
+                    f.write(self._memory_report(session['_memory_before'], memory_after))
+        except Exception as e:
+            logger.error(f"Error writing profiling results of {session['id']}: {e}")
+            top = []
+
+        result = {
+            'id': session['id'],
+            'mode': session['mode'],
+            'scope': session['scope'],
+            'label': session['label'],
+            'seconds': round(elapsed, 3),
+            'files': [os.path.basename(path) for path in files],
+            'top': top,
+        }
+        with self._lock:
+            self.last_result = result
+            if self._session is session:
+                self._session = None
+        logger.info(f"Profiling session {session['id']} done after {elapsed:.1f}s: {', '.join(result['files'])}")
+        return result
+
+    @staticmethod
+    def _cprofile_top(profile: cProfile.Profile) -> List[Dict[str, Any]]:
+        stats = pstats.Stats(profile, stream=io.StringIO())
+        rows = sorted(stats.stats.items(), key=lambda item: -item[1][3])[:PROFILE_TOP]
+        return [{'function': f"{name} ({os.path.basename(path)}:{line})", 'calls': calls,
+                 'own_seconds': round(own, 4), 'cumulative_seconds': round(cumulative, 4)}
+                for (path, line, name), (_, calls, own, cumulative, _) in rows]
+
+    @staticmethod
+    def _sampling_top(sampler: _Sampler) -> List[Dict[str, Any]]:
+        """Innermost frames by their share of samples; waits of idle threads show up as such."""
+        leaves: "Tally[str]" = Tally()
+        for stack, count in sampler.samples.items():
+            thread, _, frames = stack.partition(';')
+            leaves[f"{frames.rsplit(';', 1)[-1]} [{thread}]"] += count
+        total = sum(sampler.samples.values()) or 1
+        return [{'function': frame, 'samples': count, 'share': round(count / total, 4)}
+                for frame, count in leaves.most_common(PROFILE_TOP)]
+
+    @staticmethod
+    def _memory_report(before, after) -> str:
+        lines = ["# top allocations at the end of the session"]
+        lines.extend(str(stat) for stat in after.statistics('lineno')[:PROFILE_TOP])
+        lines.append("\n# growth over the session")
+        lines.extend(str(stat) for stat in after.compare_to(before, 'lineno')[:PROFILE_TOP])
+        return '\n'.join(lines) + '\n'
+
+
+profiler = Profiler()
@@ -1,82 +1,393 @@
+import json
 import logging
+import os
+import queue
+import random
+import threading
+import time
 import requests
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from datetime import datetime
 from typing import Optional, Dict, Any, List
 from .decorators import log_errors
 from .exceptions import APIConnectionError
-from flask import Flask, request, jsonify
-from threading import Thread
+from .metrics import registry, BACKEND_ERRORS, VOTES_RECEIVED, VOTE_STREAM_RECONNECTS
+from .profiling import profiler, thread_stacks
+from flask import Flask, Response, request, jsonify, send_from_directory
+from socketserver import ThreadingMixIn
+from threading import Thread, Lock
 from typing import Callable
-from .aimp_controller import AimpController
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, make_server
 from config import AUDIO_DEVICE_NAME
 
 logger = logging.getLogger(__name__)
 
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    """WSGI server handling each request in its own thread."""
+    daemon_threads = True
+    request_queue_size = 128  # the socketserver default of 5 drops connections under load
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+
+class PlayerCommandQueue:
+    """Single worker thread that executes player commands one at a time, in arrival order."""
+
+    def __init__(self, handler: Callable[[str], Any], maxsize: int = 32):
+        self.handler = handler
+        self._queue: "queue.Queue" = queue.Queue(maxsize=maxsize)
+
+    def start(self):
+        Thread(target=self._worker, daemon=True, name="PlayerCommandQueue").start()
+
+    def submit(self, command: str, timeout: float = 10.0) -> Any:
+        """Queue a command and wait for its result.
+
+        Raises queue.Full if too many commands are pending and TimeoutError if
+        the player does not answer in time.
+        """
+        future = Future()
+        self._queue.put_nowait((command, future))
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()  # drop it if the worker has not picked it up yet
+            raise
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _worker(self):
+        while True:
+            command, future = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.handler(command))
+            except Exception as e:
+                logger.error(f"Error executing command {command}: {e}")
+                future.set_exception(e)
+
+
 class CommandServer:
-    def __init__(self, port: int = 5050):
+    """Admin HTTP API in front of the shared AimpController.
+
+    Commands are executed through a PlayerCommandQueue so player IPC is never
+    concurrent; /status (from the PlayerStateCache) and /queue are served from
+    cached state without touching the player. /profile starts and stops
+    profiling sessions (see modules.profiling) and serves their files.
+    """
+
+    def __init__(self, aimp_controller, port: int = 5050, command_timeout: float = 10.0,
+                 state_cache=None):
         self.app = Flask(__name__)
         self.port = port
-        self.command_handler = ["play", "pause", "next"]
-        self.aimp_controller = AimpController()
+        self.aimp_controller = aimp_controller
+        self.state_cache = state_cache
+        self.command_timeout = command_timeout
+        self.command_queue = PlayerCommandQueue(aimp_controller.handle_command)
+        self.job_runner = None
+        self.server = None
+        self._status: Dict[str, Any] = {}
+        self._status_lock = Lock()
         # Endpoint do odbierania komend
         @self.app.route('/command', methods=['POST'])
         def handle_command():
-            try:
-                data = request.get_json()
-                command = data.get('ToDO')
-                if command and self.command_handler:
-                    self._handle_command(command)
-                    return jsonify({'status': 'success'})
+            data = request.get_json(silent=True) or {}
+            command = data.get('ToDO')
+            if not command:
                 return jsonify({'status': 'error', 'message': 'Invalid command'}), 400
+            logger.info(f"Received command: {command}")
+            try:
+                handled = self.command_queue.submit(command, timeout=self.command_timeout)
+            except queue.Full:
+                return jsonify({'status': 'error', 'message': 'Command queue full'}), 503
+            except FutureTimeoutError:
+                return jsonify({'status': 'error', 'message': 'Player did not respond'}), 504
             except Exception as e:
                 logger.error(f"Error handling command: {e}")
                 return jsonify({'status': 'error', 'message': str(e)}), 500
+            if handled is None:
+                return jsonify({'status': 'error', 'message': 'Command failed'}), 500
+            if not handled:
+                return jsonify({'status': 'error', 'message': 'Invalid command'}), 400
+            self.update_status(last_command=command)
+            if self.state_cache:
+                self.state_cache.invalidate()
+            return jsonify({'status': 'success'})
 
-    def _handle_command(self, command: str):
-        """Handle incoming command."""
-        if not self.aimp_controller:
-            logger.error("AIMP controller not initialized")
-            return
+        @self.app.route('/status', methods=['GET'])
+        def get_status():
+            status = self.state_cache.snapshot() if self.state_cache else {}
+            with self._status_lock:
+                status.update(self._status)
+            status['pending_commands'] = self.command_queue.pending()
+            return jsonify({'status': 'success', 'player': status})
+
+        @self.app.route('/queue', methods=['GET'])
+        def get_queue():
+            songs = [os.path.basename(path) for path in list(self.aimp_controller.playlist)]
+            return jsonify({'status': 'success', 'count': len(songs), 'songs': songs})
+
+        @self.app.route('/metrics', methods=['GET'])
+        def get_metrics():
+            return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+        @self.app.route('/jobs', methods=['GET'])
+        def get_jobs():
+            if not self.job_runner:
+                return jsonify({'status': 'error', 'message': 'Job runner not configured'}), 503
+            return jsonify({'status': 'success', 'jobs': self.job_runner.status()})
+
+        @self.app.route('/jobs/<name>/cancel', methods=['POST'])
+        def cancel_job(name):
+            if not self.job_runner:
+                return jsonify({'status': 'error', 'message': 'Job runner not configured'}), 503
+            if self.job_runner.cancel(name):
+                return jsonify({'status': 'success'})
+            return jsonify({'status': 'error', 'message': f'No active job {name}'}), 404
+
+        # Profilowanie na żywo: sesja na następną aktualizację albo na okno czasowe
+        @self.app.route('/profile/start', methods=['POST'])
+        def start_profile():
+            data = request.get_json(silent=True) or {}
+            options = {'mode': data.get('mode', 'sampling'), 'scope': data.get('scope', 'next_update'),
+                       'memory': bool(data.get('memory', True))}
+            try:
+                if data.get('seconds') is not None:
+                    options['seconds'] = float(data['seconds'])
+                if data.get('interval_ms') is not None:
+                    options['interval'] = float(data['interval_ms']) / 1000
+                status = profiler.start(**options)
+            except (TypeError, ValueError) as e:
+                return jsonify({'status': 'error', 'message': str(e)}), 400
+            except RuntimeError as e:
+                return jsonify({'status': 'error', 'message': str(e)}), 409
+            return jsonify({'status': 'success', **status})
+
+        @self.app.route('/profile/stop', methods=['POST'])
+        def stop_profile():
+            try:
+                result = profiler.stop()
+            except RuntimeError as e:
+                return jsonify({'status': 'error', 'message': str(e)}), 409
+            if result is None:
+                return jsonify({'status': 'error', 'message': 'No active profiling session'}), 404
+            return jsonify({'status': 'success', 'result': result})
+
+        @self.app.route('/profile', methods=['GET'])
+        def get_profile():
+            return jsonify({'status': 'success', **profiler.status()})
+
+        @self.app.route('/profile/threads', methods=['GET'])
+        def get_thread_stacks():
+            return Response(thread_stacks(), mimetype='text/plain')
+
+        @self.app.route('/profile/files/<name>', methods=['GET'])
+        def get_profile_file(name):
+            return send_from_directory(profiler.directory, name, as_attachment=True)
 
-        logger.info(f"Received command: {command}")
-        try:
-            if command == 'play':
-                self.aimp_controller.play_song()
-            elif command == 'pause':
-                self.aimp_controller.pause_song()
-            elif command == 'next':
-                self.aimp_controller.skip_song()
-            else:
-                logger.warning(f"Unknown command: {command}")
-        except Exception as e:
-            logger.error(f"Error executing command {command}: {e}")
-        
     def start(self):
-        """Start server in a separate thread."""
-        def run():
-            self.app.run(host='0.0.0.0', port=self.port)
-        
-        Thread(target=run, daemon=True).start()
+        """Start the command worker and a multi-threaded WSGI server in background threads."""
+        self.command_queue.start()
+        self.server = make_server('0.0.0.0', self.port, self.app,
+                                  server_class=_ThreadingWSGIServer,
+                                  handler_class=_QuietRequestHandler)
+        Thread(target=self.server.serve_forever, daemon=True, name="CommandServer").start()
         logger.info(f"Command server started on port {self.port}")
 
-    def set_command_handler(self, handler: Callable):
-        """Set handler function for incoming commands."""
-        self.command_handler = handler
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def update_status(self, **fields):
+        """Add server-side fields (e.g. the last command) to what /status serves."""
+        with self._status_lock:
+            self._status.update(fields)
+            self._status['updated_at'] = datetime.now().isoformat()
+
+    def set_job_runner(self, job_runner):
+        """Expose background job status and cancellation through /jobs."""
+        self.job_runner = job_runner
+
+
+class VoteSubscription:
+    """Background client that learns about votes as they are cast instead of at update time.
+
+    Holds a server-sent events connection to {backend}/voting/stream. Each event's
+    data is a song ({'url', 'duration', ...}) or a list of songs; songs not seen
+    before today are passed to on_songs. A dropped connection is retried with
+    exponential backoff and jitter, sending Last-Event-ID so the backend can
+    replay missed events, and songs-to-play is polled once after every
+    (re)connect to catch up. A backend without the stream endpoint is polled
+    every poll_interval seconds instead, with the stream retried every
+    stream_retry seconds.
+    """
+
+    def __init__(self, backend_url: str, on_songs: Callable[[List[Dict[str, Any]]], None],
+                 fetch_songs: Callable[[], Optional[List[Dict[str, Any]]]], poll_interval: float = 60.0,
+                 backoff_min: float = 1.0, backoff_max: float = 60.0, read_timeout: float = 75.0,
+                 stream_retry: float = 600.0):
+        self.stream_url = f"{backend_url}/voting/stream"
+        self.on_songs = on_songs
+        self.fetch_songs = fetch_songs
+        self.poll_interval = poll_interval
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.read_timeout = read_timeout
+        self.stream_retry = stream_retry
+        self.mode = 'stream'
+        self.connected = False
+        self.last_event_id: Optional[str] = None
+        self._backoff = backoff_min
+        self._next_stream_attempt = 0.0
+        self._seen: set = set()
+        self._seen_day: Optional[str] = None
+        self._response = None
+        self._stop = threading.Event()
+        self._thread: Optional[Thread] = None
+
+    def start(self) -> None:
+        self._thread = Thread(target=self._run, daemon=True, name="VoteSubscription")
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        response = self._response
+        if response is not None:
+            response.close()  # przerywa blokujące iter_lines
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if self.mode == 'polling' and time.monotonic() < self._next_stream_attempt:
+                self._poll()
+                self._stop.wait(self.poll_interval)
+                continue
+            try:
+                if self._stream():
+                    continue
+                logger.info(f"Backend has no vote stream, polling every {self.poll_interval:.0f}s")
+                self.mode = 'polling'
+                self._next_stream_attempt = time.monotonic() + self.stream_retry
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                self.connected = False
+                VOTE_STREAM_RECONNECTS.inc()
+                delay = self._backoff * random.uniform(0.5, 1.0)
+                logger.warning(f"Vote stream disconnected ({e}), reconnecting in {delay:.1f}s")
+                self._poll()
+                self._stop.wait(delay)
+                self._backoff = min(self.backoff_max, self._backoff * 2)
+
+    def _stream(self) -> bool:
+        """Read events until the connection ends; False if the backend has no stream endpoint."""
+        headers = {'Accept': 'text/event-stream'}
+        if self.last_event_id:
+            headers['Last-Event-ID'] = self.last_event_id
+        with requests.get(self.stream_url, headers=headers, stream=True,
+                          timeout=(5, self.read_timeout)) as response:
+            if response.status_code in (404, 405, 501):
+                return False
+            response.raise_for_status()
+            self._response = response
+            self.mode = 'stream'
+            self.connected = True
+            self._backoff = self.backoff_min
+            logger.info("Vote stream connected")
+            self._poll()
+            data_lines: List[str] = []
+            try:
+                # chunk_size=1: bez tego requests czeka na 512 bajtów i zdarzenia przychodzą z opóźnieniem
+                for line in response.iter_lines(chunk_size=1, decode_unicode=True):
+                    if self._stop.is_set():
+                        break
+                    if line is None or line.startswith(':'):
+                        continue
+                    if not line:
+                        if data_lines:
+                            self._dispatch('\n'.join(data_lines))
+                        data_lines = []
+                        continue
+                    field, _, value = line.partition(':')
+                    value = value[1:] if value.startswith(' ') else value
+                    if field == 'data':
+                        data_lines.append(value)
+                    elif field == 'id':
+                        self.last_event_id = value
+            finally:
+                self._response = None
+                self.connected = False
+        if not self._stop.is_set():
+            raise ConnectionError("stream closed by the backend")
+        return True
+
+    def _dispatch(self, data: str) -> None:
+        try:
+            payload = json.loads(data)
+        except ValueError:
+            logger.warning(f"Ignoring malformed vote event: {data[:200]}")
+            return
+        self._deliver(payload if isinstance(payload, list) else [payload])
+
+    def _poll(self) -> None:
+        songs = self.fetch_songs()
+        if songs:
+            self._deliver(songs)
+
+    def _deliver(self, songs: List[Dict[str, Any]]) -> None:
+        today = datetime.now().date().isoformat()
+        if today != self._seen_day:
+            self._seen, self._seen_day = set(), today
+        new_songs = []
+        for song in songs:
+            if isinstance(song, dict) and song.get('url') and song['url'] not in self._seen:
+                self._seen.add(song['url'])
+                new_songs.append(song)
+        if new_songs:
+            VOTES_RECEIVED.inc(len(new_songs))
+            try:
+                self.on_songs(new_songs)
+            except Exception as e:
+                logger.error(f"Error handling voted songs: {e}")
 
 
 class RequestManager:
     def __init__(self, backend_url: str, admin_url: str):
         self.backend_url = backend_url
         self.admin_url = admin_url
-        
+        self.subscription: Optional[VoteSubscription] = None
+
+    def subscribe(self, on_songs: Callable[[List[Dict[str, Any]]], None], **options) -> VoteSubscription:
+        """Start receiving voted songs as they arrive; options are passed to VoteSubscription."""
+        self.stop_subscription()
+        self.subscription = VoteSubscription(self.backend_url, on_songs, self.fetch_songs_from_backend, **options)
+        registry.gauge("radio_vote_stream_connected", "1 while the vote stream connection is open",
+                       lambda: int(bool(self.subscription and self.subscription.connected)))
+        self.subscription.start()
+        return self.subscription
+
+    def stop_subscription(self) -> None:
+        if self.subscription:
+            self.subscription.stop()
+            self.subscription = None
+
     @log_errors
     def fetch_songs_from_backend(self) -> Optional[List[Dict[str, Any]]]:
         """Fetch songs from backend with retries."""
         for attempt in range(3):
             try:
-                response = requests.get(f"{self.backend_url}/voting/songs-to-play")
+                response = requests.get(f"{self.backend_url}/voting/songs-to-play", timeout=10)
                 if response.status_code == 200:
                     return response.json()
+                BACKEND_ERRORS.inc()
             except Exception as e:
+                BACKEND_ERRORS.inc()
                 logger.error(f"Attempt {attempt + 1} failed: {e}")
         return None
         
@@ -130,6 +441,8 @@ class RequestManager:
                 )
                 if response.status_code == 200:
                     return True
+                BACKEND_ERRORS.inc()
             except Exception as e:
+                BACKEND_ERRORS.inc()
                 logger.error(f"Attempt {attempt + 1} failed: {e}")
         return False
\ No newline at end of file
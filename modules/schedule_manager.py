@@ -1,48 +1,133 @@
-import schedule
 import logging
-from typing import Any, Callable
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
 from .decorators import log_errors
+from .deadline_scheduler import DeadlineScheduler, DurationHistory
+from .job_runner import JobRunner, PLAYLIST_UPDATE_JOB
 from config import (
     PLAYLIST_UPDATE_TIMES,
     DEVICE_START_TIMES,
     DEVICE_STOP_TIMES,
-    AUDIO_DEVICE_NAME
+    SCHEDULE_HISTORY_FILE,
+    SCHEDULE_SAFETY_MARGIN_SECONDS,
+    PLAYED_SONGS_RESET_TIME,
+    PRESCREEN_TRAINING_TIME
 )
 
 logger = logging.getLogger(__name__)
 
 class ScheduleManager:
-    def __init__(self, playlist_manager, aimp_controller):
+    """Daily jobs of one zone.
+
+    Zones share one DeadlineScheduler; the jobs of a named zone are prefixed with
+    "<zone>/" so their names and learned durations stay apart. Jobs that are not
+    tied to a zone (pre-screen training) are only added with shared_jobs.
+    """
+
+    def __init__(self, playlist_manager, aimp_controller,
+                 scheduler: Optional[DeadlineScheduler] = None,
+                 job_runner: Optional[JobRunner] = None,
+                 zone: Optional[str] = None,
+                 update_times: List[str] = PLAYLIST_UPDATE_TIMES,
+                 start_times: List[str] = DEVICE_START_TIMES,
+                 stop_times: List[str] = DEVICE_STOP_TIMES,
+                 update_job: str = PLAYLIST_UPDATE_JOB,
+                 shared_jobs: bool = True):
         self.playlist_manager = playlist_manager
         self.aimp_controller = aimp_controller
-        
+        self.job_runner = job_runner
+        self.zone = zone
+        self.update_times = update_times
+        self.start_times = start_times
+        self.stop_times = stop_times
+        self.update_job = update_job
+        self.shared_jobs = shared_jobs
+        self.scheduler = scheduler or DeadlineScheduler(
+            history=DurationHistory(SCHEDULE_HISTORY_FILE),
+            safety_margin=SCHEDULE_SAFETY_MARGIN_SECONDS
+        )
+
+    def get_daily_jobs(self) -> List[Dict[str, Any]]:
+        """Return the daily job list as dicts with time, name, slot, func and kwargs.
+
+        Playlist updates also carry a deadline (the matching device start) and the
+        earliest time they may start (the previous break's stop, for the first
+        update a minute after the played-songs reset, so the reset never runs
+        alongside it); their 'time' is the configured fallback start used until
+        durations have been learned.
+        """
+        jobs = []
+
+        # Cleanup
+        jobs.append(self._job(PLAYED_SONGS_RESET_TIME, "clear_played_songs", None,
+                              self.aimp_controller.clear_played_songs))
+        if self.shared_jobs and self.playlist_manager.prescreen:
+            jobs.append(self._job(PRESCREEN_TRAINING_TIME, "train_prescreen", None,
+                                  self.playlist_manager.train_prescreen))
+
+        for slot, time_str in enumerate(self.update_times):
+            job = self._job(time_str, "update_playlist", slot, self._update_playlist)
+            job['deadline'] = self.start_times[slot]
+            job['earliest'] = self.stop_times[slot - 1] if slot else self._minute_after(PLAYED_SONGS_RESET_TIME)
+            jobs.append(job)
+
+        # Device control
+        for slot, stop_time in enumerate(self.stop_times):
+            jobs.append(self._job(stop_time, "stop_audio_device", slot,
+                                  self.aimp_controller.stop_audio_device))
+
+        for slot, start_time in enumerate(self.start_times):
+            jobs.append(self._job(start_time, "start_audio_device", slot,
+                                  self.aimp_controller.start_audio_device))
+            jobs.append(self._job(start_time, "play_song", slot,
+                                  self.aimp_controller.play_song))
+
+        if self.zone:
+            for job in jobs:
+                job['name'] = f"{self.zone}/{job['name']}"
+        return jobs
+
+    def _update_playlist(self):
+        """Run the update through the job runner (if any) and wait, so its duration is measured."""
+        if self.job_runner:
+            self.job_runner.run(self.update_job, self.playlist_manager.update_playlist)
+        else:
+            self.playlist_manager.update_playlist()
+
+    @staticmethod
+    def _minute_after(time_str: str) -> str:
+        return (datetime.strptime(time_str, "%H:%M") + timedelta(minutes=1)).strftime("%H:%M")
+
+    @staticmethod
+    def _job(time_str: str, name: str, slot, func: Callable, **kwargs) -> Dict[str, Any]:
+        return {'time': time_str, 'name': name, 'slot': slot, 'func': func, 'kwargs': kwargs}
+
     @log_errors
     def setup_schedules(self):
         """Setup all scheduled tasks."""
-        # Playlist updates
-        for time_str in PLAYLIST_UPDATE_TIMES:
-            schedule.every().day.at(f"{time_str}:00").do(
-                self.playlist_manager.update_playlist
-            )
+        for job in self.get_daily_jobs():
+            if 'deadline' in job:
+                # Without history, start at the configured update time
+                default_seconds = (datetime.strptime(job['deadline'], "%H:%M")
+                                   - datetime.strptime(job['time'], "%H:%M")).total_seconds()
+                default_seconds -= SCHEDULE_SAFETY_MARGIN_SECONDS
+                self.scheduler.finish_by(
+                    job['deadline'], job['func'],
+                    name=f"{job['name']}@{job['deadline']}",
+                    group=job['name'],
+                    earliest=job['earliest'],
+                    default_seconds=default_seconds,
+                    **job['kwargs']
+                )
+            else:
+                self.scheduler.every_day_at(job['time'], job['func'], name=job['name'], **job['kwargs'])
 
-        # Device control
-        for stop_time in DEVICE_STOP_TIMES:
-            schedule.every().day.at(f"{stop_time}:00").do(
-                self.aimp_controller.stop_audio_device, 
-                device=AUDIO_DEVICE_NAME
-            )
-
-        for start_time in DEVICE_START_TIMES:
-            schedule.every().day.at(f"{start_time}:00").do(
-                self.aimp_controller.start_audio_device
-            )
-            schedule.every().day.at(f"{start_time}:00").do(
-                self.aimp_controller.play_song
-            )
+        logger.info("All schedules have been set up")
 
-        # Cleanup
-        schedule.every().day.at("07:44:00").do(
-            self.aimp_controller.clear_played_songs
-        )
+    def run(self):
+        """Run the scheduler loop (blocking)."""
+        self.scheduler.run()
 
-        logger.info("All schedules have been set up")
\ No newline at end of file
+    def get_slack_report(self) -> List[Dict[str, Any]]:
+        """Return recent playlist updates with how much time they had left before the break."""
+        return self.scheduler.get_slack_report()
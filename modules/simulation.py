@@ -0,0 +1,413 @@
+import os
+import re
+import random
+import logging
+import tempfile
+from bisect import bisect_left
+from datetime import datetime, date, timedelta
+from typing import Dict, List, Optional, Tuple
+from .playlist_manager import PlaylistManager
+from .schedule_manager import ScheduleManager
+from .song_locks import SongLocks
+from .deadline_scheduler import DeadlineScheduler
+from config import DEVICE_START_TIMES, DEVICE_STOP_TIMES, SCHEDULE_SAFETY_MARGIN_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Modelled latencies (seconds) of the real services, used to advance the virtual clock.
+DEFAULT_LATENCY = {
+    'aimp_restart': 2.5,              # quit until the window is gone + launch until AIMP answers (probed)
+    'aimp_add': 0.05,
+    'device_fade': 2.0,               # ~90 nircmd calls
+    'backend_fetch': 0.3,
+    'download_overhead': 4.0,         # stream lookup + fixed sleep(3)
+    'download_bytes_per_second': 1_500_000,
+    'transcription_base': 4.0,
+    'transcription_per_audio_minute': 2.5,
+    'sentiment': 2.0,
+    'duration_probe': 0.3,
+}
+
+# 11 characters like real video ids - pytubefix.extract.video_id rejects anything else
+VIDEO_ID_PATTERN = re.compile(r"sim\d{8}")
+
+
+class VirtualClock:
+    """Monotonic virtual clock advanced explicitly by the fake services."""
+
+    def __init__(self, start: datetime):
+        self._now = start
+
+    def now(self) -> datetime:
+        return self._now
+
+    def advance(self, seconds: float) -> None:
+        self._now += timedelta(seconds=seconds)
+
+    def set(self, moment: datetime) -> None:
+        """Move the clock forward to the given moment (never backwards)."""
+        if moment > self._now:
+            self._now = moment
+
+
+class FakeCatalog:
+    """Synthetic YouTube catalogue with durations, sizes and content flags."""
+
+    def __init__(self, size: int, rng: random.Random,
+                 explicit_ratio: float = 0.15, unsafe_ratio: float = 0.1):
+        self.songs = {}
+        for i in range(size):
+            video_id = f"sim{i:08d}"
+            duration = rng.randint(120, 300)
+            self.songs[video_id] = {
+                'duration': duration,
+                'size': duration * rng.randint(16_000, 20_000),
+                'explicit': rng.random() < explicit_ratio,
+                'unsafe': rng.random() < unsafe_ratio,
+            }
+
+    def lookup(self, text: str) -> Tuple[Optional[str], Optional[Dict]]:
+        match = VIDEO_ID_PATTERN.search(text or '')
+        if not match:
+            return None, None
+        return match.group(0), self.songs.get(match.group(0))
+
+
+class FakeRequestManager:
+    def __init__(self, catalog: FakeCatalog, clock: VirtualClock, rng: random.Random,
+                 votes_per_break: int, latency: Dict[str, float]):
+        self.catalog = catalog
+        self.clock = clock
+        self.rng = rng
+        self.votes_per_break = votes_per_break
+        self.latency = latency
+        self._votes: Dict[int, List[Dict[str, str]]] = {}
+
+    def fetch_songs_from_backend(self) -> List[Dict[str, str]]:
+        """Votes for the next break; every zone updating for that break gets the same ones."""
+        self.clock.advance(self.latency['backend_fetch'])
+        slot = bisect_left(DEVICE_START_TIMES, f"{self.clock.now():%H:%M}")
+        if slot not in self._votes:
+            video_ids = self.rng.sample(sorted(self.catalog.songs), self.votes_per_break)
+            self._votes[slot] = [
+                {
+                    'url': f"https://www.youtube.com/watch?v={video_id}",
+                    'duration': str(timedelta(seconds=self.catalog.songs[video_id]['duration'])).zfill(8)
+                }
+                for video_id in video_ids
+            ]
+        return list(self._votes[slot])
+
+    def post_playing_song(self, track_info: Dict[str, str]) -> bool:
+        return True
+
+
+class FakeYoutubeDownloader:
+    def __init__(self, catalog: FakeCatalog, clock: VirtualClock, latency: Dict[str, float],
+                 download_path: str, cache_path: str):
+        self.catalog = catalog
+        self.clock = clock
+        self.latency = latency
+        self.download_path = download_path
+        self.cache_path = cache_path
+        self.bytes_downloaded = 0
+
+    def cached_path(self, video_id: str) -> Optional[str]:
+        for filename in os.listdir(self.cache_path):
+            if video_id in filename:
+                return os.path.join(self.cache_path, filename)
+        return None
+
+    def download_song(self, url: str) -> Optional[Tuple[str, bool]]:
+        video_id, song = self.catalog.lookup(url)
+        if not song:
+            return None
+
+        cached_file = self.cached_path(video_id)
+        if cached_file:
+            return cached_file, True
+
+        self.clock.advance(self.latency['download_overhead']
+                           + song['size'] / self.latency['download_bytes_per_second'])
+        self.bytes_downloaded += song['size']
+        output_path = os.path.join(self.download_path, f"{video_id}.webm")
+        open(output_path, 'wb').close()
+        return output_path, False
+
+    def prefetch(self, urls: List[str], prefix_seconds: Optional[float] = None) -> None:
+        # Pobieranie w wirtualnym czasie jest sekwencyjne, wiec model zostaje konserwatywny
+        pass
+
+    def cancel_prefetch(self, keep=()) -> None:
+        pass
+
+
+class FakeTextAnalyzer:
+    def analyze_text(self, text: str) -> Dict:
+        acceptable = '[explicit]' not in text
+        return {
+            'text_clean': text,
+            'profanity_result': "Lyrics go to NLP model" if acceptable else "Too many swear words",
+            'is_acceptable': acceptable
+        }
+
+
+class FakeTranscriptAPI:
+    def __init__(self, catalog: FakeCatalog, clock: VirtualClock, latency: Dict[str, float]):
+        self.catalog = catalog
+        self.clock = clock
+        self.latency = latency
+        self.calls = 0
+
+    def analyze_audio(self, audio_path: str) -> Optional[str]:
+        self.calls += 1
+        video_id, song = self.catalog.lookup(os.path.basename(audio_path))
+        if not song:
+            return None
+        self.clock.advance(self.latency['transcription_base']
+                           + song['duration'] / 60 * self.latency['transcription_per_audio_minute'])
+        return f"lyrics for {video_id}" + (" [explicit]" if song['explicit'] else "")
+
+
+class FakeSentimentAPI:
+    def __init__(self, catalog: FakeCatalog, clock: VirtualClock, latency: Dict[str, float]):
+        self.catalog = catalog
+        self.clock = clock
+        self.latency = latency
+        self.calls = 0
+
+    def analyze_sentiment(self, text: str) -> Optional[Dict]:
+        self.calls += 1
+        self.clock.advance(self.latency['sentiment'])
+        _, song = self.catalog.lookup(text)
+        if not song:
+            return None
+        return {'is_safe_for_radio': not song['unsafe'], 'confidence': 0.9, 'raw_response': {}}
+
+
+class FakeAimpController:
+    def __init__(self, clock: VirtualClock, latency: Dict[str, float], played_songs_file: str):
+        self.clock = clock
+        self.latency = latency
+        self.played_songs_file = played_songs_file
+        self.client = True
+        self.queue: List[str] = []
+
+    def prepare_for_update(self) -> None:
+        self.clock.advance(self.latency['aimp_restart'])
+        self.queue = []
+
+    def add_song_to_playlist(self, song_path: str) -> None:
+        self.clock.advance(self.latency['aimp_add'])
+        self.queue.append(song_path)
+
+    def play_song(self) -> None:
+        pass
+
+    def start_audio_device(self) -> None:
+        self.clock.advance(self.latency['device_fade'])
+
+    def stop_audio_device(self, device: Optional[str] = None) -> None:
+        self.clock.advance(self.latency['device_fade'])
+
+    def clear_played_songs(self) -> None:
+        open(self.played_songs_file, 'w', encoding='utf-8').close()
+
+    def get_current_track_info(self) -> Optional[Dict[str, str]]:
+        return None
+
+
+class SimulatedPlaylistManager(PlaylistManager):
+    """PlaylistManager whose duration probes come from known durations instead of moviepy."""
+
+    def __init__(self, durations: Dict[str, int], clock: VirtualClock,
+                 latency: Dict[str, float], **kwargs):
+        super().__init__(**kwargs)
+        self.durations = durations
+        self.clock = clock
+        self.latency = latency
+        self.duration_probes = 0
+        self.update_runs: List[Dict] = []
+
+    def update_playlist(self, job=None):
+        before = self._counters()
+        started = self.clock.now()
+        super().update_playlist(job)
+        after = self._counters()
+        queue = self.aimp_controller.queue
+        self.update_runs.append({
+            'started': started,
+            'finished': self.clock.now(),
+            'songs_queued': len(queue),
+            'queued_seconds': sum(self.durations.get(os.path.basename(path), 0) for path in queue),
+            **{key: after[key] - before[key] for key in after}
+        })
+
+    def _counters(self) -> Dict[str, int]:
+        return {
+            'gemini_calls': self.transcript_api.calls + self.sentiment_api.calls,
+            'bytes_downloaded': self.youtube_downloader.bytes_downloaded,
+            'duration_probes': self.duration_probes,
+        }
+
+    def _get_song_duration(self, song_path: str) -> Optional[timedelta]:
+        if not song_path:
+            return None
+        self.duration_probes += 1
+        self.clock.advance(self.latency['duration_probe'])
+        seconds = self.durations.get(os.path.basename(song_path))
+        return timedelta(seconds=seconds) if seconds else None
+
+
+class DaySimulator:
+    """Run a full school day of scheduled jobs in virtual time and collect per-break metrics.
+
+    With several zones every zone has its own player and schedule while the
+    downloader, Gemini fakes, backend and library are shared, as in main.py.
+    """
+
+    def __init__(self, seed: int = 0, votes_per_break: int = 8, library_size: int = 150,
+                 catalog_size: int = 300, latency: Optional[Dict[str, float]] = None,
+                 day: Optional[date] = None, zones: int = 1):
+        self.seed = seed
+        self.zones = zones
+        self.votes_per_break = votes_per_break
+        self.library_size = library_size
+        self.catalog_size = catalog_size
+        self.latency = {**DEFAULT_LATENCY, **(latency or {})}
+        self.day = day or date.today()
+
+    def run(self) -> List[Dict]:
+        """Simulate the day and return one metrics dict per break and zone."""
+        rng = random.Random(self.seed)
+        random.seed(self.seed)  # PlaylistManager picks local songs with the global RNG
+
+        with tempfile.TemporaryDirectory(prefix="radio_sim_") as sandbox:
+            audio_folder = os.path.join(sandbox, "audio")
+            temp_folder = os.path.join(sandbox, "audio_temp")
+            os.makedirs(audio_folder)
+            os.makedirs(temp_folder)
+
+            clock = VirtualClock(datetime.combine(self.day, datetime.min.time()))
+            catalog = FakeCatalog(self.catalog_size, rng)
+            durations = {f"{video_id}.webm": song['duration'] for video_id, song in catalog.songs.items()}
+            for i in range(self.library_size):
+                basename = f"local{i:04d}.mp3"
+                durations[basename] = rng.randint(150, 270)
+                open(os.path.join(audio_folder, basename), 'wb').close()
+
+            engine = {
+                'youtube_downloader': FakeYoutubeDownloader(catalog, clock, self.latency, temp_folder, audio_folder),
+                'text_analyzer': FakeTextAnalyzer(),
+                'transcript_api': FakeTranscriptAPI(catalog, clock, self.latency),
+                'sentiment_api': FakeSentimentAPI(catalog, clock, self.latency),
+                'request_manager': FakeRequestManager(catalog, clock, rng, self.votes_per_break, self.latency),
+                'audio_folder': audio_folder,
+                'temp_folder': temp_folder,
+                'blacklist_file': os.path.join(sandbox, "blacklisted_songs.txt"),
+                'trace_dir': None,
+                'time_source': clock.now,
+                'song_locks': SongLocks(),
+            }
+            # Jobs run inline, so each one advances the virtual clock before the next is due
+            scheduler = DeadlineScheduler(
+                time_source=clock.now,
+                executor=lambda target, *args: target(*args),
+                safety_margin=SCHEDULE_SAFETY_MARGIN_SECONDS
+            )
+            managers = []
+            for i in range(self.zones):
+                zone = "main" if i == 0 else f"zone{i}"
+                played_songs_file = os.path.join(sandbox, "played_songs.txt" if i == 0 else f"played_songs_{zone}.txt")
+                aimp = FakeAimpController(clock, self.latency, played_songs_file)
+                playlist_manager = SimulatedPlaylistManager(
+                    durations, clock, self.latency,
+                    aimp_controller=aimp,
+                    played_songs_file=played_songs_file,
+                    zone=zone,
+                    **engine
+                )
+                ScheduleManager(playlist_manager, aimp, scheduler=scheduler, zone=None if i == 0 else zone,
+                                shared_jobs=i == 0).setup_schedules()
+                managers.append(playlist_manager)
+
+            end_of_day = datetime.combine(self.day, datetime.max.time())
+            while True:
+                next_run = scheduler.next_run_time()
+                if next_run is None or next_run > end_of_day:
+                    break
+                clock.set(next_run)
+                scheduler.run_pending()
+
+            results = []
+            for i, playlist_manager in enumerate(managers):
+                prefix = "update_playlist" if i == 0 else f"{playlist_manager.zone}/update_playlist"
+                occurrences = [occurrence for occurrence in scheduler.get_slack_report()
+                               if occurrence['name'].startswith(prefix)]
+                results.extend(self._break_metrics(run, occurrence, playlist_manager.zone)
+                               for run, occurrence in zip(playlist_manager.update_runs, occurrences))
+            if self.votes_per_break and not sum(r['gemini_calls'] for r in results):
+                # Głosy bez ani jednego wywołania Gemini: weryfikacja w ogóle nie ruszyła
+                raise RuntimeError("Voted songs produced no Gemini calls - the simulated pipeline never "
+                                   "reached vetting (see the errors logged by _process_song)")
+            return results
+
+    def _break_metrics(self, run: Dict, occurrence: Dict, zone: str) -> Dict:
+        deadline = occurrence['deadline']
+        slot = DEVICE_START_TIMES.index(f"{deadline:%H:%M}")
+        stop = datetime.combine(self.day, datetime.strptime(DEVICE_STOP_TIMES[slot], "%H:%M").time())
+        break_seconds = (stop - deadline).total_seconds()
+        return {
+            'zone': zone,
+            'slot': slot,
+            'update_time': f"{run['started']:%H:%M:%S}",
+            'deadline': DEVICE_START_TIMES[slot],
+            'update_seconds': (run['finished'] - run['started']).total_seconds(),
+            'ready_before_deadline': run['finished'] <= deadline,
+            'slack_seconds': (deadline - run['finished']).total_seconds(),
+            'break_seconds': break_seconds,
+            'queued_seconds': run['queued_seconds'],
+            'songs_queued': run['songs_queued'],
+            'fill_ratio': run['queued_seconds'] / break_seconds if break_seconds else 0.0,
+            'gemini_calls': run['gemini_calls'],
+            'bytes_downloaded': run['bytes_downloaded'],
+            'duration_probes': run['duration_probes'],
+        }
+
+
+def format_report(results: List[Dict]) -> str:
+    """Format per-break metrics as a plain-text table (with a zone column for several zones)."""
+    zoned = len({r['zone'] for r in results}) > 1
+    header = (f"{'zone':<8} " if zoned else "") + (
+        f"{'slot':>4} {'update':>8} {'start':>6} {'upd[s]':>7} {'ready':>5} {'slack[s]':>8} "
+        f"{'fill':>6} {'songs':>5} {'gemini':>6} {'MB':>7} {'probes':>6}")
+    lines = [header, '-' * len(header)]
+    for r in results:
+        lines.append(
+            (f"{r['zone']:<8} " if zoned else "") +
+            f"{r['slot']:>4} {r['update_time']:>8} {r['deadline']:>6} {r['update_seconds']:>7.0f} "
+            f"{'yes' if r['ready_before_deadline'] else 'NO':>5} {r['slack_seconds']:>8.0f} "
+            f"{r['fill_ratio']:>6.2f} {r['songs_queued']:>5} {r['gemini_calls']:>6} "
+            f"{r['bytes_downloaded'] / 1_000_000:>7.1f} {r['duration_probes']:>6}"
+        )
+    ready = sum(1 for r in results if r['ready_before_deadline'])
+    lines.append('-' * len(header))
+    lines.append(f"ready before deadline: {ready}/{len(results)}, "
+                 f"gemini calls: {sum(r['gemini_calls'] for r in results)}, "
+                 f"downloaded: {sum(r['bytes_downloaded'] for r in results) / 1_000_000:.1f} MB")
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Simulate a school day of playlist updates in virtual time.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--votes", type=int, default=8, help="voted songs returned per break")
+    parser.add_argument("--library", type=int, default=150, help="songs already in the local library")
+    parser.add_argument("--zones", type=int, default=1, help="zones sharing the vetting engine")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    print(format_report(DaySimulator(seed=args.seed, votes_per_break=args.votes,
+                                     library_size=args.library, zones=args.zones).run()))
@@ -0,0 +1,58 @@
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Set
+
+logger = logging.getLogger(__name__)
+
+
+class SongLocks:
+    """Per-song locks for the zones' updates running side by side on the shared vetting engine.
+
+    A song is downloaded and vetted under its video_id's lock, so when it is
+    voted in several zones the later zones wait for that song alone and then
+    find it in the library and the verdict cache; everything else (preparing
+    AIMP, fetching votes, queueing) runs concurrently. Each running update also
+    claims the video ids it works on, so another zone clearing the shared temp
+    folder, audio budget or prefetch queue leaves them alone.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._songs: Dict[str, List] = {}  # video_id -> [lock, holders and waiters]
+        self._claims: Dict[str, Set[str]] = {}  # zone -> video ids of its running update
+
+    @contextmanager
+    def song(self, video_id: str):
+        """Hold video_id's lock; locks of songs nobody waits for are dropped."""
+        with self._lock:
+            entry = self._songs.setdefault(video_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._songs[video_id]
+
+    @contextmanager
+    def update(self, zone: str):
+        """Mark zone's update as running; its claims end with it."""
+        with self._lock:
+            self._claims[zone] = set()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._claims.pop(zone, None)
+
+    def claim(self, zone: str, video_ids: Iterable[str]) -> None:
+        with self._lock:
+            self._claims.setdefault(zone, set()).update(video_ids)
+
+    def claimed_by_others(self, zone: str) -> List[str]:
+        """Video ids the updates of the other zones are working on."""
+        with self._lock:
+            return [video_id for other, video_ids in self._claims.items() if other != zone for video_id in video_ids]
@@ -0,0 +1,78 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional
+
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """Wall-clock time of each startup step, measured from process start to a playable state.
+
+    step() times a step run in line; run_parallel() runs independent steps on a
+    thread pool and times each of them. format() gives the breakdown for the
+    log, register_metrics() exposes it as radio_startup_seconds{component=...}.
+    """
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = started if started is not None else perf_counter()
+        self.finished = None
+        self.steps: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def step(self, name: str, parallel: bool = False):
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, started, perf_counter(), parallel)
+
+    def record(self, name: str, started: float, finished: float, parallel: bool = False) -> None:
+        """Add a step timed elsewhere (e.g. module imports, before the report existed)."""
+        with self._lock:
+            self.steps.append({
+                'name': name,
+                'offset': started - self.started,
+                'seconds': finished - started,
+                'parallel': parallel,
+            })
+
+    def run_parallel(self, steps: Dict[str, Callable[[], Any]], workers: int = 8) -> Dict[str, Any]:
+        """Run independent steps at once; returns their results by name, re-raising the first failure."""
+        def timed(name: str, func: Callable[[], Any]) -> Any:
+            with self.step(name, parallel=True):
+                return func()
+
+        with ThreadPoolExecutor(max_workers=min(workers, len(steps)) or 1,
+                                thread_name_prefix="Startup") as pool:
+            futures = {name: pool.submit(timed, name, func) for name, func in steps.items()}
+            return {name: future.result() for name, future in futures.items()}
+
+    def finish(self) -> float:
+        self.finished = perf_counter()
+        return self.total
+
+    @property
+    def total(self) -> float:
+        return (self.finished or perf_counter()) - self.started
+
+    def format(self) -> str:
+        lines = [f"{'component':<28}{'start':>8}{'seconds':>9}"]
+        for step in sorted(self.steps, key=lambda step: step['offset']):
+            lines.append(f"{step['name']:<28}{step['offset']:>8.2f}{step['seconds']:>9.2f}"
+                         + ("  ||" if step['parallel'] else ""))
+        serial = sum(step['seconds'] for step in self.steps)
+        lines.append(f"ready after {self.total:.2f}s (steps add up to {serial:.2f}s, || = run in parallel)")
+        return '\n'.join(lines)
+
+    def register_metrics(self) -> None:
+        for step in self.steps:
+            registry.gauge("radio_startup_seconds", "Duration of a startup step",
+                           lambda seconds=step['seconds']: seconds, {'component': step['name']})
+        registry.gauge("radio_startup_total_seconds", "Time from process start to a playable state",
+                       lambda: self.total)
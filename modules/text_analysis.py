@@ -1,23 +1,25 @@
 import re
 from typing import Dict, Set, Optional
-from langdetect import detect
-from ahocorasick import Automaton
 import logging
 from .decorators import handle_exceptions
 from .exceptions import TextAnalysisError
+from .metrics import PROFANITY_SECONDS
 
 logger = logging.getLogger(__name__)
 
 class TextAnalyzer:
     def __init__(self):
-        self.profanity_pl_automaton = Automaton()
-        self.profanity_en_automaton = Automaton()
+        self.profanity_pl_automaton = None
+        self.profanity_en_automaton = None
         self.emoji_unicode_ranges = self._create_emoji_unicode_ranges()
         self.initialized = False
         
     def initialize(self) -> None:
         """Initialize the analyzer with profanity dictionaries."""
         try:
+            from ahocorasick import Automaton
+            self.profanity_pl_automaton = Automaton()
+            self.profanity_en_automaton = Automaton()
             self._load_words_into_automaton("wulgaryzmy_pl.txt", self.profanity_pl_automaton)
             self._load_words_into_automaton("wulgaryzmy_en.txt", self.profanity_en_automaton)
             self.initialized = True
@@ -32,7 +34,8 @@ class TextAnalyzer:
             raise TextAnalysisError("TextAnalyzer not initialized")
             
         text = self.del_emoji(text)
-        profanity_result = self.analyze_profanity(text)
+        with PROFANITY_SECONDS.time():
+            profanity_result = self.analyze_profanity(text)
         
         return {
             'text_clean': text,
@@ -91,7 +94,7 @@ class TextAnalyzer:
         else:
             return "Too many swear words"
 
-    def _count_occurrences(self, text: str, automaton: Automaton) -> Dict[str, int]:
+    def _count_occurrences(self, text: str, automaton) -> Dict[str, int]:
         """Count occurrences of profane words using Aho-Corasick algorithm."""
         counts = {}
         for end_index, word in automaton.iter(text):
@@ -107,7 +110,7 @@ class TextAnalyzer:
         after = text[end + 1] if end < len(text) - 1 else ' '
         return not (before.isalnum() or after.isalnum())
 
-    def _load_words_into_automaton(self, filename: str, automaton: Automaton) -> None:
+    def _load_words_into_automaton(self, filename: str, automaton) -> None:
         """Load words from file into Aho-Corasick automaton."""
         try:
             with open(filename, "r", encoding='utf-8') as file:
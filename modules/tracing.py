@@ -0,0 +1,156 @@
+import json
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from time import perf_counter
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# One-letter codes used in the waterfall bars
+STAGE_CODES = {
+    'fetch': 'F',
+    'download': 'D',
+    'fingerprint': 'H',
+    'captions': 'C',
+    'transcription': 'T',
+    'profanity': 'P',
+    'prescreen': 'L',
+    'sentiment': 'S',
+    'aimp_add': 'A',
+}
+
+
+class SongTrace:
+    """Spans of one song's trip through the vetting pipeline, timed from the update start."""
+
+    def __init__(self, url: str, origin: Optional[float] = None, update_id: Optional[str] = None):
+        self.url = url
+        self.update_id = update_id
+        self.origin = origin if origin is not None else perf_counter()
+        self.started = perf_counter() - self.origin
+        self.spans: List[Dict[str, Any]] = []
+        self.outcome: Optional[str] = None
+        self.finished: Optional[float] = None
+
+    @contextmanager
+    def span(self, stage: str):
+        """Record a stage; the block may set span['outcome'], exceptions mark it 'error'."""
+        span = {'stage': stage, 'start': perf_counter() - self.origin, 'duration': None, 'outcome': 'ok'}
+        try:
+            yield span
+        except Exception:
+            span['outcome'] = 'error'
+            raise
+        finally:
+            span['duration'] = perf_counter() - self.origin - span['start']
+            self.spans.append(span)
+
+    def add_span(self, stage: str, start: float, duration: float, outcome: str = 'ok') -> None:
+        self.spans.append({'stage': stage, 'start': start, 'duration': duration, 'outcome': outcome})
+
+    def finish(self, outcome: str) -> None:
+        self.outcome = self.outcome or outcome
+        self.finished = perf_counter() - self.origin
+
+    @property
+    def total(self) -> float:
+        return (self.finished or perf_counter() - self.origin) - self.started
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'update_id': self.update_id,
+            'url': self.url,
+            'outcome': self.outcome,
+            'start': round(self.started, 4),
+            'total': round(self.total, 4),
+            'spans': [
+                {**span, 'start': round(span['start'], 4), 'duration': round(span['duration'], 4)}
+                for span in self.spans
+            ],
+        }
+
+
+class UpdateTrace:
+    """Collect song traces for one playlist update, write them as JSON lines and summarize them."""
+
+    def __init__(self, trace_dir: Optional[str] = None):
+        self.update_id = datetime.now().strftime('%Y%m%d-%H%M%S')
+        self.origin = perf_counter()
+        self.trace_dir = trace_dir
+        self.songs: List[SongTrace] = []
+        self.update_spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage: str):
+        """Update-level stage (e.g. the backend fetch) shared by every song of the update."""
+        span = {'stage': stage, 'start': perf_counter() - self.origin, 'duration': None, 'outcome': 'ok'}
+        try:
+            yield span
+        except Exception:
+            span['outcome'] = 'error'
+            raise
+        finally:
+            span['duration'] = perf_counter() - self.origin - span['start']
+            self.update_spans.append(span)
+
+    def song(self, url: str) -> SongTrace:
+        trace = SongTrace(url, origin=self.origin, update_id=self.update_id)
+        for span in self.update_spans:
+            trace.add_span(span['stage'], span['start'], span['duration'], span['outcome'])
+        return trace
+
+    def finish_song(self, trace: SongTrace, accepted: bool) -> None:
+        """Close the song's trace and append it to the trace file."""
+        trace.finish('accepted' if accepted else 'rejected')
+        with self._lock:
+            self.songs.append(trace)
+        self._write(trace)
+
+    def summary(self, width: int = 40) -> str:
+        """Waterfall of the update: one bar per song plus time spent per stage."""
+        if not self.songs:
+            return f"Update {self.update_id}: no songs traced"
+
+        end = max(trace.started + trace.total for trace in self.songs) or 1.0
+        scale = width / end
+        lines = [f"Update {self.update_id} waterfall ({end:.1f}s, "
+                 f"{' '.join(f'{code}={stage}' for stage, code in STAGE_CODES.items())})"]
+        stage_totals: Dict[str, float] = {}
+        for trace in self.songs:
+            bar = [' '] * width
+            for span in trace.spans:
+                if span['stage'] != 'fetch':
+                    stage_totals[span['stage']] = stage_totals.get(span['stage'], 0.0) + span['duration']
+                first = min(width - 1, int(span['start'] * scale))
+                last = min(width, max(first + 1, int((span['start'] + span['duration']) * scale)))
+                for i in range(first, last):
+                    bar[i] = STAGE_CODES.get(span['stage'], '?')
+            name = trace.url.rsplit('v=', 1)[-1][:11]
+            lines.append(f"{name:<11} |{''.join(bar)}| {trace.total:6.1f}s {trace.outcome}")
+
+        total = sum(stage_totals.values()) or 1.0
+        ranked = sorted(stage_totals.items(), key=lambda item: item[1], reverse=True)
+        lines.append("stage totals: " + ", ".join(
+            f"{stage} {seconds:.1f}s ({seconds / total:.0%})" for stage, seconds in ranked))
+        if ranked:
+            lines.append(f"bottleneck: {ranked[0][0]}")
+        return '\n'.join(lines)
+
+    def log_summary(self) -> None:
+        logger.info(self.summary())
+
+    def _write(self, trace: SongTrace) -> None:
+        if not self.trace_dir:
+            return
+        try:
+            os.makedirs(self.trace_dir, exist_ok=True)
+            path = os.path.join(self.trace_dir, f"traces_{datetime.now().strftime('%Y%m%d')}.jsonl")
+            line = json.dumps(trace.to_dict(), ensure_ascii=False)
+            with self._lock, open(path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        except Exception as e:
+            logger.error(f"Error writing song trace: {e}")
@@ -0,0 +1,176 @@
+import json
+import os
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateJournal:
+    """Per-song progress of the running playlist update, kept on disk to resume after a crash.
+
+    The journal is an append-only JSON-lines file: a header line with the day
+    and the break the update prepares, then one line per stage a song reaches
+    (started, downloaded, transcribed, vetted, queued, done) with the artifacts
+    of that stage. Every line is flushed and fsynced; a torn last line left by a
+    crash is cut off on load, so the next record starts on a line of its own.
+    finish() removes the file, so a journal found at the start of an update
+    means the previous one on that day did not complete.
+
+    If the interrupted update's break has already started, its queued songs
+    have played (or were dropped with the playlist): requeue is then False and
+    the 'queued' records are discarded, while downloads and verdicts are kept.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.active = False
+        self.requeue = False
+        self._day: Optional[str] = None
+        self._header: Dict[str, Any] = {}
+        self._records: List[Dict[str, Any]] = []
+        self._states: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def begin(self, day: str, break_start: Optional[datetime] = None, now: Optional[datetime] = None) -> bool:
+        """Start an update for the break at break_start; True when an unfinished update of the day is resumed.
+
+        requeue tells whether the songs it queued belong on the new playlist,
+        i.e. whether its break has not started by now.
+        """
+        with self._lock:
+            self._day = day
+            self._records, self._states = [], {}
+            self.requeue = False
+            header = {'day': day, 'break': break_start.isoformat() if break_start else None}
+            resumed = self._load(day)
+            if resumed:
+                previous = self._header.get('break')
+                self.requeue = bool(previous and now and datetime.fromisoformat(previous) > now)
+                if not self.requeue:
+                    # Przerwa przerwanej aktualizacji już trwa lub minęła - jej kolejka jest nieaktualna
+                    kept = [record for record in self._records if record['stage'] != 'queued']
+                    self._records, self._states = [], {}
+                    for record in kept:
+                        self._apply(record)
+                    self._rewrite([header] + kept)
+            else:
+                self._write(header, truncate=True)
+            self.active = True
+            if resumed:
+                logger.info(f"Resuming an interrupted playlist update: {len(self._states)} songs in the journal"
+                            + ("" if self.requeue else ", its break has started so nothing is re-queued"))
+            return resumed
+
+    def record(self, key: str, stage: str, **artifacts) -> None:
+        """Append a stage reached by a song; no-op outside begin()/finish()."""
+        if not self.active:
+            return
+        record = {'key': key, 'stage': stage, **artifacts}
+        with self._lock:
+            self._apply(record)
+            self._write(record)
+
+    def state(self, key: str) -> Dict[str, Any]:
+        """Latest stage and all artifacts recorded for a song (empty if none)."""
+        with self._lock:
+            return dict(self._states.get(key, {}))
+
+    def queued(self) -> List[Dict[str, Any]]:
+        """'queued' records in the order the songs were added to the playlist."""
+        with self._lock:
+            return [dict(record) for record in self._records if record['stage'] == 'queued']
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._states)
+
+    def close(self) -> None:
+        """Stop recording but keep the file, so the next update resumes from it."""
+        with self._lock:
+            self.active = False
+
+    def finish(self) -> None:
+        with self._lock:
+            self.active = False
+            self._records, self._states = [], {}
+            if self.path and os.path.exists(self.path):
+                try:
+                    os.remove(self.path)
+                except Exception as e:
+                    logger.error(f"Error removing update journal {self.path}: {e}")
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        self._records.append(record)
+        state = self._states.setdefault(record['key'], {})
+        state.update({key: value for key, value in record.items() if key != 'key'})
+
+    def _load(self, day: str) -> bool:
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+            data = self._repair_tail(data)
+        except Exception as e:
+            logger.error(f"Error reading update journal {self.path}: {e}")
+            return False
+        records = []
+        for line in data.decode('utf-8', errors='replace').splitlines():
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                logger.warning(f"Skipping a damaged line in {self.path}")
+        if not records or records[0].get('day') != day:
+            return False
+        self._header = records[0]
+        for record in records[1:]:
+            if 'key' in record and 'stage' in record:
+                self._apply(record)
+        return True
+
+    def _repair_tail(self, data: bytes) -> bytes:
+        """End the file with a newline, so appends never continue a line torn by a crash; the repaired data."""
+        if not data or data.endswith(b'\n'):
+            return data
+        end = data.rfind(b'\n') + 1
+        try:
+            json.loads(data[end:])
+            complete = True
+        except ValueError:
+            complete = False
+        with open(self.path, 'r+b') as f:
+            if complete:
+                # Zapis przerwany tuż przed znakiem nowej linii - rekord jest cały
+                f.seek(0, os.SEEK_END)
+                f.write(b'\n')
+            else:
+                logger.warning(f"Cutting a torn last line ({len(data) - end} bytes) off {self.path}")
+                f.truncate(end)
+            f.flush()
+            os.fsync(f.fileno())
+        return data + b'\n' if complete else data[:end]
+
+    def _rewrite(self, records: List[Dict[str, Any]]) -> None:
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception as e:
+            logger.error(f"Error writing update journal {self.path}: {e}")
+
+    def _write(self, record: Dict[str, Any], truncate: bool = False) -> None:
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'w' if truncate else 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception as e:
+            logger.error(f"Error writing update journal {self.path}: {e}")
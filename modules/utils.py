@@ -2,7 +2,6 @@ from datetime import datetime, timedelta
 import logging
 import os
 from typing import Tuple, Optional
-from moviepy.editor import AudioFileClip
 from .decorators import log_errors
 from config import (
     PROMPT_SENTIMENT,
@@ -39,6 +38,7 @@ def get_song_length(audio_file: str) -> Optional[timedelta]:
         return None
         
     try:
+        from moviepy.editor import AudioFileClip
         audio = AudioFileClip(audio_file)
         duration = timedelta(seconds=audio.duration)
         audio.close()
@@ -89,4 +89,12 @@ def ensure_directories_exist() -> None:
     for directory in directories:
         if not os.path.exists(directory):
             os.makedirs(directory)
-            logger.info(f"Created directory: {directory}")
\ No newline at end of file
+            logger.info(f"Created directory: {directory}")
+
+def ffmpeg_binary() -> str:
+    """Return the ffmpeg executable bundled with moviepy, falling back to the one on PATH."""
+    try:
+        from moviepy.config import get_setting
+        return get_setting("FFMPEG_BINARY")
+    except Exception:
+        return "ffmpeg"
\ No newline at end of file
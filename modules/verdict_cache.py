@@ -0,0 +1,102 @@
+import json
+import os
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class VerdictCache:
+    """Vetting verdicts keyed by video_id, persisted as JSON.
+
+    An entry holds the outcome ('accepted' or a 'rejected_*' reason), the
+    sentiment confidence, the transcript when there was one and, for songs that
+    were recognised as a copy of an already vetted song, the video_id the verdict
+    was inherited from. Transcripts with their Gemini verdicts double as training
+    data for local pre-screening. Listeners registered with subscribe() get every
+    locally recorded verdict; merge() takes verdicts from other nodes.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.RLock()
+        self._listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+        self._load()
+
+    def subscribe(self, on_record: Callable[[str, Dict[str, Any]], None]) -> None:
+        """on_record gets the video_id and a copy of every entry record() stores."""
+        self._listeners.append(on_record)
+
+    def get(self, video_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(video_id)
+            return dict(entry) if entry else None
+
+    def record(self, video_id: str, outcome: str, confidence: Optional[float] = None,
+               transcript: Optional[str] = None, **fields) -> None:
+        with self._lock:
+            self._entries[video_id] = {
+                'outcome': outcome,
+                'accepted': outcome == 'accepted',
+                'confidence': confidence,
+                'transcript': transcript,
+                'updated_at': datetime.now().isoformat(),
+                **fields,
+            }
+            self._save()
+            entry = dict(self._entries[video_id])
+        for listener in self._listeners:
+            try:
+                listener(video_id, entry)
+            except Exception as e:
+                logger.error(f"Error in verdict listener: {e}")
+
+    def merge(self, video_id: str, entry: Dict[str, Any]) -> bool:
+        """Store a verdict from elsewhere unless the local one is newer; True if it was stored.
+
+        Conflicts are resolved by updated_at, the later verdict wins; listeners are
+        not told, so merged verdicts are not taken for local ones.
+        """
+        with self._lock:
+            current = self._entries.get(video_id)
+            if current and current.get('updated_at', '') >= entry.get('updated_at', ''):
+                return False
+            self._entries[video_id] = dict(entry)
+            self._save()
+            return True
+
+    def entries(self) -> Dict[str, Dict[str, Any]]:
+        """Return a copy of all entries."""
+        with self._lock:
+            return {video_id: dict(entry) for video_id, entry in self._entries.items()}
+
+    def __contains__(self, video_id: str) -> bool:
+        with self._lock:
+            return video_id in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading verdict cache {self.path}: {e}")
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        try:
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            logger.error(f"Error saving verdict cache {self.path}: {e}")
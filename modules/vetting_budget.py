@@ -0,0 +1,150 @@
+import json
+import os
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+def next_deadline(now: datetime, start_times: Sequence[str], stop_times: Sequence[str],
+                  margin: float = 0.0) -> datetime:
+    """When the queue has to be ready: the next device start, or the end of a break already running."""
+    for start, stop in zip(start_times, stop_times):
+        start_at = datetime.combine(now.date(), datetime.strptime(start, "%H:%M").time())
+        stop_at = datetime.combine(now.date(), datetime.strptime(stop, "%H:%M").time())
+        if start_at - timedelta(seconds=margin) > now:
+            return start_at - timedelta(seconds=margin)
+        if stop_at > now:
+            return stop_at
+    first_start = datetime.strptime(start_times[0], "%H:%M").time()
+    return datetime.combine(now.date() + timedelta(days=1), first_start) - timedelta(seconds=margin)
+
+
+class CostModel:
+    """Running estimate of how long vetting one song takes.
+
+    A song already in the library costs a flat `cached` time; a new song costs
+    `overhead` plus `per_audio_second` times its length (download, transcription
+    and sentiment all grow with it). Both learned values follow the measured
+    times as exponential moving averages.
+    """
+
+    def __init__(self, overhead: float = 8.0, per_audio_second: float = 0.05,
+                 cached: float = 1.0, alpha: float = 0.3):
+        self.overhead = overhead
+        self.per_audio_second = per_audio_second
+        self.cached = cached
+        self.alpha = alpha
+
+    def estimate(self, duration_seconds: float, cached: bool) -> float:
+        if cached:
+            return self.cached
+        return self.overhead + self.per_audio_second * duration_seconds
+
+    def observe(self, duration_seconds: float, cached: bool, seconds: float) -> None:
+        if cached:
+            self.cached += self.alpha * (seconds - self.cached)
+        elif duration_seconds > 0:
+            rate = max(0.0, seconds - self.overhead) / duration_seconds
+            self.per_audio_second += self.alpha * (rate - self.per_audio_second)
+
+
+class UpdateBudget:
+    """Time budget of one playlist update with planned and actual use per song."""
+
+    def __init__(self, deadline: datetime, time_source: Callable[[], datetime] = datetime.now):
+        self.deadline = deadline
+        self.time_source = time_source
+        self.started = time_source()
+        self.planned = 0.0
+        self.used = 0.0
+        self.songs = 0
+        self.carried: Dict[str, int] = {}
+
+    @property
+    def total(self) -> float:
+        return max(0.0, (self.deadline - self.started).total_seconds())
+
+    def remaining(self) -> float:
+        return (self.deadline - self.time_source()).total_seconds()
+
+    def fits(self, estimate: float) -> bool:
+        return estimate <= self.remaining()
+
+    def record(self, estimate: float, actual: float) -> None:
+        self.planned += estimate
+        self.used += actual
+        self.songs += 1
+
+    def carry(self, reason: str) -> None:
+        self.carried[reason] = self.carried.get(reason, 0) + 1
+
+    def log_summary(self) -> None:
+        carried = ", ".join(f"{reason} {count}" for reason, count in self.carried.items()) or "none"
+        logger.info(f"Update budget {self.total:.0f}s until {self.deadline:%H:%M:%S}: planned {self.planned:.0f}s, "
+                    f"used {self.used:.0f}s for {self.songs} songs, {self.remaining():.0f}s left; "
+                    f"carried over: {carried}")
+
+
+class CarryOver:
+    """Voted songs cut off from one update, queued first in the next one on the same day."""
+
+    def __init__(self, path: Optional[str] = None, max_songs: int = 10,
+                 today: Callable[[], date] = date.today):
+        self.path = path
+        self.max_songs = max_songs
+        self.today = today
+        self._songs: List[Dict[str, Any]] = []
+        self._day: Optional[str] = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def take(self) -> List[Dict[str, Any]]:
+        """Return and clear the carried songs; songs carried on an earlier day are dropped."""
+        with self._lock:
+            songs = self._songs if self._day == self.today().isoformat() else []
+            self._songs = []
+            self._save()
+            return songs
+
+    def put(self, songs: List[Dict[str, Any]]) -> int:
+        """Queue songs in the given order up to max_songs; returns how many were kept."""
+        with self._lock:
+            urls = {song['url'] for song in self._songs}
+            kept = 0
+            for song in songs:
+                if song['url'] in urls or len(self._songs) >= self.max_songs:
+                    continue
+                self._songs.append(song)
+                urls.add(song['url'])
+                kept += 1
+            self._day = self.today().isoformat()
+            self._save()
+            return kept
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._songs)
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._songs, self._day = data.get('songs', []), data.get('day')
+        except Exception as e:
+            logger.error(f"Error loading carried-over songs {self.path}: {e}")
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        try:
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'day': self._day, 'songs': self._songs}, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            logger.error(f"Error saving carried-over songs {self.path}: {e}")
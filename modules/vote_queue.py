@@ -0,0 +1,63 @@
+import logging
+import queue
+import threading
+from collections import OrderedDict
+from threading import Thread
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class VoteQueue:
+    """Voted songs that arrived between playlist updates.
+
+    put() is called by the vote subscription as soon as votes come in; a single
+    worker thread hands every new song to the prepare callback (which starts its
+    download), so the work is under way long before the next update. The update
+    then take()s the songs in arrival order; a song voted again replaces its
+    earlier entry (e.g. with a higher vote count).
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self._songs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._work: "queue.Queue" = queue.Queue(maxsize=maxsize)
+        self._prepare: Optional[Callable[[Dict[str, Any]], None]] = None
+
+    def start(self, prepare: Callable[[Dict[str, Any]], None]) -> None:
+        self._prepare = prepare
+        Thread(target=self._worker, daemon=True, name="VoteQueue").start()
+
+    def put(self, songs: List[Dict[str, Any]]) -> None:
+        for song in songs:
+            with self._lock:
+                new = song['url'] not in self._songs
+                self._songs[song['url']] = song
+            if new:
+                try:
+                    self._work.put_nowait(song)
+                except queue.Full:
+                    # Piosenka i tak trafi do następnej aktualizacji, tylko bez wcześniejszego pobrania
+                    logger.warning(f"Vote queue is full, not preparing {song['url']} ahead of the update")
+
+    def take(self) -> List[Dict[str, Any]]:
+        """Return and clear the songs received since the last take()."""
+        with self._lock:
+            songs, self._songs = list(self._songs.values()), OrderedDict()
+        return songs
+
+    def urls(self) -> List[str]:
+        with self._lock:
+            return list(self._songs)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._songs)
+
+    def _worker(self) -> None:
+        while True:
+            song = self._work.get()
+            try:
+                self._prepare(song)
+            except Exception as e:
+                logger.error(f"Error preparing voted song {song.get('url')}: {e}")
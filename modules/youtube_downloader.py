@@ -1,47 +1,327 @@
 import os
-import time
+import re
+import subprocess
 import logging
-from typing import Optional, Tuple
-from pytubefix import YouTube, extract
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
 from .decorators import handle_exceptions
-from config import AUDIO_FOLDER_TEMP_PATH, AUDIO_FOLDER_PATH
+from .download_manager import DownloadManager
+from .metrics import DOWNLOAD_SECONDS
+from .utils import ffmpeg_binary
+from config import (AUDIO_FOLDER_TEMP_PATH, AUDIO_FOLDER_PATH, CAPTION_LANGUAGES, CAPTION_MIN_WORDS,
+                    DOWNLOAD_CONCURRENCY, DOWNLOAD_CHUNK_BYTES, DOWNLOAD_BANDWIDTH_BYTES_PER_SECOND,
+                    DOWNLOAD_RETRIES, PREFETCH_MAX_PENDING)
+
+if TYPE_CHECKING:
+    from pytubefix import YouTube
 
 logger = logging.getLogger(__name__)
 
+# Caption lines that are not lyrics: [Music], (Muzyka), ♪ alone, etc.
+CAPTION_NOISE = re.compile(r"[\[\(][^\]\)]*[\]\)]|[♪♫]")
+SRT_TIMING = re.compile(r"^\d+$|^\d{2}:\d{2}:\d{2}[,.]\d{3} --> ")
+
+
+def _video_id(url: str) -> str:
+    # pytubefix jest ciężki w imporcie, ładujemy go dopiero przy pierwszej piosence
+    from pytubefix import extract
+    return extract.video_id(url)
+
+
 class YoutubeDownloader:
-    def __init__(self):
+    def __init__(self, download_manager: Optional[DownloadManager] = None, audio_budget=None,
+                 max_prefetch: int = PREFETCH_MAX_PENDING):
         self.download_path = AUDIO_FOLDER_TEMP_PATH
         self.cache_path = AUDIO_FOLDER_PATH
+        self.download_manager = download_manager or DownloadManager(
+            max_concurrent=DOWNLOAD_CONCURRENCY,
+            chunk_size=DOWNLOAD_CHUNK_BYTES,
+            bandwidth=DOWNLOAD_BANDWIDTH_BYTES_PER_SECOND,
+            retries=DOWNLOAD_RETRIES
+        )
         
         # Create directories if they don't exist
         os.makedirs(self.download_path, exist_ok=True)
         os.makedirs(self.cache_path, exist_ok=True)
+
+        # video_id -> filename in the library, built once instead of listing the folder per song
+        self._cache_index: Optional[Dict[str, str]] = None
+        self._cache_lock = threading.Lock()
+
+        # Recently created YouTube objects, so captions and the download share one metadata fetch
+        self._videos: "OrderedDict[str, YouTube]" = OrderedDict()
+        self._videos_lock = threading.Lock()
+
+        # Temp files that hold only the opening segment of a song, by path
+        self._partials: Dict[str, Dict[str, Any]] = {}
+
+        # Downloads started ahead by prefetch(), by video_id
+        self._prefetched: Dict[str, Future] = {}
+        self._prefetch_lock = threading.Lock()
+        # Songs to prefetch once fewer than max_prefetch are pending, in vote order
+        self._waiting: "OrderedDict[str, Tuple[str, Optional[float]]]" = OrderedDict()
+        self.max_prefetch = max_prefetch
+
+        # Bytes of audio awaiting vetting; a download reserves its size before it starts
+        self.audio_budget = audio_budget
     
     @handle_exceptions
-    def download_song(self, url: str) -> Optional[Tuple[str, bool]]:
-        """Download song from YouTube or return from cache."""
-        video_id = extract.video_id(url)
-        
+    def download_song(self, url: str, prefix_seconds: Optional[float] = None) -> Optional[Tuple[str, bool]]:
+        """Download song from YouTube or return from cache.
+
+        With prefix_seconds only about that much of the opening audio is fetched;
+        is_partial() is then true for the returned path until complete_download().
+        A download started by prefetch() is waited for instead of started again.
+        """
+        video_id = _video_id(url)
+        if self.audio_budget:
+            self.audio_budget.prioritize(video_id)
+        with self._prefetch_lock:
+            future = self._prefetched.pop(video_id, None)
+            self._waiting.pop(video_id, None)
+            self._submit_waiting()
+        if future is not None and not future.cancel():
+            return future.result()
+        return self._download(url, video_id, prefix_seconds)
+
+    def prefetch(self, urls: List[str], prefix_seconds: Optional[float] = None) -> None:
+        """Start downloading songs in the background, at most DOWNLOAD_CONCURRENCY at a time.
+
+        The playlist update then vets song after song while the next ones are
+        already arriving; download_song() picks up the started downloads. At most
+        max_prefetch songs are started and not yet picked up; the rest wait and
+        start as the update takes songs. With an audio budget the downloads also
+        pause while it is used up by songs still being vetted.
+        """
+        for url in urls:
+            try:
+                video_id = _video_id(url)
+            except Exception as e:
+                logger.warning(f"Not prefetching {url}: {e}")
+                continue
+            with self._prefetch_lock:
+                if video_id not in self._prefetched:
+                    self._waiting.setdefault(video_id, (url, prefix_seconds))
+        with self._prefetch_lock:
+            self._submit_waiting()
+
+    def cancel_prefetch(self, keep: Iterable[str] = ()) -> None:
+        """Drop prefetched downloads that were not asked for (e.g. a cancelled update).
+
+        Downloads of the video ids in keep go on (songs already voted for the next update).
+        """
+        keep = set(keep)
+        with self._prefetch_lock:
+            dropped = {video_id: future for video_id, future in self._prefetched.items() if video_id not in keep}
+            self._prefetched = {video_id: future for video_id, future in self._prefetched.items()
+                                if video_id in keep}
+            self._waiting = OrderedDict((video_id, song) for video_id, song in self._waiting.items()
+                                        if video_id in keep)
+            self._submit_waiting()
+        for video_id, future in dropped.items():
+            future.cancel()
+            if self.audio_budget:
+                self.audio_budget.release(video_id)
+
+    def _submit_waiting(self) -> None:
+        """Start waiting songs while fewer than max_prefetch are pending; call with _prefetch_lock held."""
+        while self._waiting and len(self._prefetched) < self.max_prefetch:
+            video_id, (url, prefix_seconds) = self._waiting.popitem(last=False)
+            self._prefetched[video_id] = self.download_manager.submit(
+                self._download_quietly, url, video_id, prefix_seconds)
+
+    def _download_quietly(self, url: str, video_id: str,
+                          prefix_seconds: Optional[float]) -> Optional[Tuple[str, bool]]:
+        try:
+            return self._download(url, video_id, prefix_seconds)
+        except Exception as e:
+            logger.error(f"Prefetch of {url} failed: {e}")
+            return None
+
+    def _download(self, url: str, video_id: str, prefix_seconds: Optional[float]) -> Optional[Tuple[str, bool]]:
         # Check cache first
-        cached_file = self._check_cache(video_id)
+        cached_file = self.cached_path(video_id)
         if cached_file:
             logger.info(f"Found cached file: {cached_file}")
             return cached_file, True
+
+        if prefix_seconds:
+            prefix_path = self._download_prefix(url, video_id, prefix_seconds)
+            if prefix_path:
+                return prefix_path, False
             
         # Download if not cached
         return self._perform_download(url, video_id)
+
+    def is_partial(self, path: str) -> bool:
+        return path in self._partials
+
+    def partial_info(self, path: str) -> Optional[Dict[str, Any]]:
+        info = self._partials.get(path)
+        return dict(info) if info else None
+
+    def complete_download(self, path: str) -> bool:
+        """Fetch the rest of a partial download; the prefix already on disk is continued."""
+        partial = self._partials.get(path)
+        if not partial:
+            return True
+        try:
+            have = os.path.getsize(path)
+            if have < partial['size']:
+                video_id = os.path.splitext(os.path.basename(path))[0]
+                self._reserve(video_id, partial['size'], urgent=True)
+                logger.info(f"Completing download of {os.path.basename(path)} "
+                            f"({(partial['size'] - have) / 1024 ** 2:.1f} MiB left)")
+                with DOWNLOAD_SECONDS.time():
+                    self.download_manager.fetch(partial['url'], path, partial['size'])
+        except Exception as e:
+            logger.error(f"Completing download of {path} failed: {e}")
+            return False
+        del self._partials[path]
+        return True
+
+    def restore_partial(self, path: str, info: Dict[str, Any]) -> None:
+        """Register a partial download left by an earlier run (info as returned by partial_info())."""
+        self._partials[path] = dict(info)
+
+    def discard_partial(self, path: str) -> Optional[Dict[str, Any]]:
+        """Forget a partial download that will not be completed; returns its info."""
+        return self._partials.pop(path, None)
+
+    def clip(self, path: str, start: float = 0.0, duration: Optional[float] = None) -> Optional[str]:
+        """Cut a segment of an audio file with ffmpeg (stream copy); None if ffmpeg fails."""
+        stem, extension = os.path.splitext(path)
+        output_path = f"{stem}.{int(start)}-{int(duration) if duration else 'end'}{extension}"
+        command = [ffmpeg_binary(), "-y", "-v", "error", "-ss", str(start), "-i", path]
+        if duration:
+            command += ["-t", str(duration)]
+        command += ["-vn", "-c", "copy", output_path]
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0 or not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+            logger.error(f"Cutting {path} at {start}s failed: {result.stderr.strip()[-300:]}")
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            return None
+        return output_path
+
+    def _download_prefix(self, url: str, video_id: str, seconds: float) -> Optional[str]:
+        """Fetch roughly the first seconds of the audio stream with an HTTP range request."""
+        try:
+            video = self._video(url, video_id)
+            stream = self._get_best_audio_stream(video)
+            if not stream:
+                return None
+            size, length = stream.filesize, video.length
+            if not size or not length or length < seconds * 1.5:
+                # Krótki utwór - taniej pobrać całość
+                return None
+
+            # Bitrate is roughly constant; 10% and 64 KiB extra cover container headers and VBR
+            prefix_bytes = min(size, int(size * seconds / length * 1.1) + 64 * 1024)
+            output_path = os.path.join(self.download_path, f"{video_id}{self._get_extension(stream)}")
+            self._reserve(video_id, prefix_bytes)
+            logger.info(f"Downloading first {seconds:.0f}s of {url} ({prefix_bytes / 1024 ** 2:.1f} "
+                        f"of {size / 1024 ** 2:.1f} MiB)")
+            with DOWNLOAD_SECONDS.time():
+                self.download_manager.fetch(stream.url, output_path, prefix_bytes)
+            self._partials[output_path] = {
+                'url': stream.url,
+                'size': size,
+                'prefix_bytes': os.path.getsize(output_path),
+                'prefix_seconds': seconds,
+                'duration': length,
+            }
+            return output_path
+        except Exception as e:
+            logger.error(f"Partial download failed, falling back to a full download: {e}")
+            return None
+
+    def cached_path(self, video_id: str) -> Optional[str]:
+        """Return the library file of a video, if it is cached."""
+        with self._cache_lock:
+            if self._cache_index is None:
+                self._cache_index = {
+                    os.path.splitext(filename)[0]: filename for filename in os.listdir(self.cache_path)
+                }
+            filename = self._cache_index.get(video_id)
+        return os.path.join(self.cache_path, filename) if filename else None
+
+    def register_cached(self, path: str) -> None:
+        """Add a file that entered the library to the cache index."""
+        filename = os.path.basename(path)
+        with self._cache_lock:
+            if self._cache_index is not None:
+                self._cache_index[os.path.splitext(filename)[0]] = filename
+
+    def forget(self, basename: str) -> None:
+        """Drop a file that left the library from the cache index."""
+        with self._cache_lock:
+            if self._cache_index is not None:
+                self._cache_index.pop(os.path.splitext(basename)[0], None)
         
-    def _check_cache(self, video_id: str) -> Optional[str]:
-        """Check if song exists in cache."""
-        for filename in os.listdir(self.cache_path):
-            if video_id in filename:
-                return os.path.join(self.cache_path, filename)
-        return None
-        
+    @handle_exceptions
+    def fetch_captions(self, url: str, languages: List[str] = CAPTION_LANGUAGES,
+                       min_words: int = CAPTION_MIN_WORDS) -> Optional[str]:
+        """Return lyrics from the video's caption tracks, or None if it has no usable captions.
+
+        Manual tracks in the preferred languages win over auto-generated ones, which
+        for music are often just [Music]; the text must have at least min_words
+        words once such tags are stripped.
+        """
+        video_id = _video_id(url)
+        track = self._pick_caption_track(list(self._video(url, video_id).captions), languages)
+        if not track:
+            return None
+
+        text = self._caption_text(track)
+        if len(text.split()) < min_words:
+            logger.info(f"Captions {track.code} of {video_id} too short to use as lyrics")
+            return None
+        logger.info(f"Using captions {track.code} as lyrics for {video_id}")
+        return text
+
+    @staticmethod
+    def _pick_caption_track(tracks, languages: List[str]):
+        codes = {track.code: track for track in tracks}
+        for code in languages:
+            if code in codes:
+                return codes[code]
+        for code in languages:
+            if f"a.{code}" in codes:
+                return codes[f"a.{code}"]
+        manual = [track for track in tracks if not track.code.startswith("a.")]
+        return manual[0] if manual else None
+
+    @staticmethod
+    def _caption_text(track) -> str:
+        """Plain caption text without timings, tags and repeated lines."""
+        lines = []
+        for line in track.generate_srt_captions().splitlines():
+            line = line.strip()
+            if not line or SRT_TIMING.match(line):
+                continue
+            line = CAPTION_NOISE.sub("", line).strip()
+            if line and (not lines or lines[-1] != line):
+                lines.append(line)
+        return "\n".join(lines)
+
+    def _video(self, url: str, video_id: str) -> "YouTube":
+        from pytubefix import YouTube
+        with self._videos_lock:
+            video = self._videos.get(video_id)
+            if video is None:
+                video = YouTube(url)
+                self._videos[video_id] = video
+                while len(self._videos) > 16:
+                    self._videos.popitem(last=False)
+            return video
+
     def _perform_download(self, url: str, video_id: str) -> Optional[Tuple[str, bool]]:
         """Perform actual download from YouTube."""
         try:
-            video = YouTube(url)
+            video = self._video(url, video_id)
             stream = self._get_best_audio_stream(video)
             if not stream:
                 logger.error("No suitable audio stream found")
@@ -49,10 +329,12 @@ class YoutubeDownloader:
                 
             filename = f"{video_id}{self._get_extension(stream)}"
             output_path = os.path.join(self.download_path, filename)
+            self._reserve(video_id, stream.filesize or 0)
             
             logger.info(f"Downloading {url} to {output_path}")
-            stream.download(output_path=self.download_path, filename=filename)
-            time.sleep(3)  # Wait for file to be ready
+            with DOWNLOAD_SECONDS.time():
+                # Plik pojawia sie pod docelowa nazwa dopiero, gdy ma wszystkie bajty
+                self.download_manager.fetch(stream.url, output_path, stream.filesize or None)
             
             return output_path, False
             
@@ -60,8 +342,16 @@ class YoutubeDownloader:
             logger.error(f"Download failed: {e}")
             return None
             
+    def _reserve(self, video_id: str, size: int, urgent: bool = False) -> None:
+        """Wait until the audio budget has room for size bytes of this song."""
+        if not self.audio_budget:
+            return
+        if urgent:
+            self.audio_budget.prioritize(video_id)
+        self.audio_budget.reserve(video_id, size)
+
     @staticmethod
-    def _get_best_audio_stream(video: YouTube):
+    def _get_best_audio_stream(video: "YouTube"):
         """Get best available audio stream."""
         for mime_type in ["audio/webm", "audio/mp3"]:
             stream = video.streams.filter(mime_type=mime_type).first()
@@ -0,0 +1,160 @@
+import os
+import logging
+from typing import Any, Dict, Optional
+
+from .aimp_controller import AimpController
+from .aimp_supervisor import AimpSupervisor
+from .deadline_scheduler import DeadlineScheduler
+from .job_runner import JobRunner, PLAYLIST_UPDATE_JOB, PLAYLIST_UPDATE_LOCAL_JOB
+from .metrics import register_zone_gauges
+from .player_state import PlayerStateCache
+from .playlist_manager import PlaylistManager
+from .request_manager import CommandServer
+from .schedule_manager import ScheduleManager
+from .update_journal import UpdateJournal
+from .vetting_budget import CarryOver
+from .vote_queue import VoteQueue
+from config import (
+    MAIN_AUDIO_DEVICE_NAME,
+    AIMP_PLAYLIST_PATH,
+    PLAYED_SONGS_FILE,
+    CARRY_OVER_FILE,
+    CARRY_OVER_MAX_SONGS,
+    UPDATE_JOURNAL_FILE,
+    PLAYLIST_UPDATE_TIMES,
+    DEVICE_START_TIMES,
+    DEVICE_STOP_TIMES,
+    PLAYER_STATE_TTL_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+
+def zone_settings(entry: Dict[str, Any], primary: bool) -> Dict[str, Any]:
+    """Complete a ZONES entry with the global settings.
+
+    The primary (first) zone keeps the file names of a single-zone setup, so its
+    played songs, carry-over and journal survive the switch; the files of other
+    zones get a _<name> suffix.
+    """
+    name = entry['name']
+
+    def zone_file(path: str) -> str:
+        if primary:
+            return path
+        root, extension = os.path.splitext(path)
+        return f"{root}_{name}{extension}"
+
+    settings = {
+        'device': MAIN_AUDIO_DEVICE_NAME,
+        'player_command': "aimp",
+        'playlist_path': AIMP_PLAYLIST_PATH,
+        'played_songs_file': zone_file(PLAYED_SONGS_FILE),
+        'carry_over_file': zone_file(CARRY_OVER_FILE),
+        'journal_file': zone_file(UPDATE_JOURNAL_FILE),
+        'command_port': 5050,
+        'update_times': PLAYLIST_UPDATE_TIMES,
+        'start_times': DEVICE_START_TIMES,
+        'stop_times': DEVICE_STOP_TIMES,
+    }
+    settings.update(entry)
+    return settings
+
+
+class Zone:
+    """One playout zone: its own player, schedule and playlist on top of the shared vetting engine.
+
+    The engine is a dict of the components that cost downloads and Gemini calls
+    (downloader, text analyzer, Gemini clients, verdict cache, fingerprints,
+    library, pre-screen) plus the per-song locks of the zones' updates; every
+    zone's PlaylistManager is built from the same one.
+    """
+
+    def __init__(self, name: str, aimp_controller, playlist_manager: PlaylistManager,
+                 schedule_manager: ScheduleManager, player_state: PlayerStateCache,
+                 command_server: Optional[CommandServer] = None, primary: bool = True,
+                 supervisor: Optional[AimpSupervisor] = None):
+        self.name = name
+        self.aimp_controller = aimp_controller
+        self.playlist_manager = playlist_manager
+        self.schedule_manager = schedule_manager
+        self.player_state = player_state
+        self.command_server = command_server
+        self.primary = primary
+        self.supervisor = supervisor
+
+    @property
+    def update_job(self) -> str:
+        return PLAYLIST_UPDATE_JOB if self.primary else f"{PLAYLIST_UPDATE_JOB}:{self.name}"
+
+    @property
+    def update_local_job(self) -> str:
+        return PLAYLIST_UPDATE_LOCAL_JOB if self.primary else f"{PLAYLIST_UPDATE_LOCAL_JOB}:{self.name}"
+
+    @staticmethod
+    def create_player(settings: Dict[str, Any], bind_window: bool = False) -> AimpController:
+        """The zone's player on its own, so AIMP can be started while the engine is still loading.
+
+        bind_window is set when there are several zones: each then drives only its own AIMP window.
+        """
+        return AimpController(
+            device=settings['device'],
+            command=settings['player_command'],
+            playlist_path=settings['playlist_path'],
+            played_songs_file=settings['played_songs_file'],
+            bind_window=bind_window
+        )
+
+    @classmethod
+    def create(cls, settings: Dict[str, Any], engine: Dict[str, Any], job_runner: JobRunner,
+               scheduler: DeadlineScheduler, primary: bool,
+               aimp_controller: Optional[AimpController] = None) -> "Zone":
+        """Build a zone from zone_settings() output; the command server is started right away."""
+        name = settings['name']
+        aimp_controller = aimp_controller or cls.create_player(settings)
+        supervisor = AimpSupervisor(aimp_controller, name=name)
+        player_state = PlayerStateCache(aimp_controller, ttl=PLAYER_STATE_TTL_SECONDS, supervisor=supervisor)
+        playlist_manager = PlaylistManager(
+            aimp_controller=aimp_controller,
+            played_songs_file=settings['played_songs_file'],
+            carry_over=CarryOver(settings['carry_over_file'], max_songs=CARRY_OVER_MAX_SONGS),
+            journal=UpdateJournal(settings['journal_file']),
+            vote_queue=VoteQueue(),
+            zone=name,
+            start_times=settings['start_times'],
+            stop_times=settings['stop_times'],
+            **engine
+        )
+        zone = cls(name, aimp_controller, playlist_manager, None, player_state, primary=primary,
+                   supervisor=supervisor)
+        zone.schedule_manager = ScheduleManager(
+            playlist_manager, aimp_controller,
+            scheduler=scheduler,
+            job_runner=job_runner,
+            zone=None if primary else name,
+            update_times=settings['update_times'],
+            start_times=settings['start_times'],
+            stop_times=settings['stop_times'],
+            update_job=zone.update_job,
+            shared_jobs=primary
+        )
+        zone.command_server = CommandServer(aimp_controller, port=settings['command_port'],
+                                            state_cache=player_state)
+        zone.command_server.set_job_runner(job_runner)
+        zone.command_server.start()
+        logger.info(f"Zone {name} set up on device {settings['device']}, admin port {settings['command_port']}")
+        return zone
+
+    def register_metrics(self) -> None:
+        if self.primary:
+            self.playlist_manager.register_metrics()
+        register_zone_gauges(self.name, lambda: self.aimp_controller.playlist,
+                             lambda: self.player_state.snapshot()['connected'])
+
+    def start(self) -> None:
+        """Start the zone's player (unless it was started during initialization), its supervisor and state polling."""
+        if not self.aimp_controller.client:
+            self.aimp_controller.start_aimp()
+        if self.supervisor:
+            self.supervisor.start()
+        self.player_state.start()